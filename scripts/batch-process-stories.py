@@ -4,19 +4,56 @@ Batch Process Stories - Convert community stories for MCP upload
 
 This script processes stories from "stories-tmp/New Stories/" by:
 1. Converting .docx → .md (pandoc)
-2. Converting PNG → WebP (cwebp, preserving original dimensions)
+2. Converting PNG → WebP (preserving original dimensions)
 3. Organizing output into processed/{story-slug}/
 4. Generating manifest.json per story
 
 Frontend handles aspect-ratio-preserving display, so no resizing needed!
+
+Images go through story_images.py by default: each PNG is decoded once and
+the WebP, dimensions, hashes, dHash and any --thumbnails come from that one
+decode (recorded in manifest.json "images"). --image-backend cwebp keeps
+the old external encoder. With the Pillow backend each image's WebP mode
+(lossless, palette or lossy) is chosen from its content unless
+--webp-mode lossy is given; the decision is in the image record's
+"encoding", and the run ends with a report of bytes per mode, how many
+images needed a second trial encode, and the savings against the
+fixed-quality lossy baseline where one was encoded.
+
+Several hosts sharing stories-tmp can split the work: --enqueue adds the
+story folders to the shared lease queue (story_queue.py), and --worker
+claims and processes them until the queue is drained. A worker builds each
+story in stories-tmp/.staging and it is moved into processed/ only if the
+worker still holds the lease, so every story is published exactly once.
+
+pandoc and cwebp run under a watchdog (--pandoc-timeout, --cwebp-timeout):
+a hung tool's whole process group is killed and only that story fails,
+with the tool, file and stderr tail in the error log. A cwebp failure or
+timeout falls back to the Pillow encoder. The run summary shows each
+tool's duration distribution and timeout count.
+
+Usage:
+    python3 batch-process-stories.py                 # single host
+    python3 batch-process-stories.py --enqueue       # once, from any host
+    python3 batch-process-stories.py --worker        # on every host
 """
 
+import os
 import sys
 import json
+import signal
+import time
+import hashlib
+import argparse
 import subprocess
 import re
 from pathlib import Path
 from datetime import datetime
+from collections import defaultdict
+
+from story_images import process_image, image_size
+from story_catalog import Catalog
+from story_queue import StoryQueue, QUEUE_FILE, LEASE_SECONDS, JOB_DEADLINE_SECONDS, run_worker, worker_name
 
 # Directories
 SOURCE_DIR = Path("stories-tmp/New Stories")
@@ -24,30 +61,42 @@ OUTPUT_DIR = Path("stories-tmp/processed")
 LOGS_DIR = Path("stories-tmp/logs")
 PROGRESS_FILE = Path("stories-tmp/.progress.json")
 
-# Create directories
-OUTPUT_DIR.mkdir(parents=True, exist_ok=True)
-LOGS_DIR.mkdir(parents=True, exist_ok=True)
-
-# Initialize log files
-timestamp = datetime.now().strftime("%Y%m%d-%H%M%S")
-LOG_FILE = LOGS_DIR / f"processing-{timestamp}.log"
-ERROR_LOG = LOGS_DIR / f"errors-{timestamp}.log"
+# Per-tool watchdog timeouts in seconds (--pandoc-timeout / --cwebp-timeout)
+TIMEOUTS = {"pandoc": 120, "cwebp": 60}
+TOOL_SECONDS = defaultdict(list)    # tool -> durations of finished runs
+TOOL_TIMEOUTS = defaultdict(int)    # tool -> runs killed by the watchdog
+
+# Log files, set by open_logs() when a run starts; until then (e.g. when
+# imported by another tool) log() and error() only print
+LOG_FILE = None
+ERROR_LOG = None
+
+def open_logs():
+    """Create the output/log directories and this run's log files"""
+    global LOG_FILE, ERROR_LOG
+    OUTPUT_DIR.mkdir(parents=True, exist_ok=True)
+    LOGS_DIR.mkdir(parents=True, exist_ok=True)
+    timestamp = datetime.now().strftime("%Y%m%d-%H%M%S")
+    LOG_FILE = LOGS_DIR / f"processing-{timestamp}.log"
+    ERROR_LOG = LOGS_DIR / f"errors-{timestamp}.log"
 
 def log(message):
     """Log message to console and log file"""
     timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
     log_message = f"[{timestamp}] {message}"
     print(log_message)
-    with open(LOG_FILE, 'a') as f:
-        f.write(log_message + '\n')
+    if LOG_FILE:
+        with open(LOG_FILE, 'a') as f:
+            f.write(log_message + '\n')
 
 def error(message):
     """Log error message"""
     timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
     error_message = f"[{timestamp}] ERROR: {message}"
     print(error_message, file=sys.stderr)
-    with open(ERROR_LOG, 'a') as f:
-        f.write(error_message + '\n')
+    if ERROR_LOG:
+        with open(ERROR_LOG, 'a') as f:
+            f.write(error_message + '\n')
 
 def slugify(text):
     """Convert text to slug (lowercase, hyphens)"""
@@ -76,10 +125,14 @@ def save_progress(progress):
 
 def is_processed(slug, progress):
     """Check if story already processed"""
+    if progress is None:
+        return False
     return slug in progress.get("success", []) or slug in progress.get("processed", [])
 
 def mark_processed(slug, status, progress):
     """Mark story as processed (success or failed)"""
+    if progress is None:
+        return      # Queue workers track state in the queue, not the progress file
     if status == "success":
         if "success" not in progress:
             progress["success"] = []
@@ -92,11 +145,70 @@ def mark_processed(slug, status, progress):
             progress["failed"].append(slug)
     save_progress(progress)
 
-def process_story(story_dir, progress):
+class ToolTimeout(subprocess.SubprocessError):
+    """An external tool was killed by the watchdog"""
+
+    def __init__(self, cmd, timeout, stderr, path):
+        self.cmd, self.timeout, self.stderr, self.path = cmd, timeout, stderr, path
+        tail = (stderr or "").strip()[-500:]
+        super().__init__(f"{cmd[0]} timed out after {timeout}s on {path}" + (f"; stderr: {tail}" if tail else ""))
+
+def run_tool(cmd, path):
+    """
+    Run an external tool on input file `path` under its TIMEOUTS watchdog.
+    The tool gets its own process group so helpers it spawns are killed
+    with it. A missing tool raises OSError (FileNotFoundError).
+    """
+    tool = cmd[0]
+    timeout = TIMEOUTS.get(tool)
+    started = time.perf_counter()
+    proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True, start_new_session=True)
+    try:
+        stdout, stderr = proc.communicate(timeout=timeout)
+    except subprocess.TimeoutExpired:
+        os.killpg(proc.pid, signal.SIGKILL)
+        stdout, stderr = proc.communicate()
+        TOOL_TIMEOUTS[tool] += 1
+        raise ToolTimeout(cmd, timeout, stderr, path)
+    TOOL_SECONDS[tool].append(time.perf_counter() - started)
+    if proc.returncode != 0:
+        raise subprocess.CalledProcessError(proc.returncode, cmd, stdout, stderr)
+    return subprocess.CompletedProcess(cmd, proc.returncode, stdout, stderr)
+
+def convert_image(src, dest, backend="pillow", thumbnails=(), webp_mode="auto"):
+    """Convert one PNG to WebP; returns its manifest record"""
+    started = time.perf_counter()
+    if backend == "pillow":
+        record = process_image(src, dest, thumbnails, mode=webp_mode)
+        record["encode_ms"] = round((time.perf_counter() - started) * 1000, 1)
+        return record
+
+    try:
+        run_tool(["cwebp", "-q", "85", "-quiet", str(src), "-o", str(dest)], src)
+    except (subprocess.SubprocessError, OSError) as e:
+        error(f"cwebp failed on {src}, retrying with pillow: {getattr(e, 'stderr', None) or e}")
+        record = convert_image(src, dest, "pillow", thumbnails, webp_mode)
+        record["fallback"] = "pillow"
+        return record
+    width, height = image_size(dest) or (None, None)
+    webp = dest.read_bytes()
+    return {
+        "source": src.name,
+        "source_sha256": hashlib.sha256(src.read_bytes()).hexdigest(),
+        "width": width,
+        "height": height,
+        "webp_sha256": hashlib.sha256(webp).hexdigest(),
+        "webp_bytes": len(webp),
+        "encoding": {"mode": "lossy"},
+        "encode_ms": round((time.perf_counter() - started) * 1000, 1),
+    }
+
+def process_story(story_dir, progress, backend="pillow", thumbnails=(), catalog=None, output_dir=OUTPUT_DIR,
+                  webp_mode="auto"):
     """Process a single story"""
     story_name = story_dir.name
     story_slug = slugify(story_name)
-    output_story_dir = OUTPUT_DIR / story_slug
+    output_story_dir = output_dir / story_slug
 
     log(f"Processing: {story_name} → {story_slug}")
 
@@ -120,16 +232,17 @@ def process_story(story_dir, progress):
     # Convert .docx → .md
     log("  Converting .docx → .md")
     try:
-        result = subprocess.run(
-            ["pandoc", str(docx_file), "-f", "docx", "-t", "markdown", "-o", str(output_story_dir / "story.md")],
-            capture_output=True,
-            text=True,
-            check=True
-        )
+        run_tool(["pandoc", str(docx_file), "-f", "docx", "-t", "markdown", "-o", str(output_story_dir / "story.md")],
+                 docx_file)
     except subprocess.CalledProcessError as e:
         error(f"Failed to convert {docx_file}: {e.stderr}")
         mark_processed(story_slug, "failed", progress)
         return False
+    except (ToolTimeout, OSError) as e:
+        # OSError: pandoc missing or not executable - fail this story, not the run
+        error(f"Failed to convert {docx_file}: {e}")
+        mark_processed(story_slug, "failed", progress)
+        return False
 
     # Find cover image
     cover_files = list(story_dir.glob("[Cc]over*.png"))
@@ -142,17 +255,17 @@ def process_story(story_dir, progress):
 
     # Convert cover to WebP
     log("  Converting cover image")
+    images = {}
     try:
-        result = subprocess.run(
-            ["cwebp", "-q", "85", "-quiet", str(cover_file), "-o", str(output_story_dir / "cover.webp")],
-            capture_output=True,
-            text=True,
-            check=True
-        )
+        images["cover.webp"] = convert_image(cover_file, output_story_dir / "cover.webp", backend, thumbnails, webp_mode)
     except subprocess.CalledProcessError as e:
         error(f"Failed to convert cover {cover_file}: {e.stderr}")
         mark_processed(story_slug, "failed", progress)
         return False
+    except (OSError, RuntimeError) as e:
+        error(f"Failed to convert cover {cover_file}: {e}")
+        mark_processed(story_slug, "failed", progress)
+        return False
 
     # Find and convert page images (sorted by filename)
     page_files = sorted(story_dir.glob("[Pp]age*.png"))
@@ -163,17 +276,17 @@ def process_story(story_dir, progress):
 
     for page_num, page_file in enumerate(page_files, start=1):
         log(f"  Converting page {page_num}")
+        page_name = f"page-{page_num}.webp"
         try:
-            result = subprocess.run(
-                ["cwebp", "-q", "85", "-quiet", str(page_file), "-o", str(output_story_dir / f"page-{page_num}.webp")],
-                capture_output=True,
-                text=True,
-                check=True
-            )
+            images[page_name] = convert_image(page_file, output_story_dir / page_name, backend, thumbnails, webp_mode)
         except subprocess.CalledProcessError as e:
             error(f"Failed to convert page {page_file}: {e.stderr}")
             mark_processed(story_slug, "failed", progress)
             return False
+        except (OSError, RuntimeError) as e:
+            error(f"Failed to convert page {page_file}: {e}")
+            mark_processed(story_slug, "failed", progress)
+            return False
 
     # Generate manifest.json
     log("  Generating manifest")
@@ -183,18 +296,139 @@ def process_story(story_dir, progress):
         "docx": docx_file.name,
         "cover": "cover.webp",
         "pages": len(page_files),
+        "images": images,
         "processed_at": datetime.now().isoformat()
     }
 
     with open(output_story_dir / "manifest.json", 'w') as f:
         json.dump(manifest, f, indent=2)
 
+    if catalog:
+        catalog.upsert_story(story_slug, name=story_name, docx=docx_file.name, status="processed",
+                             error=None, processed_at=manifest["processed_at"])
+        catalog.record_assets(story_slug, images)
+
     mark_processed(story_slug, "success", progress)
     log(f"  ✓ Complete: {story_slug}")
     return True
 
+def tool_summary():
+    """Log duration percentiles and watchdog kills per external tool"""
+    for tool in sorted(set(TOOL_SECONDS) | set(TOOL_TIMEOUTS)):
+        seconds = sorted(TOOL_SECONDS[tool])
+        if seconds:
+            pick = lambda q: seconds[min(len(seconds) - 1, int(q * len(seconds)))]
+            log(f"{tool}: {len(seconds)} runs, p50 {pick(0.5):.2f}s, p95 {pick(0.95):.2f}s, "
+                f"max {seconds[-1]:.2f}s, timeouts {TOOL_TIMEOUTS[tool]} (limit {TIMEOUTS.get(tool)}s)")
+        else:
+            log(f"{tool}: 0 completed runs, timeouts {TOOL_TIMEOUTS[tool]} (limit {TIMEOUTS.get(tool)}s)")
+
+def encoding_report(output_dir=OUTPUT_DIR):
+    """Log WebP bytes per encoding mode, trial-encode counts and savings vs the lossy baseline"""
+    modes = defaultdict(lambda: [0, 0])         # mode -> [images, bytes]
+    decisions = defaultdict(int)                # analysis | compared -> images
+    known = [0, 0]                              # [bytes, baseline bytes] where a lossy encode was made
+    for manifest_path in output_dir.glob("*/manifest.json"):
+        with open(manifest_path, 'r') as f:
+            images = json.load(f).get("images", {})
+        for record in images.values():
+            encoding = record.get("encoding", {"mode": "lossy"})
+            totals = modes[encoding["mode"]]
+            totals[0] += 1
+            totals[1] += record["webp_bytes"]
+            decisions[encoding.get("decision", "fixed")] += 1
+            if "baseline_bytes" in encoding:
+                known[0] += record["webp_bytes"]
+                known[1] += encoding["baseline_bytes"]
+    if not modes:
+        return
+    for mode, (count, size) in sorted(modes.items()):
+        log(f"WebP {mode}: {count} images, {size:,} bytes")
+    log("WebP decisions: " + ", ".join(f"{n} {d}" for d, n in sorted(decisions.items()))
+        + f" ({decisions['compared']} images encoded twice)")
+    if known[1]:
+        log(f"WebP vs lossy baseline (images with one): {known[0]:,} bytes vs {known[1]:,}, "
+            f"saved {known[1] - known[0]:,} ({(known[1] - known[0]) / known[1]:.1%})")
+
+def record_in_catalog(catalog, slug):
+    """Catalog a story published by a queue worker, from its manifest"""
+    with open(OUTPUT_DIR / slug / "manifest.json", 'r') as f:
+        manifest = json.load(f)
+    catalog.upsert_story(slug, name=manifest["name"], docx=manifest["docx"], status="processed",
+                         error=None, processed_at=manifest["processed_at"])
+    catalog.record_assets(slug, manifest["images"])
+
+def record_failure_in_catalog(catalog, slug, story_dir, error_detail):
+    """Catalog a story whose queue attempt failed or was abandoned"""
+    catalog.upsert_story(slug, name=story_dir.name, status="failed", error=f"{error_detail}; see {ERROR_LOG}")
+
+def run_queue(args, thumbnails):
+    """--enqueue / --worker: share the work with other hosts through the lease queue"""
+    queue = StoryQueue(args.queue, args.lease_seconds)
+
+    if args.enqueue:
+        story_dirs = sorted([d for d in SOURCE_DIR.iterdir() if d.is_dir()])
+        added = queue.enqueue([(slugify(d.name), d) for d in story_dirs])
+        log(f"Queued {added} new of {len(story_dirs)} story folders in {args.queue}")
+        log(f"Queue: {queue.counts()}")
+        if not args.worker:
+            return 0
+
+    log(f"=== Worker {worker_name()} ===")
+    catalog = Catalog()
+
+    def handler(slug, story_dir, staging_parent):
+        return process_story(story_dir, None, args.image_backend, thumbnails, output_dir=staging_parent,
+                             webp_mode=args.webp_mode)
+
+    stats = run_worker(queue, handler, OUTPUT_DIR, exit_when_drained=not args.follow,
+                       on_published=lambda slug: record_in_catalog(catalog, slug),
+                       on_failed=lambda slug, story_dir, e: record_failure_in_catalog(catalog, slug, story_dir, e),
+                       job_deadline=args.job_deadline)
+
+    log("=== Worker Complete ===")
+    log(f"Published: {stats['done']}, failed: {stats['failed']}, lease lost: {stats['lost']}, "
+        f"abandoned: {stats['abandoned']}")
+    tool_summary()
+    log(f"Queue: {queue.counts()}")
+    return 1 if stats["failed"] or stats["abandoned"] else 0
+
 def main():
     """Main processing loop"""
+    parser = argparse.ArgumentParser(description="Convert community stories for upload")
+    parser.add_argument("--image-backend", choices=["pillow", "cwebp"], default="pillow",
+                        help="Single-decode Pillow pass, or external cwebp (default: pillow)")
+    parser.add_argument("--thumbnails", default="",
+                        help="Comma-separated thumbnail widths, e.g. 640,320 (pillow backend)")
+    parser.add_argument("--webp-mode", choices=["auto", "lossy"], default="auto",
+                        help="Content-aware lossless/palette/lossy choice, or always lossy (default: auto)")
+    parser.add_argument("--enqueue", action="store_true",
+                        help="Add source story folders to the shared queue")
+    parser.add_argument("--worker", action="store_true",
+                        help="Claim and process stories from the shared queue")
+    parser.add_argument("--follow", action="store_true",
+                        help="Keep the worker polling after the queue drains")
+    parser.add_argument("--queue", type=Path, default=QUEUE_FILE,
+                        help=f"Queue database (default: {QUEUE_FILE})")
+    parser.add_argument("--lease-seconds", type=float, default=LEASE_SECONDS,
+                        help=f"Lease length; heartbeats renew it every third (default: {LEASE_SECONDS})")
+    parser.add_argument("--job-deadline", type=float, default=JOB_DEADLINE_SECONDS,
+                        help=f"Seconds before a worker abandons a story (default: {JOB_DEADLINE_SECONDS})")
+    parser.add_argument("--pandoc-timeout", type=float, default=TIMEOUTS["pandoc"],
+                        help=f"Seconds before a pandoc run is killed (default: {TIMEOUTS['pandoc']})")
+    parser.add_argument("--cwebp-timeout", type=float, default=TIMEOUTS["cwebp"],
+                        help=f"Seconds before a cwebp run is killed (default: {TIMEOUTS['cwebp']})")
+    args = parser.parse_args()
+    thumbnails = tuple(int(w) for w in args.thumbnails.split(",") if w.strip())
+    TIMEOUTS.update(pandoc=args.pandoc_timeout, cwebp=args.cwebp_timeout)
+    open_logs()
+
+    if args.enqueue or args.worker:
+        if args.enqueue and not SOURCE_DIR.exists():
+            error(f"Source directory not found: {SOURCE_DIR}")
+            return 1
+        return run_queue(args, thumbnails)
+
     log("=== Starting Batch Story Processing ===")
     log(f"Source: {SOURCE_DIR}")
     log(f"Output: {OUTPUT_DIR}")
@@ -218,12 +452,15 @@ def main():
     # Process each story
     processed = 0
     failed = 0
+    catalog = Catalog()
 
     for story_dir in story_dirs:
-        if process_story(story_dir, progress):
+        if process_story(story_dir, progress, args.image_backend, thumbnails, catalog, webp_mode=args.webp_mode):
             processed += 1
         else:
             failed += 1
+            catalog.upsert_story(slugify(story_dir.name), name=story_dir.name, status="failed",
+                                 error=f"See {ERROR_LOG}")
 
         # Show progress
         remaining = total_stories - processed - failed
@@ -234,6 +471,8 @@ def main():
     log(f"Total stories: {total_stories}")
     log(f"Processed successfully: {processed}")
     log(f"Failed: {failed}")
+    tool_summary()
+    encoding_report()
     log(f"Output directory: {OUTPUT_DIR}")
     log(f"Logs: {LOGS_DIR}")
 
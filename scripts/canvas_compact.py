@@ -0,0 +1,379 @@
+#!/usr/bin/env python3
+"""
+Canvas State Compaction for community story payloads
+
+cover_canvas_state and the canvas data inside each page are verbose Konva
+JSON. This stage shrinks a story's canvas payload in three steps:
+
+1. Canonicalize - parse JSON-encoded canvas strings, sort keys, write
+   integral floats as ints
+2. Strip defaults - drop Konva attrs that equal the Konva default for the
+   node's className
+3. Deduplicate - node style attrs (font, fill, stroke, shadow...) are split
+   into a "$style" object, then any object repeated across the cover and
+   pages is stored once in "defs" and replaced by {"$ref": n}
+
+expand_story() reverses the transform. Stripped defaults are not restored
+(Konva applies them itself), so the round-trip check compares the expanded
+form with the raw original and only accepts an attr missing on the expanded
+side when the original had it at its Konva default.
+
+Objects in the original that use a marker key ($ref, $json, $lit,
+$style) are escaped as {"$lit": {...}} and kept as they are.
+
+Reads a snapshot written by `migrate_stories.py --export-snapshot`.
+
+Usage:
+    python3 canvas_compact.py snapshot.jsonl.gz              # size report
+    python3 canvas_compact.py snapshot.jsonl.gz --verify     # round-trip check
+    python3 canvas_compact.py snapshot.jsonl.gz --output compact.jsonl.gz
+"""
+
+import sys
+import gzip
+import json
+import argparse
+
+COMPACT_VERSION = 1
+
+# Only objects at least this large (canonical JSON bytes) are worth a $ref
+MIN_DEDUP_BYTES = 48
+
+# Konva attr defaults, shared by every node, then per className
+NODE_DEFAULTS = {
+    "x": 0, "y": 0, "rotation": 0, "opacity": 1, "visible": True,
+    "scaleX": 1, "scaleY": 1, "skewX": 0, "skewY": 0,
+    "offsetX": 0, "offsetY": 0, "draggable": False, "listening": True,
+}
+SHAPE_DEFAULTS = {
+    "strokeWidth": 1, "strokeEnabled": True, "strokeScaleEnabled": True,
+    "fillEnabled": True, "shadowEnabled": True, "shadowBlur": 0,
+    "shadowOpacity": 1, "shadowOffsetX": 0, "shadowOffsetY": 0,
+    "dashEnabled": True, "perfectDrawEnabled": True, "hitStrokeWidth": "auto",
+    "cornerRadius": 0,
+}
+CLASS_DEFAULTS = {
+    "Text": {
+        "fontFamily": "Arial", "fontSize": 12, "fontStyle": "normal",
+        "fontVariant": "normal", "textDecoration": "", "align": "left",
+        "verticalAlign": "top", "padding": 0, "lineHeight": 1,
+        "wrap": "word", "ellipsis": False, "letterSpacing": 0, "direction": "inherit",
+    },
+    "Image": {},
+    "Rect": {},
+    "Circle": {},
+    "Line": {"closed": False, "tension": 0, "bezier": False},
+}
+
+# Text/shape style attrs, split into their own object so identical styles
+# across nodes and pages deduplicate even when text or position differ
+STYLE_PREFIXES = ("font", "fill", "stroke", "shadow", "text", "dash")
+STYLE_ATTRS = {"align", "verticalAlign", "lineHeight", "letterSpacing", "padding",
+               "wrap", "ellipsis", "direction", "cornerRadius", "lineCap", "lineJoin"}
+
+# Marker keys used by the compact form; originals using them are escaped
+REF_KEY = "$ref"
+JSON_KEY = "$json"
+LITERAL_KEY = "$lit"
+STYLE_KEY = "$style"
+MARKER_KEYS = {REF_KEY, JSON_KEY, LITERAL_KEY, STYLE_KEY}
+
+def konva_defaults(class_name):
+    """Defaults Konva applies to attrs of a node with this className"""
+    defaults = dict(NODE_DEFAULTS)
+    if class_name in CLASS_DEFAULTS:
+        defaults.update(SHAPE_DEFAULTS)
+        defaults.update(CLASS_DEFAULTS[class_name])
+    return defaults
+
+def is_konva_node(value):
+    return isinstance(value, dict) and "className" in value and isinstance(value.get("attrs"), dict)
+
+def is_literal(value):
+    return isinstance(value, dict) and set(value) == {LITERAL_KEY}
+
+def canonicalize(value):
+    """Sort keys, unwrap JSON-encoded canvas strings and write integral floats as ints"""
+    if isinstance(value, dict):
+        if MARKER_KEYS & set(value):
+            return {LITERAL_KEY: {k: canonicalize(v) for k, v in sorted(value.items())}}
+        return {k: canonicalize(v) for k, v in sorted(value.items())}
+    if isinstance(value, list):
+        return [canonicalize(v) for v in value]
+    if isinstance(value, float) and value.is_integer():
+        return int(value)
+    if isinstance(value, str) and value[:1] == "{" and '"className"' in value:
+        try:
+            return {JSON_KEY: canonicalize(json.loads(value))}
+        except json.JSONDecodeError:
+            return value
+    return value
+
+def strip_defaults(value):
+    """Drop Konva attrs equal to their default"""
+    if isinstance(value, list):
+        return [strip_defaults(v) for v in value]
+    if not isinstance(value, dict):
+        return value
+    if is_literal(value):
+        return {LITERAL_KEY: {k: strip_defaults(v) for k, v in value[LITERAL_KEY].items()}}
+    result = {k: strip_defaults(v) for k, v in value.items()}
+    if is_konva_node(result):
+        defaults = konva_defaults(result["className"])
+        result["attrs"] = {k: v for k, v in result["attrs"].items()
+                           if k not in defaults or defaults[k] != v}
+    return result
+
+def is_style_attr(name):
+    return name in STYLE_ATTRS or name.startswith(STYLE_PREFIXES)
+
+def split_styles(value):
+    """Move style attrs of Konva nodes into a separate "$style" object"""
+    if isinstance(value, list):
+        return [split_styles(v) for v in value]
+    if not isinstance(value, dict):
+        return value
+    if is_literal(value):
+        return {LITERAL_KEY: {k: split_styles(v) for k, v in value[LITERAL_KEY].items()}}
+    result = {k: split_styles(v) for k, v in value.items()}
+    if is_konva_node(result):
+        attrs = result["attrs"]
+        style = {k: v for k, v in attrs.items() if is_style_attr(k) and k != "text"}
+        if style:
+            result["attrs"] = {k: v for k, v in attrs.items() if k not in style}
+            result[STYLE_KEY] = style
+    return result
+
+def merge_styles(value):
+    """Inverse of split_styles()"""
+    if isinstance(value, list):
+        return [merge_styles(v) for v in value]
+    if not isinstance(value, dict):
+        return value
+    if is_literal(value):
+        return {LITERAL_KEY: {k: merge_styles(v) for k, v in value[LITERAL_KEY].items()}}
+    result = {k: merge_styles(v) for k, v in value.items()}
+    if STYLE_KEY in result and is_konva_node(result):
+        style = result.pop(STYLE_KEY)
+        result["attrs"] = {**result["attrs"], **style}
+    return result
+
+def _encode(value):
+    return json.dumps(value, sort_keys=True, separators=(",", ":"), ensure_ascii=False)
+
+def _count_objects(value, counts):
+    """Count canonical encodings of every dict subtree"""
+    if isinstance(value, list):
+        for v in value:
+            _count_objects(v, counts)
+    elif isinstance(value, dict):
+        for v in value.values():
+            _count_objects(v, counts)
+        key = _encode(value)
+        if len(key) >= MIN_DEDUP_BYTES:
+            counts[key] = counts.get(key, 0) + 1
+
+def deduplicate(roots):
+    """
+    Replace dict subtrees that occur more than once across `roots` with
+    {"$ref": n}. Returns (defs, new_roots).
+    """
+    counts = {}
+    for root in roots:
+        _count_objects(root, counts)
+    repeated = {key for key, count in counts.items() if count > 1}
+
+    defs = []
+    index = {}
+
+    def replace(value, inside=None):
+        if isinstance(value, list):
+            return [replace(v) for v in value]
+        if not isinstance(value, dict):
+            return value
+        key = _encode(value) if repeated else None
+        if key in repeated and key != inside:
+            if key not in index:
+                index[key] = len(defs)
+                defs.append(None)
+                defs[index[key]] = replace(value, inside=key)
+            return {REF_KEY: index[key]}
+        if is_literal(value):
+            return {LITERAL_KEY: {k: replace(v) for k, v in value[LITERAL_KEY].items()}}
+        return {k: replace(v) for k, v in value.items()}
+
+    return defs, [replace(root) for root in roots]
+
+def resolve_refs(value, defs):
+    """Inline {"$ref": n} objects from defs"""
+    if isinstance(value, list):
+        return [resolve_refs(v, defs) for v in value]
+    if not isinstance(value, dict):
+        return value
+    if set(value) == {REF_KEY}:
+        return resolve_refs(defs[value[REF_KEY]], defs)
+    if is_literal(value):
+        return {LITERAL_KEY: {k: resolve_refs(v, defs) for k, v in value[LITERAL_KEY].items()}}
+    return {k: resolve_refs(v, defs) for k, v in value.items()}
+
+def decode(value):
+    """Undo canonicalize() escapes: re-encode $json strings, unwrap $lit"""
+    if isinstance(value, list):
+        return [decode(v) for v in value]
+    if not isinstance(value, dict):
+        return value
+    if set(value) == {JSON_KEY}:
+        return json.dumps(decode(value[JSON_KEY]), separators=(",", ":"), ensure_ascii=False)
+    if is_literal(value):
+        return {k: decode(v) for k, v in value[LITERAL_KEY].items()}
+    return {k: decode(v) for k, v in value.items()}
+
+def compact_story(cover_canvas_state, pages):
+    """Compact a story's cover canvas and pages into one payload"""
+    cover = strip_defaults(canonicalize(cover_canvas_state))
+    pages = strip_defaults(canonicalize(pages or []))
+    cover, pages = split_styles(cover), split_styles(pages)
+    defs, (cover, pages) = deduplicate([cover, pages])
+    return {"v": COMPACT_VERSION, "defs": defs, "cover_canvas_state": cover, "pages": pages}
+
+def expand_story(payload):
+    """Inverse of compact_story(); returns (cover_canvas_state, pages)"""
+    if payload.get("v") != COMPACT_VERSION:
+        raise ValueError(f"Unsupported compact canvas version: {payload.get('v')}")
+    defs = payload["defs"]
+    cover = decode(merge_styles(resolve_refs(payload["cover_canvas_state"], defs)))
+    pages = decode(merge_styles(resolve_refs(payload["pages"], defs)))
+    return cover, pages
+
+def _embedded_json(value):
+    """Parsed canvas JSON if `value` is a JSON-encoded Konva string, else None"""
+    if isinstance(value, str) and value[:1] == "{" and '"className"' in value:
+        try:
+            return json.loads(value)
+        except json.JSONDecodeError:
+            return None
+    return None
+
+def round_trip_mismatch(original, expanded, path="$"):
+    """
+    Path of the first difference between a raw original and its expanded
+    compact form, or None when they render the same. Only attrs the
+    original had at their Konva default may be missing from `expanded`.
+    """
+    if isinstance(original, str) and isinstance(expanded, str) and original != expanded:
+        parsed = _embedded_json(original), _embedded_json(expanded)
+        if None in parsed:
+            return path
+        return round_trip_mismatch(*parsed, path)
+    if isinstance(original, dict) and isinstance(expanded, dict):
+        if set(original) != set(expanded):
+            return path
+        defaults = konva_defaults(original["className"]) if is_konva_node(original) else None
+        for key, value in original.items():
+            if key == "attrs" and defaults is not None and isinstance(expanded["attrs"], dict):
+                attrs = expanded["attrs"]
+                extra = sorted(set(attrs) - set(value))
+                if extra:
+                    return f"{path}.attrs.{extra[0]}"
+                for name, attr in value.items():
+                    if name not in attrs:
+                        if name not in defaults or not _same_scalar(defaults[name], attr):
+                            return f"{path}.attrs.{name}"
+                        continue
+                    mismatch = round_trip_mismatch(attr, attrs[name], f"{path}.attrs.{name}")
+                    if mismatch:
+                        return mismatch
+                continue
+            mismatch = round_trip_mismatch(value, expanded[key], f"{path}.{key}")
+            if mismatch:
+                return mismatch
+        return None
+    if isinstance(original, list) and isinstance(expanded, list):
+        if len(original) != len(expanded):
+            return path
+        for i, (a, b) in enumerate(zip(original, expanded)):
+            mismatch = round_trip_mismatch(a, b, f"{path}[{i}]")
+            if mismatch:
+                return mismatch
+        return None
+    return None if _same_scalar(original, expanded) else path
+
+def _same_scalar(a, b):
+    """JSON-equal: 2.0 == 2, but True != 1"""
+    if isinstance(a, bool) or isinstance(b, bool):
+        return a is b
+    return a == b
+
+def payload_size(value):
+    return len(json.dumps(value, separators=(",", ":"), ensure_ascii=False).encode("utf-8"))
+
+def read_snapshot_rows(path):
+    """Stream rows from a migrate_stories.py snapshot (header line skipped)"""
+    with gzip.open(path, "rt", encoding="utf-8") as f:
+        header = json.loads(f.readline())
+        if header.get("table") != "community_stories":
+            raise ValueError(f"{path} is not a community stories snapshot")
+        for line in f:
+            yield json.loads(line)["row"]
+
+def main():
+    parser = argparse.ArgumentParser(description="Compact canvas state in community story payloads")
+    parser.add_argument("snapshot", help="Snapshot from migrate_stories.py --export-snapshot")
+    parser.add_argument("--verify", action="store_true",
+                        help="Check that every story round-trips to an identical rendered form")
+    parser.add_argument("--output", help="Write compacted payloads as gzip JSONL")
+    args = parser.parse_args()
+
+    print("=== Canvas State Compaction ===")
+    print(f"Source: {args.snapshot}\n")
+
+    out = gzip.open(args.output, "wt", encoding="utf-8") if args.output else None
+    total_before = 0
+    total_after = 0
+    stories = 0
+    mismatches = 0
+
+    try:
+        for row in read_snapshot_rows(args.snapshot):
+            cover, pages = row.get("cover_canvas_state"), row.get("pages")
+            before = payload_size({"cover_canvas_state": cover, "pages": pages})
+            payload = compact_story(cover, pages)
+            after = payload_size(payload)
+
+            total_before += before
+            total_after += after
+            stories += 1
+            saved = 100 * (1 - after / before) if before else 0
+            status = ""
+
+            if args.verify:
+                mismatch = round_trip_mismatch([cover, pages or []], list(expand_story(payload)))
+                if mismatch is None:
+                    status = "  ✓ round-trip"
+                else:
+                    status = f"  ✗ round-trip MISMATCH at {mismatch}"
+                    mismatches += 1
+
+            print(f"{row['title'][:48]:<48} {before:>10,} → {after:>10,} bytes ({saved:5.1f}%){status}")
+
+            if out:
+                out.write(json.dumps({"id": row["id"], "canvas": payload},
+                                     ensure_ascii=False, separators=(",", ":")) + "\n")
+    finally:
+        if out:
+            out.close()
+
+    saved = 100 * (1 - total_after / total_before) if total_before else 0
+    print(f"\n=== Summary ===")
+    print(f"Stories: {stories}")
+    print(f"Before: {total_before:,} bytes")
+    print(f"After: {total_after:,} bytes ({saved:.1f}% smaller)")
+    if args.verify:
+        print(f"Round-trip mismatches: {mismatches}")
+    if args.output:
+        print(f"Output: {args.output}")
+
+    return 1 if mismatches else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
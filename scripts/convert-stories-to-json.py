@@ -11,8 +11,11 @@ Output: story.json in each story directory
 import sys
 import json
 import re
+import hashlib
 from pathlib import Path
 
+from story_catalog import Catalog
+
 # Directories
 PROCESSED_DIR = Path("stories-tmp/processed")
 
@@ -116,7 +119,7 @@ def parse_story_md(md_content, fallback_slug=None):
         "tags": tags
     }
 
-def convert_story(story_dir):
+def convert_story(story_dir, catalog=None):
     """Convert a single story from .md to .json"""
     story_slug = story_dir.name
     md_file = story_dir / "story.md"
@@ -138,8 +141,12 @@ def convert_story(story_dir):
         story_data['title_source'] = 'markdown' if '***Title:' in md_content or md_content.startswith('Title:') else 'folder_name'
 
         # Write JSON
+        data = json.dumps(story_data, indent=2, ensure_ascii=False)
         with open(json_file, 'w', encoding='utf-8') as f:
-            json.dump(story_data, f, indent=2, ensure_ascii=False)
+            f.write(data)
+
+        if catalog:
+            catalog.record_story_json(story_slug, story_data, hashlib.sha256(data.encode('utf-8')).hexdigest())
 
         print(f"✓ {story_slug}: {len(story_data['pages'])} pages, {len(story_data['tags'])} tags")
         return True
@@ -167,8 +174,9 @@ def main():
     success = 0
     failed = 0
 
+    catalog = Catalog()
     for story_dir in story_dirs:
-        if convert_story(story_dir):
+        if convert_story(story_dir, catalog):
             success += 1
         else:
             failed += 1
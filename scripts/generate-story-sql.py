@@ -0,0 +1,283 @@
+#!/usr/bin/env python3
+"""
+Generate Story SQL - Bulk-load community stories from the processed corpus
+
+Reads story.json (convert-stories-to-json.py) and manifest.json
+(batch-process-stories.py) from stories-tmp/processed/ and writes a single
+SQL file that loads the whole corpus into community_stories in one
+transaction:
+
+- copy:   COPY into a temp staging table, then one INSERT ... SELECT
+          ... ON CONFLICT (id) DO UPDATE into community_stories
+- insert: chunked multi-row INSERT ... ON CONFLICT (id) DO UPDATE
+
+Story ids are derived from the slug (UUIDv5), so re-running the file
+updates rows in place instead of duplicating them.
+
+Usage:
+    python3 generate-story-sql.py                       # COPY format
+    python3 generate-story-sql.py --format insert --chunk-size 50
+    python3 generate-story-sql.py --image-base-url https://img.icraftstories.com/community
+    psql "$DATABASE_URL" -f stories-tmp/community_stories.sql
+"""
+
+import sys
+import json
+import uuid
+import argparse
+from pathlib import Path
+from datetime import datetime, timezone
+
+# Directories
+PROCESSED_DIR = Path("stories-tmp/processed")
+OUTPUT_FILE = Path("stories-tmp/community_stories.sql")
+
+# Owner of imported stories (same account migrate_stories.py links to)
+TARGET_USER_ID = "user_34w00wW4m51e2xSOoJH6pzfGvs9"
+
+# Namespace for deterministic story/page ids
+STORY_NAMESPACE = uuid.UUID("6f1c2b8e-3d47-4c55-9a0e-1f7b1c9d2e40")
+
+# community_stories columns and their Postgres types, in load order
+COLUMNS = [
+    ("id", "uuid"),
+    ("title", "text"),
+    ("original_story_id", "uuid"),
+    ("original_user_id", "text"),
+    ("likes_count", "integer"),
+    ("views_count", "integer"),
+    ("shared_at", "timestamptz"),
+    ("is_featured", "boolean"),
+    ("is_approved", "boolean"),
+    ("cover_coaching_content", "jsonb"),
+    ("cover_canvas_editor_id", "uuid"),
+    ("cover_canvas_state", "jsonb"),
+    ("pages", "jsonb[]"),
+    ("ai_generator_history", "jsonb[]"),
+    ("tags", "text[]"),
+]
+
+# Canvas size used when the manifest has no dimensions for an image
+DEFAULT_CANVAS_SIZE = (1024, 768)
+
+# Columns refreshed when a story already exists; counters and flags are
+# owned by the live app and left alone
+UPDATE_COLUMNS = ["title", "cover_coaching_content", "pages", "tags"]
+
+def load_json(path):
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+def image_url(base_url, slug, filename):
+    """Public URL for a processed image, or the bare filename without a base"""
+    if not base_url:
+        return filename
+    return f"{base_url.rstrip('/')}/{slug}/{filename}"
+
+def canvas_state(url, record):
+    """
+    Konva stage JSON (Stage.toJSON() shape) holding one full-size image.
+
+    Same node structure canvas_compact.py reads: {"attrs", "className",
+    "children"}, Stage -> Layer -> Image. Konva does not serialize image
+    data, so the image source goes in the Image node's "src" attr.
+    """
+    width = record.get("width") or DEFAULT_CANVAS_SIZE[0]
+    height = record.get("height") or DEFAULT_CANVAS_SIZE[1]
+    image = {"attrs": {"src": url, "width": width, "height": height}, "className": "Image"}
+    layer = {"attrs": {}, "className": "Layer", "children": [image]}
+    return {"attrs": {"width": width, "height": height}, "className": "Stage", "children": [layer]}
+
+def build_row(story_dir, user_id, base_url):
+    """Build a community_stories row (column -> Python value) for one story"""
+    slug = story_dir.name
+    story = load_json(story_dir / "story.json")
+    manifest_path = story_dir / "manifest.json"
+    manifest = load_json(manifest_path) if manifest_path.exists() else {}
+
+    story_id = uuid.uuid5(STORY_NAMESPACE, slug)
+    shared_at = manifest.get("processed_at") or datetime.now(timezone.utc).isoformat()
+    images = manifest.get("images", {})
+    cover = manifest.get("cover", "cover.webp")
+
+    pages = []
+    for page in story["pages"]:
+        number = page["number"]
+        name = f"page-{number}.webp"
+        url = image_url(base_url, slug, name)
+        pages.append({
+            "id": str(uuid.uuid5(story_id, f"page-{number}")),
+            "pageNumber": number,
+            "content": page["content"],
+            "coachingContent": page["coaching"],
+            "imageUrl": url,
+            "canvasState": canvas_state(url, images.get(name, {})),
+        })
+
+    return {
+        "id": str(story_id),
+        "title": story["title"],
+        "original_story_id": None,
+        "original_user_id": user_id,
+        "likes_count": 0,
+        "views_count": 0,
+        "shared_at": shared_at,
+        "is_featured": False,
+        "is_approved": True,
+        "cover_coaching_content": None,
+        "cover_canvas_editor_id": None,
+        "cover_canvas_state": canvas_state(image_url(base_url, slug, cover), images.get(cover, {})),
+        "pages": pages,
+        "ai_generator_history": [],
+        "tags": [tag.strip() for tag in story.get("tags", []) if tag.strip()],
+    }
+
+def to_json(value):
+    return json.dumps(value, ensure_ascii=False, separators=(",", ":"))
+
+# --- COPY text format -------------------------------------------------------
+
+def pg_array_literal(items):
+    """Postgres array literal: {"a","b"} with \\ and " escaped inside quotes"""
+    quoted = []
+    for item in items:
+        item = item.replace('\\', '\\\\').replace('"', '\\"')
+        quoted.append(f'"{item}"')
+    return "{" + ",".join(quoted) + "}"
+
+def copy_field(value, pg_type):
+    """Render one value for COPY ... FROM STDIN (text format)"""
+    if value is None:
+        return r"\N"
+    if pg_type == "jsonb":
+        text = to_json(value)
+    elif pg_type == "jsonb[]":
+        text = pg_array_literal(to_json(v) for v in value)
+    elif pg_type == "text[]":
+        text = pg_array_literal(value)
+    elif pg_type == "boolean":
+        text = "t" if value else "f"
+    else:
+        text = str(value)
+    return (text.replace('\\', '\\\\').replace('\t', '\\t')
+                .replace('\n', '\\n').replace('\r', '\\r'))
+
+def write_copy(rows, out):
+    names = ", ".join(name for name, _ in COLUMNS)
+    out.write("CREATE TEMP TABLE community_stories_load "
+              "(LIKE community_stories INCLUDING DEFAULTS) ON COMMIT DROP;\n\n")
+    out.write(f"COPY community_stories_load ({names}) FROM STDIN;\n")
+    for row in rows:
+        out.write("\t".join(copy_field(row[name], pg_type) for name, pg_type in COLUMNS) + "\n")
+    out.write("\\.\n\n")
+    out.write(f"INSERT INTO community_stories ({names})\n")
+    out.write(f"SELECT {names} FROM community_stories_load\n")
+    out.write(on_conflict_clause() + ";\n")
+
+# --- INSERT format ----------------------------------------------------------
+
+def sql_string(text):
+    return "'" + text.replace("'", "''") + "'"
+
+def sql_value(value, pg_type):
+    """Render one value as an SQL literal"""
+    if value is None:
+        return "NULL"
+    if pg_type == "jsonb":
+        return sql_string(to_json(value)) + "::jsonb"
+    if pg_type == "jsonb[]":
+        if not value:
+            return "'{}'::jsonb[]"
+        return "ARRAY[" + ", ".join(sql_string(to_json(v)) for v in value) + "]::jsonb[]"
+    if pg_type == "text[]":
+        if not value:
+            return "'{}'::text[]"
+        return "ARRAY[" + ", ".join(sql_string(v) for v in value) + "]::text[]"
+    if pg_type == "boolean":
+        return "true" if value else "false"
+    if pg_type == "integer":
+        return str(int(value))
+    return sql_string(str(value)) + f"::{pg_type}"
+
+def write_inserts(rows, out, chunk_size):
+    names = ", ".join(name for name, _ in COLUMNS)
+    for start in range(0, len(rows), chunk_size):
+        chunk = rows[start:start + chunk_size]
+        out.write(f"INSERT INTO community_stories ({names}) VALUES\n")
+        values = []
+        for row in chunk:
+            values.append("  (" + ", ".join(sql_value(row[name], pg_type) for name, pg_type in COLUMNS) + ")")
+        out.write(",\n".join(values) + "\n")
+        out.write(on_conflict_clause() + ";\n\n")
+
+def on_conflict_clause():
+    updates = ", ".join(f"{col} = EXCLUDED.{col}" for col in UPDATE_COLUMNS)
+    return f"ON CONFLICT (id) DO UPDATE SET {updates}"
+
+# --- Main -------------------------------------------------------------------
+
+def collect_rows(processed_dir, user_id, base_url):
+    rows = []
+    failed = 0
+    for story_dir in sorted(d for d in processed_dir.iterdir() if d.is_dir()):
+        if not (story_dir / "story.json").exists():
+            print(f"⚠ {story_dir.name}: story.json not found, skipping")
+            continue
+        manifest_path = story_dir / "manifest.json"
+        duplicate = load_json(manifest_path).get("duplicate_of") if manifest_path.exists() else None
+        if duplicate:
+            print(f"⚠ {story_dir.name}: duplicate of {duplicate['slug']}, skipping")
+            continue
+        try:
+            rows.append(build_row(story_dir, user_id, base_url))
+        except (KeyError, ValueError) as e:
+            print(f"❌ {story_dir.name}: {e}")
+            failed += 1
+    return rows, failed
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate bulk-load SQL for community_stories")
+    parser.add_argument("--source", type=Path, default=PROCESSED_DIR,
+                        help=f"Processed stories directory (default: {PROCESSED_DIR})")
+    parser.add_argument("--output", type=Path, default=OUTPUT_FILE,
+                        help=f"SQL file to write (default: {OUTPUT_FILE})")
+    parser.add_argument("--format", choices=["copy", "insert"], default="copy",
+                        help="COPY via staging table, or chunked multi-row INSERT (default: copy)")
+    parser.add_argument("--chunk-size", type=int, default=100,
+                        help="Rows per INSERT statement in insert format (default: 100)")
+    parser.add_argument("--user-id", default=TARGET_USER_ID,
+                        help="original_user_id for imported stories")
+    parser.add_argument("--image-base-url", default="",
+                        help="Prefix for image URLs, e.g. https://img.icraftstories.com/community")
+    args = parser.parse_args()
+
+    print("=== Generating Community Stories SQL ===")
+    print(f"Source: {args.source}")
+
+    if not args.source.exists():
+        print(f"❌ Directory not found: {args.source}")
+        return 1
+
+    rows, failed = collect_rows(args.source, args.user_id, args.image_base_url)
+
+    args.output.parent.mkdir(parents=True, exist_ok=True)
+    with open(args.output, 'w', encoding='utf-8') as out:
+        out.write("-- Community stories bulk load\n")
+        out.write(f"-- Generated by generate-story-sql.py at {datetime.now().isoformat()}\n")
+        out.write(f"-- Stories: {len(rows)}  Format: {args.format}\n\n")
+        out.write("BEGIN;\n\n")
+        if args.format == "copy":
+            write_copy(rows, out)
+        else:
+            write_inserts(rows, out, args.chunk_size)
+        out.write("\nCOMMIT;\n")
+
+    print(f"\n=== Generation Complete ===")
+    print(f"Stories: {len(rows)}")
+    print(f"Failed: {failed}")
+    print(f"Output: {args.output} ({args.output.stat().st_size:,} bytes)")
+
+    return 0 if failed == 0 else 1
+
+if __name__ == "__main__":
+    sys.exit(main())
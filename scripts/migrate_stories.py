@@ -2,101 +2,437 @@
 """
 Community Stories Migration Script
 Migrates all community stories from non-prod to production
+
+Light metadata columns are fetched and diffed first. The heavy JSON columns
+(cover_canvas_state, pages, ai_generator_history) are only pulled, in
+batches, for stories that actually need to be inserted.
+
+Snapshots are gzip-compressed JSONL: one header line describing the table
+and columns, then one {"id", "sha256", "row"} line per story. They are
+written and read as streams, so memory use stays flat for any table size.
+
+Usage:
+    python3 migrate_stories.py                  # insert new + sync metadata
+    python3 migrate_stories.py --metadata-only  # only re-link metadata
+    python3 migrate_stories.py --dry-run        # show plan, write nothing
+
+    python3 migrate_stories.py --export-snapshot snap.jsonl.gz [--source prod]
+    python3 migrate_stories.py --import-snapshot snap.jsonl.gz --target scratch
+    python3 migrate_stories.py --diff-snapshots before.jsonl.gz after.jsonl.gz
 """
 
 import os
 import sys
+import gzip
+import json
+import hashlib
+import argparse
+from datetime import datetime
 from pathlib import Path
 
-try:
-    from supabase import create_client, Client
-except ImportError:
-    print("Error: supabase-py not installed")
-    print("Install with: ../venv/bin/pip install supabase")
-    sys.exit(1)
-
-try:
-    from dotenv import load_dotenv
-except ImportError:
-    print("Error: python-dotenv not installed")
-    print("Install with: ../venv/bin/pip install python-dotenv")
-    sys.exit(1)
-
-# Load environment variables from .env file
-env_path = Path(__file__).parent / '.env'
-load_dotenv(env_path)
+from story_config import load_env
 
 # Configuration
 NON_PROD_URL = "https://jjpbogjufnqzsgiiaqwn.supabase.co"
 PROD_URL = "https://lgkjfymwvhcjvfkuidis.supabase.co"
 TARGET_USER_ID = "user_34w00wW4m51e2xSOoJH6pzfGvs9"
 
-# Get service keys from .env file
-NON_PROD_KEY = os.environ.get("SUPABASE_SERVICE_ROLE_KEY_NONPROD")
-PROD_KEY = os.environ.get("SUPABASE_SERVICE_ROLE_KEY_PROD")
+# Columns that are cheap to fetch and diff
+LIGHT_COLUMNS = [
+    "id", "title", "likes_count", "views_count", "shared_at",
+    "is_featured", "is_approved", "cover_coaching_content",
+    "cover_canvas_editor_id", "tags"
+]
 
-if not NON_PROD_KEY or not PROD_KEY:
-    print("Error: Missing Supabase service role keys")
-    print("Set SUPABASE_SERVICE_ROLE_KEY_NONPROD and SUPABASE_SERVICE_ROLE_KEY_PROD")
-    sys.exit(1)
+# Large JSON columns - only fetched for rows that will be written
+HEAVY_COLUMNS = ["cover_canvas_state", "pages", "ai_generator_history"]
 
-# Create clients
-nonprod: Client = create_client(NON_PROD_URL, NON_PROD_KEY)
-prod: Client = create_client(PROD_URL, PROD_KEY)
+# Columns synced onto stories that already exist in the target
+METADATA_COLUMNS = [
+    "title", "likes_count", "views_count", "is_featured", "is_approved",
+    "cover_coaching_content", "tags"
+]
 
-def migrate_stories():
-    print("Starting community stories migration...\n")
+PAGE_SIZE = 1000   # PostgREST max rows per select
+BATCH_SIZE = 25    # Rows per heavy fetch / insert request
+
+# Ask for compressed responses; heavy rows are mostly repetitive JSON
+CLIENT_HEADERS = {"Accept-Encoding": "gzip, deflate"}
+
+SNAPSHOT_FORMAT = "icraft-community-stories-snapshot"
+SNAPSHOT_VERSION = 1
+
+# Known projects: name -> (url env var, default url, service key env var).
+# "scratch" points at any throwaway database for replaying snapshots.
+PROJECTS = {
+    "nonprod": ("SUPABASE_URL_NONPROD", NON_PROD_URL, "SUPABASE_SERVICE_ROLE_KEY_NONPROD"),
+    "prod": ("SUPABASE_URL_PROD", PROD_URL, "SUPABASE_SERVICE_ROLE_KEY_PROD"),
+    "scratch": ("SUPABASE_URL_SCRATCH", None, "SUPABASE_SERVICE_ROLE_KEY_SCRATCH"),
+}
+
+_clients = {}
+
+def _supabase():
+    """supabase-py, imported on first use so this module loads without it"""
+    try:
+        import supabase
+        from postgrest.types import ReturnMethod
+    except ImportError:
+        print("Error: supabase-py not installed")
+        print("Install with: ../venv/bin/pip install supabase")
+        sys.exit(1)
+    return supabase, ReturnMethod
+
+def get_client(name):
+    """Create (once) a client for a named project from the environment (and scripts/.env)"""
+    if name in _clients:
+        return _clients[name]
+
+    load_env()
+
+    url_env, default_url, key_env = PROJECTS[name]
+    url = os.environ.get(url_env, default_url)
+    key = os.environ.get(key_env)
+
+    if not url or not key:
+        print(f"Error: Missing Supabase configuration for '{name}'")
+        print(f"Set {key_env}" + ("" if default_url else f" and {url_env}"))
+        sys.exit(1)
+
+    supabase, _ = _supabase()
+    # Extend, not replace, the client's default headers (X-Client-Info etc.);
+    # apikey/Authorization are added by create_client on top of these
+    options = supabase.ClientOptions()
+    options.headers = {**options.headers, **CLIENT_HEADERS}
+    _clients[name] = supabase.create_client(url, key, options=options)
+    return _clients[name]
 
-    # Fetch all stories from non-prod
-    print("Fetching stories from non-prod...")
-    response = nonprod.table("community_stories").select("*").order("shared_at", desc=True).execute()
-    stories = response.data
+def chunked(items, size):
+    """Yield successive lists of at most `size` items"""
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
 
-    print(f"Found {len(stories)} stories to migrate\n")
+def fetch_light(client):
+    """Fetch light columns for every community story, paging past the row limit"""
+    rows = []
+    start = 0
+    while True:
+        response = (
+            client.table("community_stories")
+            .select(",".join(LIGHT_COLUMNS))
+            .order("shared_at", desc=True)
+            .order("id")          # shared_at ties must not straddle pages
+            .range(start, start + PAGE_SIZE - 1)
+            .execute()
+        )
+        rows.extend(response.data)
+        if len(response.data) < PAGE_SIZE:
+            return rows
+        start += PAGE_SIZE
 
+def fetch_heavy(client, ids, batch_size=BATCH_SIZE):
+    """Fetch heavy JSON columns for the given story ids, in batches"""
+    heavy = {}
+    for batch in chunked(ids, batch_size):
+        response = (
+            client.table("community_stories")
+            .select(",".join(["id"] + HEAVY_COLUMNS))
+            .in_("id", batch)
+            .execute()
+        )
+        for row in response.data:
+            heavy[row["id"]] = row
+    return heavy
+
+def build_import_row(story):
+    """Map a source story (light + heavy columns) to a production row"""
+    return {
+        "id": story["id"],
+        "title": story["title"],
+        "original_story_id": None,  # Stories don't exist in production
+        "original_user_id": TARGET_USER_ID,
+        "likes_count": story.get("likes_count", 0),
+        "views_count": story.get("views_count", 0),
+        "shared_at": story["shared_at"],
+        "is_featured": story.get("is_featured", False),
+        "is_approved": story.get("is_approved", True),
+        "cover_coaching_content": story.get("cover_coaching_content"),
+        "cover_canvas_editor_id": story.get("cover_canvas_editor_id"),
+        "cover_canvas_state": story.get("cover_canvas_state"),
+        "pages": story.get("pages", []),
+        "ai_generator_history": story.get("ai_generator_history", []),
+        "tags": story.get("tags", [])
+    }
+
+def metadata_changes(source, target):
+    """Return the metadata fields that differ between source and target rows"""
+    return {
+        col: source.get(col)
+        for col in METADATA_COLUMNS
+        if source.get(col) != target.get(col)
+    }
+
+def plan_migration(source_rows, target_rows):
+    """
+    Diff light rows.
+
+    Returns:
+        (to_insert, to_update) where to_insert is a list of source rows missing
+        from the target and to_update is a list of (id, title, changes) tuples.
+    """
+    target_by_id = {row["id"]: row for row in target_rows}
+    to_insert = []
+    to_update = []
+    for story in source_rows:
+        existing = target_by_id.get(story["id"])
+        if existing is None:
+            to_insert.append(story)
+            continue
+        changes = metadata_changes(story, existing)
+        if changes:
+            to_update.append((story["id"], story["title"], changes))
+    return to_insert, to_update
+
+def write_batches(target, batches, total=None, upsert=False):
+    """
+    Batched writer: insert (or upsert) each list of complete rows in one request.
+
+    `batches` may be any iterable of row lists, including a lazy generator,
+    so rows are only materialised one batch at a time. If a batch request
+    fails, its rows are retried one at a time so a single bad row only
+    fails itself.
+    """
     success_count = 0
-    error_count = 0
     errors = []
+    done = 0
+    of_total = f"/{total}" if total is not None else ""
+
+    _, ReturnMethod = _supabase()
+
+    def insert(rows):
+        target.table("community_stories").insert(
+            rows, returning=ReturnMethod.minimal, upsert=upsert
+        ).execute()
 
-    for idx, story in enumerate(stories, 1):
+    for rows in batches:
         try:
-            # Prepare story for import
-            import_data = {
-                "id": story["id"],
-                "title": story["title"],
-                "original_story_id": None,  # Stories don't exist in production
-                "original_user_id": TARGET_USER_ID,
-                "likes_count": story.get("likes_count", 0),
-                "views_count": story.get("views_count", 0),
-                "shared_at": story["shared_at"],
-                "is_featured": story.get("is_featured", False),
-                "is_approved": story.get("is_approved", True),
-                "cover_coaching_content": story.get("cover_coaching_content"),
-                "cover_canvas_editor_id": story.get("cover_canvas_editor_id"),
-                "cover_canvas_state": story.get("cover_canvas_state"),
-                "pages": story.get("pages", []),
-                "ai_generator_history": story.get("ai_generator_history", []),
-                "tags": story.get("tags", [])
-            }
-
-            # Insert into production
-            prod.table("community_stories").insert(import_data).execute()
-
-            print(f"✓ Story {idx}/{len(stories)}: \"{story['title']}\"")
-            success_count += 1
+            insert(rows)
+            results = [(row, None) for row in rows]
+        except Exception as e:
+            print(f"  Batch of {len(rows)} failed ({e}); retrying row by row")
+            results = []
+            for row in rows:
+                try:
+                    insert([row])
+                    results.append((row, None))
+                except Exception as row_error:
+                    results.append((row, row_error))
+
+        for row, row_error in results:
+            done += 1
+            if row_error is None:
+                print(f"✓ Story {done}{of_total}: \"{row['title']}\"")
+                success_count += 1
+            else:
+                print(f"✗ Story {done}{of_total}: \"{row['title']}\" ({row['id']}) - ERROR")
+                print(f"  {str(row_error)}")
+                errors.append({"story": f"{row['title']} ({row['id']})", "error": str(row_error)})
+
+    return success_count, errors
 
+def insert_stories(source, target, stories, batch_size=BATCH_SIZE):
+    """Fetch heavy columns batch by batch and insert complete rows"""
+    def batches():
+        for batch in chunked(stories, batch_size):
+            heavy = fetch_heavy(source, [s["id"] for s in batch], batch_size)
+            yield [build_import_row({**s, **heavy.get(s["id"], {})}) for s in batch]
+
+    return write_batches(target, batches(), total=len(stories))
+
+def update_metadata(target, updates):
+    """Apply metadata-only updates; no heavy columns are sent"""
+    success_count = 0
+    errors = []
+    _, ReturnMethod = _supabase()
+
+    for idx, (story_id, title, changes) in enumerate(updates, 1):
+        try:
+            target.table("community_stories").update(
+                changes, returning=ReturnMethod.minimal
+            ).eq("id", story_id).execute()
+            print(f"✓ Update {idx}/{len(updates)}: \"{title}\" ({', '.join(changes)})")
+            success_count += 1
         except Exception as e:
-            print(f"✗ Story {idx}/{len(stories)}: \"{story['title']}\" - ERROR")
+            print(f"✗ Update {idx}/{len(updates)}: \"{title}\" - ERROR")
             print(f"  {str(e)}")
-            errors.append({"story": story["title"], "error": str(e)})
-            error_count += 1
+            errors.append({"story": title, "error": str(e)})
+
+    return success_count, errors
+
+def row_checksum(row):
+    """SHA-256 of a row's canonical JSON (sorted keys, compact separators)"""
+    canonical = json.dumps(row, sort_keys=True, separators=(",", ":"), ensure_ascii=False)
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+def export_snapshot(client, path, source_name, batch_size=BATCH_SIZE):
+    """Stream every community story, all columns, into a gzip JSONL snapshot"""
+    print(f"Exporting community stories from {source_name} to {path}...")
+    count = 0
+
+    with gzip.open(path, "wt", encoding="utf-8") as f:
+        header_written = False
+        start = 0
+        while True:
+            response = (
+                client.table("community_stories")
+                .select("*")
+                .order("id")
+                .range(start, start + batch_size - 1)
+                .execute()
+            )
+            rows = response.data
+
+            if not header_written:
+                header = {
+                    "format": SNAPSHOT_FORMAT,
+                    "version": SNAPSHOT_VERSION,
+                    "table": "community_stories",
+                    "columns": sorted(rows[0].keys()) if rows else LIGHT_COLUMNS + HEAVY_COLUMNS,
+                    "source": source_name,
+                    "exported_at": datetime.now().isoformat(),
+                }
+                f.write(json.dumps(header) + "\n")
+                header_written = True
+
+            for row in rows:
+                record = {"id": row["id"], "sha256": row_checksum(row), "row": row}
+                f.write(json.dumps(record, ensure_ascii=False, separators=(",", ":")) + "\n")
+                count += 1
+
+            print(f"  {count} stories written")
+            if len(rows) < batch_size:
+                break
+            start += batch_size
+
+    print(f"✓ Snapshot complete: {count} stories ({Path(path).stat().st_size:,} bytes)")
+    return count
+
+def read_snapshot(path):
+    """
+    Open a snapshot and return (header, records) where records is a lazy
+    iterator of {"id", "sha256", "row"} dicts. Checksums are verified as rows
+    are read; a mismatch raises ValueError.
+    """
+    f = gzip.open(path, "rt", encoding="utf-8")
+    header = json.loads(f.readline())
+    if header.get("format") != SNAPSHOT_FORMAT:
+        f.close()
+        raise ValueError(f"{path} is not a community stories snapshot")
+    if header.get("version") != SNAPSHOT_VERSION:
+        f.close()
+        raise ValueError(f"Unsupported snapshot version: {header.get('version')}")
+
+    def records():
+        with f:
+            for line_no, line in enumerate(f, 2):
+                record = json.loads(line)
+                if row_checksum(record["row"]) != record["sha256"]:
+                    raise ValueError(f"{path}:{line_no}: checksum mismatch for story {record['id']}")
+                yield record
+
+    return header, records()
+
+def import_snapshot(client, path, target_name, batch_size=BATCH_SIZE, dry_run=False):
+    """Load a snapshot into a target with the batched writer (upsert by id)"""
+    header, records = read_snapshot(path)
+    print(f"Importing snapshot {path} into {target_name}")
+    print(f"  Source: {header['source']} exported at {header['exported_at']}")
+
+    def batches():
+        rows = []
+        for record in records:
+            rows.append(record["row"])
+            if len(rows) == batch_size:
+                yield rows
+                rows = []
+        if rows:
+            yield rows
+
+    if dry_run:
+        count = sum(len(rows) for rows in batches())
+        print(f"  Would upsert {count} stories (checksums verified)")
+        print("\nThis was a DRY RUN. Run without --dry-run to apply changes.")
+        return 0
+
+    success_count, errors = write_batches(client, batches(), upsert=True)
+
+    print(f"\n✓ Imported: {success_count}")
+    print(f"✗ Errors: {len(errors)}")
+    return 0 if not errors else 1
+
+def diff_snapshots(before_path, after_path):
+    """Compare two snapshots by row checksum without touching the network"""
+    _, before_records = read_snapshot(before_path)
+    before = {r["id"]: (r["sha256"], r["row"]) for r in before_records}
+    _, after_records = read_snapshot(after_path)
+    after = {r["id"]: (r["sha256"], r["row"]) for r in after_records}
+
+    added = [i for i in after if i not in before]
+    removed = [i for i in before if i not in after]
+    changed = [i for i in after if i in before and after[i][0] != before[i][0]]
+
+    print(f"=== Snapshot Diff: {before_path} → {after_path} ===")
+    for story_id in added:
+        print(f"  + {story_id}: \"{after[story_id][1]['title']}\"")
+    for story_id in removed:
+        print(f"  - {story_id}: \"{before[story_id][1]['title']}\"")
+    for story_id in changed:
+        old_row, new_row = before[story_id][1], after[story_id][1]
+        columns = sorted(c for c in set(old_row) | set(new_row) if old_row.get(c) != new_row.get(c))
+        print(f"  ~ {story_id}: \"{new_row['title']}\" ({', '.join(columns)})")
+
+    print(f"\nAdded: {len(added)}  Removed: {len(removed)}  Changed: {len(changed)}")
+    return 0
+
+def migrate_stories(metadata_only=False, dry_run=False, batch_size=BATCH_SIZE):
+    print("Starting community stories migration...\n")
+    nonprod = get_client("nonprod")
+    prod = get_client("prod")
+
+    # Fetch light columns from both sides
+    print("Fetching story metadata from non-prod...")
+    stories = fetch_light(nonprod)
+    print("Fetching story metadata from production...")
+    existing = fetch_light(prod)
+
+    to_insert, to_update = plan_migration(stories, existing)
+    if metadata_only:
+        to_insert = []
+
+    print(f"Found {len(stories)} stories in non-prod")
+    print(f"  New stories to insert: {len(to_insert)}")
+    print(f"  Metadata updates: {len(to_update)}\n")
+
+    if dry_run:
+        for story in to_insert:
+            print(f"  Would insert: \"{story['title']}\"")
+        for _, title, changes in to_update:
+            print(f"  Would update: \"{title}\" ({', '.join(changes)})")
+        print("\nThis was a DRY RUN. Run without --dry-run to apply changes.")
+        return 0
+
+    inserted, insert_errors = insert_stories(nonprod, prod, to_insert, batch_size)
+    updated, update_errors = update_metadata(prod, to_update)
+    errors = insert_errors + update_errors
+    error_count = len(errors)
 
     # Print summary
     print("\n" + "=" * 60)
     print("MIGRATION SUMMARY")
     print("=" * 60)
     print(f"Total stories: {len(stories)}")
-    print(f"✓ Successfully imported: {success_count}")
+    print(f"✓ Successfully imported: {inserted}")
+    print(f"✓ Metadata updated: {updated}")
     print(f"✗ Errors: {error_count}")
 
     if errors:
@@ -106,18 +442,55 @@ def migrate_stories():
 
     # Validate results
     print("\nValidating migration...")
-    count_response = prod.table("community_stories").select("id", count="exact").execute()
+    count_response = prod.table("community_stories").select("id", count="exact").limit(1).execute()
     prod_count = count_response.count
 
     print(f"Production now has {prod_count} community stories")
 
-    if prod_count == len(stories):
+    expected = len(existing) + inserted
+    if prod_count == expected:
         print("✓ Migration successful - counts match!")
     else:
-        print(f"⚠ Warning: Expected {len(stories)} but got {prod_count}")
+        print(f"⚠ Warning: Expected {expected} but got {prod_count}")
 
     print("\nMigration complete!")
     return 0 if error_count == 0 else 1
 
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Migrate community stories from non-prod to production")
+    parser.add_argument("--metadata-only", action="store_true",
+                        help="Only sync metadata on existing stories; never fetch heavy columns")
+    parser.add_argument("--dry-run", action="store_true",
+                        help="Show the migration plan without writing")
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE,
+                        help=f"Rows per heavy fetch/insert batch (default: {BATCH_SIZE})")
+    parser.add_argument("--export-snapshot", metavar="PATH",
+                        help="Dump community_stories from --source to a gzip JSONL snapshot")
+    parser.add_argument("--import-snapshot", metavar="PATH",
+                        help="Load a snapshot into --target (upsert by id)")
+    parser.add_argument("--diff-snapshots", nargs=2, metavar=("BEFORE", "AFTER"),
+                        help="Compare two snapshots offline")
+    parser.add_argument("--source", choices=sorted(PROJECTS), default="nonprod",
+                        help="Project to export from (default: nonprod)")
+    parser.add_argument("--target", choices=sorted(PROJECTS), default="scratch",
+                        help="Project to import into (default: scratch)")
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.export_snapshot:
+        export_snapshot(get_client(args.source), args.export_snapshot, args.source, args.batch_size)
+        return 0
+    if args.import_snapshot:
+        return import_snapshot(get_client(args.target), args.import_snapshot, args.target,
+                               args.batch_size, args.dry_run)
+    if args.diff_snapshots:
+        return diff_snapshots(*args.diff_snapshots)
+    return migrate_stories(
+        metadata_only=args.metadata_only,
+        dry_run=args.dry_run,
+        batch_size=args.batch_size
+    )
+
 if __name__ == "__main__":
-    sys.exit(migrate_stories())
+    sys.exit(main())
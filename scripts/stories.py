@@ -0,0 +1,128 @@
+#!/usr/bin/env python3
+"""
+Stories - One entry point for the story tooling
+
+    stories [--root DIR] [--env-file FILE] <command> [command options]
+
+Each command runs the existing script unchanged (its own --help and options
+apply), but nothing is imported until a command is chosen, so `--help` and
+light commands start fast and heavy dependencies (Pillow, numpy,
+supabase, Playwright, ...) are only loaded by the commands that use them.
+
+Shared configuration (story_config.py):
+    --root DIR       directory holding stories-tmp/ (default: $STORIES_ROOT or .)
+    --env-file FILE  credentials for migrate/upload/sync (default: scripts/.env)
+
+Usage:
+    python3 stories.py validate
+    python3 stories.py normalize --dry-run
+    python3 stories.py process --thumbnails 640,320
+    python3 stories.py upload --workers 4              # Playwright uploader
+    python3 stories.py upload --workers 4 --via api
+    python3 stories.py --root /data/icraft convert
+
+Link it onto PATH as `stories` (ln -s "$PWD/stories.py" ~/bin/stories).
+"""
+
+import os
+import sys
+import argparse
+
+SCRIPTS_DIR = os.path.dirname(os.path.realpath(__file__))
+
+# command -> (scripts run in order, needs credentials, help)
+COMMANDS = {
+    "validate": (["validate-stories.py"], False, "Pre-flight check of source story folders"),
+    "normalize": (["normalize-filenames.py", "normalize-cover-names.py"], False,
+                  "Standardize page and cover image names"),
+    "covers": (["create-covers-from-page1.py"], False, "Create missing covers from Page1"),
+    "process": (["batch-process-stories.py"], False, "Convert docx/PNG to markdown/WebP (+ queue worker)"),
+    "convert": (["convert-stories-to-json.py"], False, "Parse story.md into story.json"),
+    "dedup": (["story_dedup.py"], False, "Flag near-duplicate stories"),
+    "bundles": (["story_bundles.py"], False, "Build pre-compressed reader bundles"),
+    "sql": (["generate-story-sql.py"], False, "Generate community_stories SQL"),
+    "catalog": (["story_catalog.py"], False, "Query/import/export the story catalog"),
+    "queue": (["story_queue.py"], False, "Shared ingest queue status and simulation"),
+    "sync": (["sync-story-assets.py"], True, "Push processed images to R2/S3"),
+    "migrate": (["migrate_stories.py"], True, "Migrate community stories between projects"),
+    "upload": (None, True, "Upload processed stories (--via playwright|api, default: playwright)"),
+    "bench": (["story_bench.py"], False, "End-to-end benchmark on a synthetic corpus"),
+}
+
+UPLOAD_SCRIPTS = {"api": "upload-stories-api.py", "playwright": "upload-stories-playwright.py"}
+
+def script_help(path):
+    """Module docstring of a tool that has no argparse --help of its own"""
+    import ast
+
+    with open(path, 'r', encoding='utf-8') as f:
+        source = f.read()
+    if "argparse" in source:
+        return None
+    return ast.get_docstring(ast.parse(source)) or f"{os.path.basename(path)} takes no options"
+
+def run_script(script, command, args):
+    """Run a tool as __main__ with `args`; returns its exit code"""
+    import runpy
+
+    path = os.path.join(SCRIPTS_DIR, script)
+    if "-h" in args or "--help" in args:
+        # Older tools ignore unknown flags, so --help would run them for real
+        text = script_help(path)
+        if text:
+            print(f"{script}:\n\n{text}\n")
+            return 0
+    sys.argv = [f"stories {command}", *args]
+    try:
+        runpy.run_path(path, run_name="__main__")
+    except SystemExit as e:
+        if e.code is None or isinstance(e.code, int):
+            return e.code or 0
+        print(e.code, file=sys.stderr)
+        return 1
+    return 0
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog="stories",
+        description="Story tooling. Run `stories <command> --help` for a command's options.",
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog="commands:\n" + "\n".join(f"  {name:<11}{help}" for name, (_, _, help) in COMMANDS.items()),
+    )
+    parser.add_argument("--root", help="Directory holding stories-tmp/ (default: $STORIES_ROOT or .)")
+    parser.add_argument("--env-file", help="Credentials file (default: scripts/.env)")
+    parser.add_argument("command", choices=COMMANDS, metavar="command", help="One of the commands below")
+    parser.add_argument("args", nargs=argparse.REMAINDER, help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    # Tools import their siblings (story_catalog, story_images, ...) by name
+    if SCRIPTS_DIR not in sys.path:
+        sys.path.insert(0, SCRIPTS_DIR)
+    import story_config
+
+    scripts, needs_env, _ = COMMANDS[args.command]
+    if needs_env:
+        story_config.load_env(args.env_file or story_config.ENV_FILE)
+
+    root = story_config.stories_root(args.root)
+    if not os.path.isdir(root):
+        print(f"Error: stories root not found: {root}")
+        return 1
+    os.chdir(root)
+
+    rest = args.args
+    if args.command == "upload":
+        # --via may appear anywhere; everything else goes to the chosen uploader
+        upload = argparse.ArgumentParser(prog="stories upload", add_help=False, allow_abbrev=False)
+        upload.add_argument("--via", choices=UPLOAD_SCRIPTS, default="playwright")
+        upload_args, rest = upload.parse_known_args(rest)
+        scripts = [UPLOAD_SCRIPTS[upload_args.via]]
+
+    for script in scripts:
+        code = run_script(script, args.command, rest)
+        if code:
+            return code
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,221 @@
+#!/usr/bin/env python3
+"""
+Story Bench - End-to-end pipeline benchmark on a synthetic corpus
+
+Generates a fresh corpus with story_corpus.py in a scratch workspace, then
+runs every ingest stage against it in order, timing each one:
+
+    validate → normalize-filenames → normalize-covers → create-covers
+             → process → convert
+
+The stage scripts run unmodified, as subprocesses with the workspace as
+their working directory, so the timings include interpreter start-up and
+imports, the same as a real run. Stage output goes to <workspace>/bench-logs/.
+
+Each run appends a record to stories-tmp/bench/results.jsonl (commit, host,
+corpus settings, per-stage seconds and exit codes, output counts, and WebP
+encodes per image, since ambiguous images are encoded twice). It is
+then compared with the median of the last BASELINE_RUNS runs that used the
+same settings. A stage is a regression if it is slower by more than
+--threshold and by more than MIN_REGRESSION_SECONDS, or if it used to
+succeed and now fails. Regressions make the exit code 1, so this can run in CI.
+
+Usage:
+    python3 story_bench.py --stories 20
+    python3 story_bench.py --stories 100 --page-size 2048x1536 --threshold 0.15
+    python3 story_bench.py --process-args "--image-backend cwebp"
+    python3 story_bench.py --history
+"""
+
+import os
+import sys
+import json
+import time
+import shlex
+import shutil
+import socket
+import argparse
+import platform
+import statistics
+import subprocess
+from pathlib import Path
+from datetime import datetime
+
+from story_corpus import generate_corpus, parse_size
+
+SCRIPTS_DIR = Path(__file__).resolve().parent
+WORKSPACE = Path("stories-tmp/bench/workspace")
+RESULTS_FILE = Path("stories-tmp/bench/results.jsonl")
+
+STAGES = [
+    ("validate", "validate-stories.py"),
+    ("normalize-filenames", "normalize-filenames.py"),
+    ("normalize-covers", "normalize-cover-names.py"),
+    ("create-covers", "create-covers-from-page1.py"),
+    ("process", "batch-process-stories.py"),
+    ("convert", "convert-stories-to-json.py"),
+]
+
+BASELINE_RUNS = 5
+MIN_REGRESSION_SECONDS = 0.5    # Ignore slowdowns below timer/start-up noise
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=SCRIPTS_DIR,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def run_stage(name, script, workspace, extra_args):
+    """Run one stage script in the workspace; returns {"seconds", "exit"}"""
+    logs = workspace / "bench-logs"
+    logs.mkdir(exist_ok=True)
+    env = dict(os.environ, PYTHONPATH=str(SCRIPTS_DIR))
+    started = time.perf_counter()
+    with open(logs / f"{name}.log", 'w') as log:
+        result = subprocess.run([sys.executable, str(SCRIPTS_DIR / script), *extra_args],
+                                cwd=workspace, env=env, stdout=log, stderr=subprocess.STDOUT)
+    return {"seconds": round(time.perf_counter() - started, 3), "exit": result.returncode}
+
+def count_outputs(workspace):
+    """Output counts, plus how many images needed a second WebP trial encode"""
+    processed = workspace / "stories-tmp/processed"
+    outputs = {"manifests": 0, "story_json": 0, "images": 0, "webp_encodes": 0, "compared": 0}
+    if not processed.exists():
+        return outputs
+    outputs["story_json"] = len(list(processed.glob("*/story.json")))
+    for path in processed.glob("*/manifest.json"):
+        outputs["manifests"] += 1
+        with open(path, 'r') as f:
+            images = json.load(f).get("images", {})
+        for record in images.values():
+            compared = record.get("encoding", {}).get("decision") == "compared"
+            outputs["images"] += 1
+            outputs["compared"] += compared
+            outputs["webp_encodes"] += 2 if compared else 1
+    return outputs
+
+def load_results(path):
+    if not path.exists():
+        return []
+    with open(path, 'r') as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+def compare(record, history, threshold):
+    """[(stage, seconds, baseline seconds or None, note)] for regressed stages"""
+    previous = [r for r in history if r["config"] == record["config"]][-BASELINE_RUNS:]
+    regressions = []
+    for name, stage in record["stages"].items():
+        runs = [r["stages"][name] for r in previous if name in r["stages"]]
+        passing = [s["seconds"] for s in runs if s["exit"] == 0]
+        if stage["exit"] != 0 and passing:
+            regressions.append((name, stage["seconds"], statistics.median(passing), f"exit {stage['exit']}"))
+            continue
+        if not passing:
+            continue
+        baseline = statistics.median(passing)
+        if (stage["seconds"] > baseline * (1 + threshold)
+                and stage["seconds"] - baseline > MIN_REGRESSION_SECONDS):
+            regressions.append((name, stage["seconds"], baseline, f"+{stage['seconds'] / baseline - 1:.0%}"))
+    return regressions, len(previous)
+
+def print_history(history):
+    names = [name for name, _ in STAGES]
+    print(f"{'date':<17}{'commit':<10}{'stories':>8}" + "".join(f"{n[:10]:>11}" for n in names))
+    for r in history[-20:]:
+        cells = ""
+        for n in names:
+            stage = r["stages"].get(n)
+            # "!" marks a stage that exited non-zero
+            cell = f"{stage['seconds']:.2f}{'!' if stage['exit'] else ''}" if stage else "-"
+            cells += f"{cell:>11}"
+        print(f"{r['timestamp'][:16]:<17}{r.get('commit') or '-':<10}{r['config']['stories']:>8}{cells}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the ingest pipeline on a synthetic corpus")
+    parser.add_argument("--stories", type=int, default=20, help="Synthetic stories (default: 20)")
+    parser.add_argument("--pages", default="6-12", help="Page count range (default: 6-12)")
+    parser.add_argument("--page-size", default="1024x768", help="Page PNG size (default: 1024x768)")
+    parser.add_argument("--cover-size", default="1024x1024", help="Cover PNG size (default: 1024x1024)")
+    parser.add_argument("--painted", type=float, default=0.3, help="Share of painted-style art (default: 0.3)")
+    parser.add_argument("--messy", type=float, default=0.3, help="Rate of messy names (default: 0.3)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--process-args", default="",
+                        help="Extra arguments for batch-process-stories.py, e.g. \"--image-backend cwebp\"")
+    parser.add_argument("--workspace", type=Path, default=WORKSPACE,
+                        help=f"Scratch directory, wiped each run (default: {WORKSPACE})")
+    parser.add_argument("--results", type=Path, default=RESULTS_FILE,
+                        help=f"Results history (default: {RESULTS_FILE})")
+    parser.add_argument("--threshold", type=float, default=0.2,
+                        help="Slowdown vs baseline that counts as a regression (default: 0.2)")
+    parser.add_argument("--history", action="store_true", help="Show recent results and exit")
+    args = parser.parse_args()
+
+    history = load_results(args.results)
+    if args.history:
+        print_history(history)
+        return 0
+
+    low, _, high = args.pages.partition("-")
+    config = {
+        "stories": args.stories, "pages": args.pages, "page_size": args.page_size,
+        "cover_size": args.cover_size, "painted": args.painted, "messy": args.messy,
+        "seed": args.seed, "process_args": args.process_args,
+    }
+
+    print("=== Pipeline Benchmark ===")
+    print(f"Corpus: {args.stories} stories, {args.pages} pages at {args.page_size}, seed {args.seed}")
+    print(f"Workspace: {args.workspace}\n")
+
+    shutil.rmtree(args.workspace, ignore_errors=True)
+    started = time.perf_counter()
+    generate_corpus(args.workspace, args.stories, (int(low), int(high or low)), parse_size(args.page_size),
+                    parse_size(args.cover_size), args.painted, args.messy, args.seed)
+    print(f"  generate corpus      {time.perf_counter() - started:>8.2f}s  (not compared)")
+
+    stages = {}
+    for name, script in STAGES:
+        extra = shlex.split(args.process_args) if name == "process" else []
+        stages[name] = run_stage(name, script, args.workspace, extra)
+        status = "✓" if stages[name]["exit"] == 0 else f"⚠ exit {stages[name]['exit']}"
+        print(f"  {name:<20} {stages[name]['seconds']:>8.2f}s  {status}")
+
+    total = sum(s["seconds"] for s in stages.values())
+    record = {
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "commit": git_commit(),
+        "host": socket.gethostname(),
+        "python": platform.python_version(),
+        "config": config,
+        "stages": stages,
+        "total_seconds": round(total, 3),
+        "stories_per_second": round(args.stories / total, 3) if total else None,
+        "outputs": count_outputs(args.workspace),
+    }
+
+    regressions, baseline_runs = compare(record, history, args.threshold)
+    args.results.parent.mkdir(parents=True, exist_ok=True)
+    with open(args.results, 'a') as f:
+        f.write(json.dumps(record) + "\n")
+
+    print(f"\n=== Benchmark Complete ===")
+    print(f"Total: {total:.2f}s ({record['stories_per_second']} stories/s)")
+    outputs = record["outputs"]
+    print(f"Outputs: {outputs['manifests']} manifests, {outputs['story_json']} story.json")
+    print(f"WebP: {outputs['webp_encodes']} encodes for {outputs['images']} images "
+          f"({outputs['compared']} ambiguous, encoded twice)")
+    print(f"Logs: {args.workspace / 'bench-logs'}")
+    print(f"Results: {args.results}")
+    if not baseline_runs:
+        print("No earlier runs with these settings - this run is the baseline")
+        return 0
+    if regressions:
+        print(f"\n❌ Regressions vs median of last {baseline_runs} runs:")
+        for name, seconds, baseline, note in regressions:
+            print(f"  {name}: {seconds:.2f}s vs {baseline:.2f}s ({note})")
+        return 1
+    print(f"✓ No regressions vs median of last {baseline_runs} runs")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,213 @@
+#!/usr/bin/env python3
+"""
+Story Bundles - Build pre-compressed reader bundles for CDN delivery
+
+Opening a community story used to take a metadata request, a pages request
+and then the images. This stage folds everything the reader needs before
+images into one JSON bundle per story:
+
+    {"version", "slug", "title", "tags",
+     "cover": {image},
+     "pages": [{"number", "content", "coaching", "image": {image}}]}
+
+    image = {"url", "width", "height", "thumbnails": {width: url}}
+
+Image URLs use the content-hash object keys from sync-story-assets.py when
+the story has been synced, so the bundle only references immutable objects.
+Thumbnails of a synced story are resolved the same way; one without an
+object key yet is left out rather than pointing at an unversioned path.
+
+Bundles are named by content hash and written with their Brotli (quality
+11) and gzip (level 9) encodings next to them:
+
+    stories-tmp/bundles/{slug}.{sha256[:16]}.json[.br|.gz]
+
+so the CDN can serve them with a one-year immutable Cache-Control. The
+short-lived pointer is stories-tmp/bundles/index.json (slug → file name),
+and each story's manifest.json records its current "bundle". Unchanged
+stories are skipped without recompressing; superseded bundle files are
+removed. Stories flagged as duplicates are not bundled.
+
+Usage:
+    python3 story_bundles.py --image-base-url https://cdn.icraftstories.com
+    python3 story_bundles.py --force      # recompress every bundle
+"""
+
+import os
+import sys
+import gzip
+import json
+import hashlib
+import argparse
+from pathlib import Path
+
+try:
+    import brotli
+except ImportError:
+    print("Error: brotli not installed")
+    print("Install with: ../venv/bin/pip install brotli")
+    sys.exit(1)
+
+PROCESSED_DIR = Path("stories-tmp/processed")
+BUNDLES_DIR = Path("stories-tmp/bundles")
+
+# Bump when the bundle layout changes; it is part of every bundle's hash
+BUNDLE_VERSION = 1
+
+def load_json(path, default=None):
+    if path.exists():
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    return default
+
+def save_json(path, data, indent=2):
+    tmp = path.with_name(path.name + ".tmp")
+    with open(tmp, 'w', encoding='utf-8') as f:
+        json.dump(data, f, indent=indent, ensure_ascii=False)
+    os.replace(tmp, path)
+
+def write_atomic(path, data):
+    tmp = path.with_name(path.name + ".tmp")
+    tmp.write_bytes(data)
+    os.replace(tmp, path)
+
+def image_ref(base_url, slug, name, manifest):
+    """Bundle entry for one processed image"""
+    base = base_url.rstrip('/') + '/' if base_url else ""
+    objects = manifest.get("objects", {})
+    record = manifest.get("images", {}).get(name, {})
+
+    def url(path):
+        """Object URL, local path for an unsynced story, or None if not synced yet"""
+        if path in objects:
+            return base + objects[path]["key"]
+        return None if objects else f"{base}{slug}/{path}"
+
+    thumbnails = {str(width): url(path) for width, path in record.get("thumbnails", {}).items()}
+    return {
+        "url": url(name) or f"{base}{slug}/{name}",
+        "width": record.get("width"),
+        "height": record.get("height"),
+        "thumbnails": {width: ref for width, ref in thumbnails.items() if ref},
+    }
+
+def build_bundle(story_dir, manifest, base_url):
+    """Bundle dict for one processed story"""
+    slug = story_dir.name
+    story = load_json(story_dir / "story.json")
+    return {
+        "version": BUNDLE_VERSION,
+        "slug": slug,
+        "title": story["title"],
+        "tags": [tag.strip() for tag in story.get("tags", []) if tag.strip()],
+        "cover": image_ref(base_url, slug, manifest.get("cover", "cover.webp"), manifest),
+        "pages": [
+            {
+                "number": page["number"],
+                "content": page["content"],
+                "coaching": page["coaching"],
+                "image": image_ref(base_url, slug, f"page-{page['number']}.webp", manifest),
+            }
+            for page in story["pages"]
+        ],
+    }
+
+def encode_bundle(bundle):
+    """(canonical JSON bytes, sha256 hex)"""
+    data = json.dumps(bundle, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+    return data, hashlib.sha256(data).hexdigest()
+
+def write_bundle(out_dir, slug, data, sha256):
+    """Write the bundle and its encodings; returns the manifest "bundle" record"""
+    name = f"{slug}.{sha256[:16]}.json"
+    br = brotli.compress(data, quality=11, mode=brotli.MODE_TEXT)
+    # mtime=0 keeps the gzip bytes a pure function of the bundle
+    gz = gzip.compress(data, compresslevel=9, mtime=0)
+    write_atomic(out_dir / name, data)
+    write_atomic(out_dir / f"{name}.br", br)
+    write_atomic(out_dir / f"{name}.gz", gz)
+    return {"file": name, "sha256": sha256, "bytes": len(data), "br_bytes": len(br), "gz_bytes": len(gz)}
+
+def remove_stale(out_dir, slug, keep):
+    """Delete superseded bundle files of one story"""
+    removed = 0
+    for path in out_dir.glob(f"{slug}.*.json*"):
+        if not path.name.startswith(keep):
+            path.unlink()
+            removed += 1
+    return removed
+
+def main():
+    parser = argparse.ArgumentParser(description="Build pre-compressed per-story reader bundles")
+    parser.add_argument("--source", type=Path, default=PROCESSED_DIR,
+                        help=f"Processed stories directory (default: {PROCESSED_DIR})")
+    parser.add_argument("--output", type=Path, default=BUNDLES_DIR,
+                        help=f"Bundle directory (default: {BUNDLES_DIR})")
+    parser.add_argument("--image-base-url", default="",
+                        help="Public URL prefix for images (default: relative URLs)")
+    parser.add_argument("--force", action="store_true",
+                        help="Rewrite bundles even when unchanged")
+    args = parser.parse_args()
+
+    print("=== Building Story Bundles ===")
+    print(f"Source: {args.source}")
+    print(f"Output: {args.output}\n")
+
+    if not args.source.exists():
+        print(f"❌ Directory not found: {args.source}")
+        return 1
+    args.output.mkdir(parents=True, exist_ok=True)
+
+    index_path = args.output / "index.json"
+    index = load_json(index_path, {})
+    built = unchanged = failed = 0
+    totals = {"bytes": 0, "br_bytes": 0, "gz_bytes": 0}
+    live = set()
+
+    for story_dir in sorted(d for d in args.source.iterdir() if d.is_dir() and (d / "story.json").exists()):
+        slug = story_dir.name
+        manifest = load_json(story_dir / "manifest.json", {"slug": slug})
+        if manifest.get("duplicate_of"):
+            continue
+        live.add(slug)
+
+        try:
+            data, sha256 = encode_bundle(build_bundle(story_dir, manifest, args.image_base_url))
+        except (OSError, KeyError, ValueError) as e:
+            print(f"❌ {slug}: {e}")
+            failed += 1
+            continue
+
+        record = manifest.get("bundle")
+        if (not args.force and record and record["sha256"] == sha256
+                and all((args.output / f"{record['file']}{suffix}").exists() for suffix in ("", ".br", ".gz"))):
+            unchanged += 1
+        else:
+            record = write_bundle(args.output, slug, data, sha256)
+            manifest["bundle"] = record
+            save_json(story_dir / "manifest.json", manifest)
+            remove_stale(args.output, slug, record["file"])
+            built += 1
+            print(f"✓ {slug}: {record['bytes']:,} → br {record['br_bytes']:,} / gz {record['gz_bytes']:,} bytes")
+
+        index[slug] = record["file"]
+        for key in totals:
+            totals[key] += record[key]
+
+    # Drop stories that were removed or flagged as duplicates since the last run
+    for slug in set(index) - live:
+        remove_stale(args.output, slug, keep="\0")
+        del index[slug]
+    save_json(index_path, dict(sorted(index.items())), indent=None)
+
+    print(f"\n=== Bundles Complete ===")
+    print(f"Built: {built}, unchanged: {unchanged}, failed: {failed}")
+    if totals["bytes"]:
+        print(f"Total: {totals['bytes']:,} bytes → br {totals['br_bytes']:,} "
+              f"({totals['br_bytes'] / totals['bytes']:.0%}), gz {totals['gz_bytes']:,} "
+              f"({totals['gz_bytes'] / totals['bytes']:.0%})")
+    print(f"Index: {index_path}")
+    return 1 if failed else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
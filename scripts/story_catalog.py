@@ -0,0 +1,399 @@
+#!/usr/bin/env python3
+"""
+Story Catalog - SQLite system of record for the story pipeline
+
+Every stage writes what it learns to stories-tmp/catalog.db:
+
+    batch-process-stories.py   stories (status, docx, processed_at), assets
+    convert-stories-to-json.py stories (title), pages, tags
+    story_tagging.py --apply   tags
+    sync-story-assets.py       assets.object_key
+    story_dedup.py             stories.duplicate_of
+    upload ledger              uploads (status, remote id)
+
+so questions like "which stories have no tags?" are one indexed query
+instead of a walk over thousands of JSON files. The per-folder
+manifest.json / story.json files are still written by the stages.
+
+The catalog is authoritative only for the fields above: story.json
+(title, pages, tags) and the manifest keys name, slug, docx, cover, pages,
+processed_at, duplicate_of, images and objects. Other manifest keys
+(image_tags, suggested_tags, bundle, ...) and the derived indexes
+(tag-index.json, embeddings, bundles) are owned by their own stages and
+never enter the catalog; `export` leaves them untouched. `export`
+regenerates those files only for stories with status "processed", so
+upload-only or failed rows never create folders in processed/.
+
+Usage:
+    python3 story_catalog.py import              # backfill from processed/, .progress.json, upload ledger
+    python3 story_catalog.py report              # pipeline summary
+    python3 story_catalog.py query "SELECT slug FROM stories WHERE tag_count = 0"
+    python3 story_catalog.py export [slug ...]   # rewrite manifest.json/story.json from the catalog
+"""
+
+import sys
+import json
+import time
+import sqlite3
+import hashlib
+import argparse
+import threading
+from pathlib import Path
+from datetime import datetime
+
+from upload_ledger import LEDGER_FILE, load_ledger
+
+CATALOG_FILE = Path("stories-tmp/catalog.db")
+PROCESSED_DIR = Path("stories-tmp/processed")
+PROGRESS_FILE = Path("stories-tmp/.progress.json")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS stories (
+    slug            TEXT PRIMARY KEY,
+    name            TEXT,
+    title           TEXT,
+    title_source    TEXT,
+    docx            TEXT,
+    status          TEXT NOT NULL DEFAULT 'pending',   -- pending | processed | failed
+    error           TEXT,
+    page_count      INTEGER,
+    tag_count       INTEGER NOT NULL DEFAULT 0,
+    story_sha256    TEXT,
+    duplicate_of    TEXT,
+    processed_at    TEXT,
+    updated_at      TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS stories_status ON stories(status);
+CREATE INDEX IF NOT EXISTS stories_tag_count ON stories(tag_count);
+
+CREATE TABLE IF NOT EXISTS pages (
+    slug            TEXT NOT NULL REFERENCES stories(slug) ON DELETE CASCADE,
+    number          INTEGER NOT NULL,
+    content         TEXT NOT NULL,
+    coaching        TEXT NOT NULL,
+    PRIMARY KEY (slug, number)
+);
+
+CREATE TABLE IF NOT EXISTS tags (
+    slug            TEXT NOT NULL REFERENCES stories(slug) ON DELETE CASCADE,
+    tag             TEXT NOT NULL,
+    PRIMARY KEY (slug, tag)
+);
+CREATE INDEX IF NOT EXISTS tags_tag ON tags(tag);
+
+CREATE TABLE IF NOT EXISTS assets (
+    slug            TEXT NOT NULL REFERENCES stories(slug) ON DELETE CASCADE,
+    name            TEXT NOT NULL,                      -- cover.webp, page-N.webp, thumb-W/page-N.webp
+    kind            TEXT NOT NULL,                      -- cover | page | thumbnail
+    source          TEXT,
+    source_sha256   TEXT,
+    width           INTEGER,
+    height          INTEGER,
+    webp_sha256     TEXT,
+    webp_bytes      INTEGER,
+    dhash           TEXT,
+    encode_ms       REAL,
+    object_key      TEXT,
+    PRIMARY KEY (slug, name)
+);
+CREATE INDEX IF NOT EXISTS assets_webp_sha256 ON assets(webp_sha256);
+CREATE INDEX IF NOT EXISTS assets_kind ON assets(kind);
+
+CREATE TABLE IF NOT EXISTS uploads (
+    slug            TEXT PRIMARY KEY REFERENCES stories(slug) ON DELETE CASCADE,
+    status          TEXT NOT NULL,                      -- partial | complete
+    remote_id       TEXT,
+    story_sha256    TEXT,
+    updated_at      TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS uploads_status ON uploads(status);
+"""
+
+ASSET_COLUMNS = ["source", "source_sha256", "width", "height", "webp_sha256",
+                 "webp_bytes", "dhash", "encode_ms"]
+
+def now():
+    return datetime.now().isoformat(timespec="seconds")
+
+def asset_kind(name):
+    """cover | page | thumbnail for an asset name relative to the story folder"""
+    if "/" in name:
+        return "thumbnail"
+    return "cover" if name.startswith("cover") else "page"
+
+class Catalog:
+    def __init__(self, path=CATALOG_FILE):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        # Shared across upload worker threads; every write holds the lock
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(self.path, check_same_thread=False, timeout=30)
+        self.conn.row_factory = sqlite3.Row
+        # Queue workers on several hosts write here over a shared volume, where
+        # WAL (shared memory, one machine only) is unsafe; use the rollback journal
+        self.conn.execute("PRAGMA journal_mode=DELETE")
+        self.conn.execute("PRAGMA foreign_keys=ON")
+        self.conn.executescript(SCHEMA)
+
+    def close(self):
+        self.conn.close()
+
+    def query(self, sql, params=()):
+        with self.lock:
+            return self.conn.execute(sql, params).fetchall()
+
+    def _upsert_story(self, slug, fields):
+        fields = {**fields, "updated_at": now()}
+        columns = ", ".join(["slug", *fields])
+        placeholders = ", ".join("?" * (len(fields) + 1))
+        updates = ", ".join(f"{c} = excluded.{c}" for c in fields)
+        self.conn.execute(
+            f"INSERT INTO stories ({columns}) VALUES ({placeholders}) "
+            f"ON CONFLICT (slug) DO UPDATE SET {updates}",
+            (slug, *fields.values()),
+        )
+
+    def upsert_story(self, slug, **fields):
+        """Insert or update a story's columns"""
+        with self.lock, self.conn:
+            self._upsert_story(slug, fields)
+
+    def record_story_json(self, slug, story, sha256=None):
+        """Title, pages and tags from a story.json document"""
+        tags = list(dict.fromkeys(t.strip() for t in story.get("tags", []) if t.strip()))
+        with self.lock, self.conn:
+            self._upsert_story(slug, {
+                "title": story["title"],
+                "title_source": story.get("title_source"),
+                "page_count": len(story["pages"]),
+                "tag_count": len(tags),
+                "story_sha256": sha256,
+            })
+            self.conn.execute("DELETE FROM pages WHERE slug = ?", (slug,))
+            self.conn.executemany(
+                "INSERT INTO pages (slug, number, content, coaching) VALUES (?, ?, ?, ?)",
+                [(slug, p["number"], p["content"], p["coaching"]) for p in story["pages"]],
+            )
+            self.conn.execute("DELETE FROM tags WHERE slug = ?", (slug,))
+            self.conn.executemany("INSERT INTO tags (slug, tag) VALUES (?, ?)", [(slug, t) for t in tags])
+
+    def record_assets(self, slug, records):
+        """Image records ({name: story_images record}) for one story"""
+        rows = [
+            (slug, name, asset_kind(name),
+             *(record.get(c) for c in ASSET_COLUMNS))
+            for name, record in records.items()
+        ]
+        columns = ", ".join(ASSET_COLUMNS)
+        updates = ", ".join(f"{c} = excluded.{c}" for c in ASSET_COLUMNS)
+        with self.lock, self.conn:
+            self.conn.execute("INSERT OR IGNORE INTO stories (slug, updated_at) VALUES (?, ?)", (slug, now()))
+            self.conn.executemany(
+                f"INSERT INTO assets (slug, name, kind, {columns}) "
+                f"VALUES (?, ?, ?, {', '.join('?' * len(ASSET_COLUMNS))}) "
+                f"ON CONFLICT (slug, name) DO UPDATE SET {updates}",
+                rows,
+            )
+
+    def record_object(self, slug, name, key, sha256, size):
+        """Storage key of an uploaded asset"""
+        with self.lock, self.conn:
+            self.conn.execute("INSERT OR IGNORE INTO stories (slug, updated_at) VALUES (?, ?)", (slug, now()))
+            self.conn.execute(
+                "INSERT INTO assets (slug, name, kind, webp_sha256, webp_bytes, object_key) "
+                "VALUES (?, ?, ?, ?, ?, ?) ON CONFLICT (slug, name) DO UPDATE SET "
+                "object_key = excluded.object_key, webp_sha256 = excluded.webp_sha256, "
+                "webp_bytes = excluded.webp_bytes",
+                (slug, name, asset_kind(name), sha256, size, key),
+            )
+
+    def record_upload(self, slug, status, remote_id=None, story_sha256=None):
+        with self.lock, self.conn:
+            self.conn.execute("INSERT OR IGNORE INTO stories (slug, updated_at) VALUES (?, ?)", (slug, now()))
+            self.conn.execute(
+                "INSERT INTO uploads (slug, status, remote_id, story_sha256, updated_at) "
+                "VALUES (?, ?, ?, ?, ?) ON CONFLICT (slug) DO UPDATE SET "
+                "status = excluded.status, "
+                "remote_id = COALESCE(excluded.remote_id, remote_id), "
+                "story_sha256 = COALESCE(excluded.story_sha256, story_sha256), "
+                "updated_at = excluded.updated_at",
+                (slug, status, remote_id, story_sha256, now()),
+            )
+
+    def import_tree(self, processed_dir=PROCESSED_DIR, progress_file=PROGRESS_FILE, ledger_file=LEDGER_FILE):
+        """Backfill the catalog from the JSON files on disk; returns story count"""
+        count = 0
+        for story_dir in sorted(d for d in processed_dir.iterdir() if d.is_dir()):
+            slug = story_dir.name
+            manifest = {}
+            if (story_dir / "manifest.json").exists():
+                with open(story_dir / "manifest.json") as f:
+                    manifest = json.load(f)
+            duplicate = manifest.get("duplicate_of")
+            self.upsert_story(
+                slug,
+                name=manifest.get("name"),
+                docx=manifest.get("docx"),
+                status="processed" if manifest.get("processed_at") else "pending",
+                processed_at=manifest.get("processed_at"),
+                duplicate_of=duplicate["slug"] if duplicate else None,
+            )
+            if (story_dir / "story.json").exists():
+                data = (story_dir / "story.json").read_bytes()
+                self.record_story_json(slug, json.loads(data), hashlib.sha256(data).hexdigest())
+            if manifest.get("images"):
+                self.record_assets(slug, manifest["images"])
+            for name, obj in manifest.get("objects", {}).items():
+                self.record_object(slug, name, obj["key"], obj["sha256"], obj["bytes"])
+            count += 1
+
+        if progress_file.exists():
+            with open(progress_file) as f:
+                progress = json.load(f)
+            for slug in progress.get("failed", []):
+                if slug not in progress.get("success", []):
+                    self.upsert_story(slug, status="failed")
+
+        if ledger_file.exists():
+            # One uploads row per slug: a story complete on any target counts as complete
+            entries = {}
+            for section in load_ledger(ledger_file)["targets"].values():
+                for slug, entry in section["stories"].items():
+                    if slug not in entries or entry["status"] == "complete":
+                        entries[slug] = entry
+            for slug, entry in entries.items():
+                self.record_upload(slug, entry["status"], entry.get("remote_id"), entry.get("story_sha256"))
+        return count
+
+    def export_story(self, slug, story_dir):
+        """Rewrite story.json and the catalog-owned manifest.json keys of a processed story"""
+        story = self.query("SELECT * FROM stories WHERE slug = ?", (slug,))
+        if not story:
+            raise KeyError(f"{slug} is not in the catalog")
+        story = story[0]
+        if story["status"] != "processed":
+            raise ValueError(f"{slug} is not processed (status: {story['status']})")
+        story_dir.mkdir(parents=True, exist_ok=True)
+
+        pages = self.query("SELECT number, content, coaching FROM pages WHERE slug = ? ORDER BY number", (slug,))
+        if story["title"] is not None:
+            document = {
+                "title": story["title"],
+                "pages": [dict(p) for p in pages],
+                "tags": [r["tag"] for r in self.query("SELECT tag FROM tags WHERE slug = ? ORDER BY rowid", (slug,))],
+            }
+            if story["title_source"]:
+                document["title_source"] = story["title_source"]
+            with open(story_dir / "story.json", 'w', encoding='utf-8') as f:
+                json.dump(document, f, indent=2, ensure_ascii=False)
+
+        manifest_path = story_dir / "manifest.json"
+        manifest = {}
+        if manifest_path.exists():
+            with open(manifest_path) as f:
+                manifest = json.load(f)
+        assets = self.query("SELECT * FROM assets WHERE slug = ? ORDER BY kind, name", (slug,))
+        owned = {
+            "name": story["name"],
+            "slug": slug,
+            "docx": story["docx"],
+            "cover": "cover.webp",
+            "pages": sum(1 for a in assets if a["kind"] == "page") or story["page_count"],
+            "processed_at": story["processed_at"],
+        }
+        manifest.update({k: v for k, v in owned.items() if v is not None})
+        if story["duplicate_of"] is None:
+            manifest.pop("duplicate_of", None)
+        for a in assets:
+            if a["source_sha256"]:
+                image = manifest.setdefault("images", {}).setdefault(a["name"], {})
+                image.update({c: a[c] for c in ASSET_COLUMNS if a[c] is not None})
+        objects = {a["name"]: {"key": a["object_key"], "sha256": a["webp_sha256"], "bytes": a["webp_bytes"]}
+                   for a in assets if a["object_key"]}
+        if objects:
+            manifest["objects"] = objects
+        with open(manifest_path, 'w') as f:
+            json.dump(manifest, f, indent=2)
+
+    def report(self):
+        one = lambda sql: self.query(sql)[0][0]
+        return {
+            "stories": dict(self.query("SELECT status, COUNT(*) FROM stories GROUP BY status")),
+            "without_tags": one("SELECT COUNT(*) FROM stories WHERE title IS NOT NULL AND tag_count = 0"),
+            "duplicates": one("SELECT COUNT(*) FROM stories WHERE duplicate_of IS NOT NULL"),
+            "pages": one("SELECT COUNT(*) FROM pages"),
+            "page_image_bytes": one("SELECT COALESCE(SUM(webp_bytes), 0) FROM assets WHERE kind = 'page'"),
+            "cover_image_bytes": one("SELECT COALESCE(SUM(webp_bytes), 0) FROM assets WHERE kind = 'cover'"),
+            "assets_not_synced": one("SELECT COUNT(*) FROM assets WHERE object_key IS NULL"),
+            "uploads": dict(self.query("SELECT status, COUNT(*) FROM uploads GROUP BY status")),
+            "top_tags": [tuple(r) for r in self.query(
+                "SELECT tag, COUNT(*) AS n FROM tags GROUP BY tag ORDER BY n DESC, tag LIMIT 10")],
+        }
+
+def main():
+    parser = argparse.ArgumentParser(description="SQLite catalog of stories, pages and assets")
+    parser.add_argument("--catalog", type=Path, default=CATALOG_FILE,
+                        help=f"Catalog database (default: {CATALOG_FILE})")
+    parser.add_argument("--source", type=Path, default=PROCESSED_DIR,
+                        help=f"Processed stories directory (default: {PROCESSED_DIR})")
+    sub = parser.add_subparsers(dest="command", required=True)
+    sub.add_parser("import", help="Backfill from manifest.json/story.json, progress file and ledger")
+    sub.add_parser("report", help="Pipeline summary")
+    query = sub.add_parser("query", help="Run a read-only SQL query")
+    query.add_argument("sql")
+    export = sub.add_parser("export", help="Rewrite per-folder JSON from the catalog")
+    export.add_argument("slugs", nargs="*", help="Only these stories (default: all processed)")
+    args = parser.parse_args()
+
+    catalog = Catalog(args.catalog)
+    started = time.perf_counter()
+
+    if args.command == "import":
+        if not args.source.exists():
+            print(f"❌ Directory not found: {args.source}")
+            return 1
+        count = catalog.import_tree(args.source)
+        print(f"✓ Imported {count} stories ({time.perf_counter() - started:.1f}s) → {args.catalog}")
+        return 0
+
+    if args.command == "report":
+        report = catalog.report()
+        elapsed = (time.perf_counter() - started) * 1000
+        print("=== Story Catalog ===")
+        print("Stories: " + ", ".join(f"{n} {s}" for s, n in report["stories"].items()))
+        print(f"Without tags: {report['without_tags']}")
+        print(f"Flagged duplicates: {report['duplicates']}")
+        print(f"Pages: {report['pages']}")
+        print(f"Page images: {report['page_image_bytes']:,} bytes")
+        print(f"Cover images: {report['cover_image_bytes']:,} bytes")
+        print(f"Assets not synced: {report['assets_not_synced']}")
+        print("Uploads: " + (", ".join(f"{n} {s}" for s, n in report["uploads"].items()) or "none"))
+        print(f"Top tags: " + ", ".join(f"{t} ({n})" for t, n in report["top_tags"]))
+        print(f"\n({elapsed:.1f} ms)")
+        return 0
+
+    if args.command == "query":
+        catalog.conn.execute("PRAGMA query_only = ON")
+        rows = catalog.query(args.sql)
+        if rows:
+            print("\t".join(rows[0].keys()))
+        for row in rows:
+            print("\t".join("" if v is None else str(v) for v in row))
+        print(f"\n{len(rows)} rows ({(time.perf_counter() - started) * 1000:.1f} ms)")
+        return 0
+
+    if args.command == "export":
+        slugs = args.slugs or [r["slug"] for r in catalog.query(
+            "SELECT slug FROM stories WHERE status = 'processed' ORDER BY slug")]
+        exported = 0
+        for slug in slugs:
+            try:
+                catalog.export_story(slug, args.source / slug)
+                exported += 1
+            except (KeyError, ValueError) as e:
+                print(f"⚠ Skipping {slug}: {e.args[0]}")
+        print(f"✓ Exported {exported} stories → {args.source}")
+        return 0 if exported == len(slugs) else 1
+
+if __name__ == "__main__":
+    sys.exit(main())
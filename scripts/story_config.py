@@ -0,0 +1,45 @@
+"""
+Story Config - Settings and helpers shared by the story tools
+
+Every tool works on paths relative to the stories root (the directory
+holding stories-tmp/): the current directory, or $STORIES_ROOT / --root
+when run through stories.py. Credentials come from the environment, with
+scripts/.env loaded on demand by the tools that need it, not on import.
+"""
+
+import os
+import sys
+import hashlib
+from pathlib import Path
+
+SCRIPTS_DIR = Path(__file__).resolve().parent
+ENV_FILE = SCRIPTS_DIR / ".env"
+ROOT_ENV = "STORIES_ROOT"
+
+_loaded_env = set()
+
+def stories_root(root=None):
+    """Directory holding stories-tmp/: `root`, else $STORIES_ROOT, else the current directory"""
+    return Path(root or os.environ.get(ROOT_ENV) or ".")
+
+def load_env(path=ENV_FILE):
+    """Load a .env file into os.environ once; variables already set win"""
+    path = Path(path)
+    if path in _loaded_env or not path.exists():
+        return
+    try:
+        from dotenv import load_dotenv
+    except ImportError:
+        print("Error: python-dotenv not installed")
+        print("Install with: ../venv/bin/pip install python-dotenv")
+        sys.exit(1)
+    load_dotenv(path)
+    _loaded_env.add(path)
+
+def file_sha256(path):
+    """SHA-256 of a file's contents, read in 1 MiB chunks"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
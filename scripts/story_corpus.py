@@ -0,0 +1,216 @@
+#!/usr/bin/env python3
+"""
+Story Corpus - Generate synthetic story folders for tests and benchmarks
+
+stories-tmp/New Stories holds real author submissions we cannot share or
+grow, so this builds look-alike folders under <root>/stories-tmp/New Stories:
+
+- a .docx written the way authors write them, which pandoc turns into the
+  markdown convert-stories-to-json.py expects:
+
+      ***Title: The Brave Little Fox***
+      **Page 1**
+      Story text...\\
+      more text...
+      **Coaching Note:** Ask your child...
+      **Tags:** animals, friendship
+
+- a cover and page PNGs at configurable sizes: flat illustrations, with a
+  --painted share given grain so the lossy WebP path is exercised too
+- messy names at --messy rate, like the real submissions: "Pg 3.png",
+  "page3.png", "Story cover.png", missing covers, odd folder names
+
+The docx is plain OOXML written with zipfile, so no extra dependency.
+Output is deterministic for a given --seed.
+
+Usage:
+    python3 story_corpus.py --stories 50 --root /tmp/corpus
+    python3 story_corpus.py --stories 200 --page-size 2048x1536 --messy 0
+"""
+
+import sys
+import random
+import zipfile
+import argparse
+from pathlib import Path
+from xml.sax.saxutils import escape
+
+try:
+    from PIL import Image, ImageDraw
+except ImportError:
+    print("Error: pillow not installed")
+    print("Install with: ../venv/bin/pip install pillow")
+    sys.exit(1)
+
+SOURCE_SUBDIR = Path("stories-tmp/New Stories")
+
+ANIMALS = ["Fox", "Bear", "Owl", "Rabbit", "Turtle", "Mouse", "Duck", "Lion", "Puppy", "Kitten"]
+ADJECTIVES = ["Brave", "Little", "Sleepy", "Curious", "Kind", "Busy", "Shy", "Happy", "Grumpy", "Tiny"]
+PLACES = ["Park", "Farm", "Beach", "Library", "Garden", "School", "Forest", "Train", "Market", "Zoo"]
+WORDS = ("the a and to with his her their friend day sun home big small went saw said "
+         "played shared helped looked found wanted laughed ran jumped asked gave lunch "
+         "ball tree water morning night together slowly quickly happy sad kind gentle").split()
+COACHING = [
+    "Ask your child how {name} felt when this happened.",
+    "Point to the {place} and ask what else they see there.",
+    "Talk about a time your child helped a friend.",
+    "Pause here and let your child guess what happens next.",
+    "Practice taking turns, just like {name} did.",
+]
+TAGS = ["animals", "friendship", "sharing", "bedtime", "feelings", "school", "family",
+        "adventure", "kindness", "routines", "nature", "transitions"]
+PALETTE = [(239, 71, 111), (255, 209, 102), (6, 214, 160), (17, 138, 178), (7, 59, 76),
+           (250, 243, 221), (200, 160, 120), (90, 60, 40), (255, 255, 255), (30, 30, 30)]
+
+CONTENT_TYPES = """<?xml version="1.0" encoding="UTF-8" standalone="yes"?>
+<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">
+<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>
+<Default Extension="xml" ContentType="application/xml"/>
+<Override PartName="/word/document.xml" ContentType="application/vnd.openxmlformats-officedocument.wordprocessingml.document.main+xml"/>
+</Types>"""
+
+RELS = """<?xml version="1.0" encoding="UTF-8" standalone="yes"?>
+<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">
+<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" Target="word/document.xml"/>
+</Relationships>"""
+
+def parse_size(text):
+    """'1024x768' -> (1024, 768)"""
+    width, height = text.lower().split("x")
+    return int(width), int(height)
+
+def run(text, bold=False, italic=False):
+    props = ("<w:b/>" if bold else "") + ("<w:i/>" if italic else "")
+    props = f"<w:rPr>{props}</w:rPr>" if props else ""
+    parts = text.split("\n")
+    body = "<w:br/>".join(f'<w:t xml:space="preserve">{escape(part)}</w:t>' for part in parts)
+    return f"<w:r>{props}{body}</w:r>"
+
+def paragraph(*runs):
+    return f"<w:p>{''.join(runs)}</w:p>"
+
+def write_docx(path, paragraphs):
+    document = (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<w:document xmlns:w="http://schemas.openxmlformats.org/wordprocessingml/2006/main"><w:body>'
+        + "".join(paragraphs) + "</w:body></w:document>"
+    )
+    with zipfile.ZipFile(path, "w", zipfile.ZIP_DEFLATED) as docx:
+        docx.writestr("[Content_Types].xml", CONTENT_TYPES)
+        docx.writestr("_rels/.rels", RELS)
+        docx.writestr("word/document.xml", document)
+
+def sentence(rng, name):
+    words = rng.choices(WORDS, k=rng.randint(6, 14))
+    words.insert(rng.randrange(len(words)), name)
+    text = " ".join(words)
+    return text[0].upper() + text[1:] + rng.choice([".", ".", "!", "?"])
+
+def story_docx(path, rng, title, name, place, pages):
+    paragraphs = [paragraph(run(f"Title: {title}", bold=True, italic=True))]
+    for number in range(1, pages + 1):
+        lines = [" ".join(sentence(rng, name) for _ in range(rng.randint(1, 2))) for _ in range(rng.randint(2, 4))]
+        paragraphs.append(paragraph(run(f"Page {number}", bold=True)))
+        # Soft line breaks come through pandoc as trailing backslashes
+        paragraphs.append(paragraph(run("\n".join(lines))))
+        coaching = rng.choice(COACHING).format(name=name, place=place.lower())
+        paragraphs.append(paragraph(run("Coaching Note:", bold=True), run(" " + coaching)))
+    tags = rng.sample(TAGS, rng.randint(2, 4))
+    paragraphs.append(paragraph(run("Tags:", bold=True), run(" " + ", ".join(tags))))
+    write_docx(path, paragraphs)
+
+def illustration(rng, size, painted):
+    """Flat-color scene; `painted` adds grain like a scanned or painted page"""
+    width, height = size
+    img = Image.new("RGB", size, rng.choice(PALETTE))
+    draw = ImageDraw.Draw(img)
+    draw.rectangle([0, int(height * rng.uniform(0.55, 0.8)), width, height], fill=rng.choice(PALETTE))
+    for _ in range(rng.randint(6, 16)):
+        x, y = rng.randrange(width), rng.randrange(height)
+        w, h = rng.randint(width // 20, width // 4), rng.randint(height // 20, height // 4)
+        shape = draw.ellipse if rng.random() < 0.5 else draw.rectangle
+        shape([x, y, x + w, y + h], fill=rng.choice(PALETTE), outline=(30, 30, 30), width=max(1, width // 300))
+    if painted:
+        noise = Image.effect_noise(size, rng.uniform(20, 40)).convert("RGB")
+        img = Image.blend(img, noise, 0.15)
+    return img
+
+def messy_folder_name(rng, title, messy):
+    if rng.random() >= messy:
+        return title
+    return rng.choice([
+        lambda t: t.lower(),
+        lambda t: f"{t} (final)",
+        lambda t: f"{t}  v2",
+        lambda t: t.replace(" and ", " & "),
+        lambda t: f"{t}!",
+        lambda t: f"  {t}",
+    ])(title).rstrip()
+
+def page_name(rng, number, messy):
+    if rng.random() >= messy:
+        return f"Page{number}.png"
+    return rng.choice(["Page {n}.png", "page{n}.png", "Pg{n}.png", "Pg {n}.png", "pg{n}.png"]).format(n=number)
+
+def cover_name(rng, messy):
+    """Cover file name, or None for a story submitted without one"""
+    if rng.random() >= messy:
+        return "Cover.png"
+    return rng.choice(["cover.png", "Cover Art.png", "Story cover.png", "FINAL COVER.png", None])
+
+def generate_corpus(root, stories, pages=(6, 12), page_size=(1024, 768), cover_size=(1024, 1024),
+                    painted=0.3, messy=0.3, seed=0):
+    """Create `stories` folders under root/stories-tmp/New Stories; returns the source dir"""
+    rng = random.Random(seed)
+    source = Path(root) / SOURCE_SUBDIR
+    source.mkdir(parents=True, exist_ok=True)
+    used = set()
+
+    for n in range(stories):
+        name = rng.choice(ANIMALS)
+        place = rng.choice(PLACES)
+        title = f"The {rng.choice(ADJECTIVES)} {name} at the {place}"
+        if rng.random() < 0.3:
+            title = f"{name} and {rng.choice(ANIMALS)} Go to the {place}"
+        folder = messy_folder_name(rng, title, messy)
+        while folder.lower() in used:
+            folder = f"{folder} {n}"
+        used.add(folder.lower())
+
+        story_dir = source / folder
+        story_dir.mkdir(exist_ok=True)
+        page_count = rng.randint(*pages)
+        docx_name = rng.choice([f"{title}.docx", "Story.docx", f"{title} - FINAL.docx"])
+        story_docx(story_dir / docx_name, rng, title, name, place, page_count)
+
+        is_painted = rng.random() < painted
+        cover = cover_name(rng, messy)
+        if cover:
+            illustration(rng, cover_size, is_painted).save(story_dir / cover, compress_level=1)
+        for number in range(1, page_count + 1):
+            illustration(rng, page_size, is_painted).save(story_dir / page_name(rng, number, messy), compress_level=1)
+    return source
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate synthetic story folders")
+    parser.add_argument("--root", type=Path, required=True,
+                        help="Workspace; stories go to <root>/stories-tmp/New Stories")
+    parser.add_argument("--stories", type=int, default=20, help="Story folders (default: 20)")
+    parser.add_argument("--pages", default="6-12", help="Page count range (default: 6-12)")
+    parser.add_argument("--page-size", default="1024x768", help="Page PNG size (default: 1024x768)")
+    parser.add_argument("--cover-size", default="1024x1024", help="Cover PNG size (default: 1024x1024)")
+    parser.add_argument("--painted", type=float, default=0.3,
+                        help="Share of stories with grainy, painted-style art (default: 0.3)")
+    parser.add_argument("--messy", type=float, default=0.3,
+                        help="Rate of non-standard names and missing covers (default: 0.3)")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    low, _, high = args.pages.partition("-")
+    source = generate_corpus(args.root, args.stories, (int(low), int(high or low)), parse_size(args.page_size),
+                             parse_size(args.cover_size), args.painted, args.messy, args.seed)
+    print(f"✓ Generated {args.stories} stories in {source}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,284 @@
+#!/usr/bin/env python3
+"""
+Story Dedup - Flag near-duplicate stories before they are uploaded
+
+Community uploads include re-submitted and lightly edited copies. Instead
+of comparing every pair of stories, this stage:
+
+1. Shingles each story's page text (word 5-grams) and computes a 128-value
+   MinHash signature; stories with no words have no signature and are
+   never text matches
+2. Buckets signatures with LSH banding (16 bands x 8 rows), so only stories
+   sharing a band become candidates; candidates are confirmed when their
+   estimated Jaccard similarity is >= TEXT_THRESHOLD
+3. Takes a 64-bit difference hash (dHash) of each cover.webp - from the
+   manifest "images" record when present, else by decoding it. Covers go
+   into a multi-index hash of four 16-bit bands: two hashes within
+   COVER_DISTANCE bits differ by at most COVER_DISTANCE // 4 bits in some
+   band, so each cover only probes its bands and their near neighbours.
+   Candidates are confirmed at a Hamming distance <= COVER_DISTANCE
+
+Confirmed pairs are grouped, and every story but the oldest in a group gets
+
+    "duplicate_of": {"slug", "reason", "text_similarity", "cover_distance"}
+
+in its manifest.json (stale flags are removed). generate-story-sql.py and
+the upload scripts skip flagged stories. Signatures and cover hashes are
+cached by content hash in stories-tmp/dedup-cache.json.
+
+Usage:
+    python3 story_dedup.py              # flag duplicates in manifest.json
+    python3 story_dedup.py --dry-run    # report only
+"""
+
+import os
+import re
+import sys
+import json
+import hashlib
+import argparse
+from pathlib import Path
+from itertools import combinations
+from collections import defaultdict
+
+try:
+    import numpy as np
+except ImportError:
+    print("Error: numpy not installed")
+    print("Install with: ../venv/bin/pip install numpy")
+    sys.exit(1)
+
+from story_config import file_sha256
+from story_images import dhash
+from story_catalog import Catalog
+
+PROCESSED_DIR = Path("stories-tmp/processed")
+CACHE_FILE = Path("stories-tmp/dedup-cache.json")
+
+SHINGLE_WORDS = 5
+NUM_PERM = 128
+BANDS = 16
+ROWS = NUM_PERM // BANDS
+TEXT_THRESHOLD = 0.8
+COVER_DISTANCE = 6      # Max differing bits of 64 for "same art"
+COVER_BANDS = 4
+BAND_BITS = 64 // COVER_BANDS
+
+# Universal hashing (a * x + b) mod P over 32-bit shingle hashes;
+# a < 2^31 keeps a * x + b inside uint64
+PRIME = np.uint64(4294967311)
+_rng = np.random.default_rng(1)
+PERM_A = _rng.integers(1, 1 << 31, size=NUM_PERM, dtype=np.uint64)
+PERM_B = _rng.integers(0, 1 << 31, size=NUM_PERM, dtype=np.uint64)
+
+def shingles(text):
+    """Word n-gram shingles of case-folded text"""
+    words = re.findall(r"\w+", text.casefold())
+    if len(words) <= SHINGLE_WORDS:
+        return {" ".join(words)} if words else set()
+    return {" ".join(words[i:i + SHINGLE_WORDS]) for i in range(len(words) - SHINGLE_WORDS + 1)}
+
+def minhash(shingle_set):
+    """MinHash signature (NUM_PERM uint32 values) of a set of shingles, or None for an empty set"""
+    if not shingle_set:
+        return None
+    x = np.array([int.from_bytes(hashlib.blake2b(s.encode("utf-8"), digest_size=4).digest(), "little")
+                  for s in shingle_set], dtype=np.uint64)
+    return ((PERM_A[:, None] * x[None, :] + PERM_B[:, None]) % PRIME).min(axis=1).astype(np.uint32)
+
+def story_text(story):
+    return "\n".join(f"{p['content']} {p['coaching']}" for p in story["pages"])
+
+def cover_dhash(path):
+    """64-bit difference hash of a cover image"""
+    try:
+        from PIL import Image
+    except ImportError:
+        print("Error: pillow not installed")
+        print("Install with: ../venv/bin/pip install pillow")
+        sys.exit(1)
+    with Image.open(path) as img:
+        return int(dhash(img), 16)
+
+def load_json(path, default):
+    if path.exists():
+        with open(path) as f:
+            return json.load(f)
+    return default
+
+def save_json(path, data, indent=None):
+    tmp = path.with_name(path.name + ".tmp")
+    with open(tmp, 'w') as f:
+        json.dump(data, f, indent=indent)
+    os.replace(tmp, path)
+
+def fingerprint(story_dir, cache, manifest):
+    """
+    (signature or None, cover dhash or None), from cache when content is unchanged.
+    A cover processed by story_images.py already has its dHash in the
+    manifest, so it is not decoded again.
+    """
+    story_sha = file_sha256(story_dir / "story.json")
+    # "minhash:" replaces the older "text:" entries, which stored a
+    # placeholder signature for stories without text
+    key = f"minhash:{story_sha}"
+    if key not in cache:
+        with open(story_dir / "story.json", 'r', encoding='utf-8') as f:
+            signature = minhash(shingles(story_text(json.load(f))))
+        cache[key] = signature.tolist() if signature is not None else None
+    signature = np.array(cache[key], dtype=np.uint32) if cache[key] is not None else None
+
+    cover = story_dir / "cover.webp"
+    cover_hash = None
+    if cover.exists():
+        key = f"cover:{file_sha256(cover)}"
+        record = manifest.get("images", {}).get("cover.webp", {})
+        if key not in cache and record.get("webp_sha256") == key[6:] and "dhash" in record:
+            cache[key] = int(record["dhash"], 16)
+        elif key not in cache:
+            cache[key] = cover_dhash(cover)
+        cover_hash = cache[key]
+    return signature, cover_hash
+
+def text_pairs(signatures):
+    """{(a, b): estimated Jaccard} for LSH candidates above TEXT_THRESHOLD"""
+    buckets = defaultdict(list)
+    for slug, signature in signatures.items():
+        if signature is None:
+            continue
+        for band in range(BANDS):
+            buckets[(band, signature[band * ROWS:(band + 1) * ROWS].tobytes())].append(slug)
+
+    pairs = {}
+    for members in buckets.values():
+        for i, a in enumerate(members):
+            for b in members[i + 1:]:
+                pair = (a, b) if a < b else (b, a)
+                if pair not in pairs:
+                    pairs[pair] = float(np.mean(signatures[a] == signatures[b]))
+    return {pair: sim for pair, sim in pairs.items() if sim >= TEXT_THRESHOLD}
+
+def band_probes(value, radius):
+    """`value` and every BAND_BITS-bit value within `radius` bits of it"""
+    for k in range(radius + 1):
+        for bits in combinations(range(BAND_BITS), k):
+            flipped = value
+            for bit in bits:
+                flipped ^= 1 << bit
+            yield flipped
+
+def cover_pairs(dhashes):
+    """{(a, b): Hamming distance} for covers within COVER_DISTANCE bits"""
+    radius = COVER_DISTANCE // COVER_BANDS
+    mask = (1 << BAND_BITS) - 1
+    tables = [defaultdict(list) for _ in range(COVER_BANDS)]
+
+    pairs = {}
+    for slug, h in dhashes.items():
+        bands = [(h >> (BAND_BITS * band)) & mask for band in range(COVER_BANDS)]
+        # Probe covers indexed so far, then index this one
+        for band, value in enumerate(bands):
+            for probe in band_probes(value, radius):
+                for other in tables[band].get(probe, ()):
+                    pair = (slug, other) if slug < other else (other, slug)
+                    if pair not in pairs:
+                        pairs[pair] = bin(h ^ dhashes[other]).count("1")
+        for band, value in enumerate(bands):
+            tables[band][value].append(slug)
+    return {pair: d for pair, d in pairs.items() if d <= COVER_DISTANCE}
+
+def group_duplicates(slugs, pairs, age):
+    """Union-find over pairs; {duplicate slug: original slug} with the oldest story as original"""
+    parent = {slug: slug for slug in slugs}
+
+    def find(slug):
+        while parent[slug] != slug:
+            parent[slug] = parent[parent[slug]]
+            slug = parent[slug]
+        return slug
+
+    for a, b in pairs:
+        ra, rb = find(a), find(b)
+        if ra != rb:
+            parent[max(ra, rb, key=age)] = min(ra, rb, key=age)
+    return {slug: find(slug) for slug in slugs if find(slug) != slug}
+
+def main():
+    parser = argparse.ArgumentParser(description="Flag near-duplicate stories in manifest.json")
+    parser.add_argument("--source", type=Path, default=PROCESSED_DIR,
+                        help=f"Processed stories directory (default: {PROCESSED_DIR})")
+    parser.add_argument("--cache", type=Path, default=CACHE_FILE,
+                        help=f"Fingerprint cache (default: {CACHE_FILE})")
+    parser.add_argument("--dry-run", action="store_true",
+                        help="Report duplicates without touching manifest.json")
+    args = parser.parse_args()
+
+    print("=== Finding Duplicate Stories ===")
+    print(f"Source: {args.source}")
+
+    if not args.source.exists():
+        print(f"❌ Directory not found: {args.source}")
+        return 1
+
+    cache = load_json(args.cache, {})
+    story_dirs = {d.name: d for d in sorted(args.source.iterdir())
+                  if d.is_dir() and (d / "story.json").exists()}
+    manifests = {slug: load_json(d / "manifest.json", {"slug": slug}) for slug, d in story_dirs.items()}
+
+    signatures = {}
+    dhashes = {}
+    for slug, story_dir in story_dirs.items():
+        signature, cover_hash = fingerprint(story_dir, cache, manifests[slug])
+        signatures[slug] = signature
+        if cover_hash is not None:
+            dhashes[slug] = cover_hash
+    save_json(args.cache, cache)
+
+    texts = text_pairs(signatures)
+    covers = cover_pairs(dhashes)
+    print(f"Stories: {len(story_dirs)}, text matches: {len(texts)}, cover matches: {len(covers)}\n")
+
+    duplicates = group_duplicates(
+        list(story_dirs), set(texts) | set(covers),
+        age=lambda slug: (manifests[slug].get("processed_at", ""), slug),
+    )
+
+    changed = 0
+    catalog = None if args.dry_run else Catalog()
+    for slug, manifest in manifests.items():
+        flag = None
+        if slug in duplicates:
+            original = duplicates[slug]
+            pair = (slug, original) if slug < original else (original, slug)
+            reasons = [r for r, found in (("text", pair in texts), ("cover", pair in covers)) if found]
+            flag = {
+                "slug": original,
+                "reason": "+".join(reasons) or "group",
+                "text_similarity": (round(float(np.mean(signatures[slug] == signatures[original])), 3)
+                                    if signatures[slug] is not None and signatures[original] is not None
+                                    else None),
+                "cover_distance": (bin(dhashes[slug] ^ dhashes[original]).count("1")
+                                   if slug in dhashes and original in dhashes else None),
+            }
+            print(f"  ⚠ {slug} → duplicate of {original} ({flag['reason']}, "
+                  f"text {flag['text_similarity']}, cover {flag['cover_distance']})")
+        if manifest.get("duplicate_of") != flag:
+            changed += 1
+            if flag:
+                manifest["duplicate_of"] = flag
+            else:
+                manifest.pop("duplicate_of", None)
+            if not args.dry_run:
+                save_json(story_dirs[slug] / "manifest.json", manifest, indent=2)
+        if catalog:
+            catalog.upsert_story(slug, duplicate_of=flag["slug"] if flag else None)
+
+    print(f"\n=== Dedup Complete ===")
+    print(f"Duplicates: {len(duplicates)} of {len(story_dirs)} stories")
+    print(f"Manifests {'to update' if args.dry_run else 'updated'}: {changed}")
+    if args.dry_run:
+        print("\nThis was a DRY RUN. Run without --dry-run to apply changes.")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,256 @@
+#!/usr/bin/env python3
+"""
+Story Embeddings - Batched CPU embeddings for the processed story corpus
+
+Embeds every story (title + tags + all page text) and every page (page
+content + coaching note) from stories-tmp/processed/*/story.json, using
+BGE-M3 dense vectors - the same model the vector search uses.
+
+Inputs are sorted by length and packed into batches under a token budget,
+so short pages are not padded to the longest text in the corpus.
+
+Results live in a content-addressed cache:
+
+    stories-tmp/embeddings/vectors.f16   float16 matrix [n, dim], memory-mapped
+    stories-tmp/embeddings/ids.json      {"model", "dim", "items": [{"id", "hash"}]}
+
+Each item's hash is sha256(model id + text), so only new or changed
+stories/pages are re-embedded; unchanged rows are copied from the old
+matrix and deleted stories drop out.
+
+Usage:
+    python3 story_embeddings.py                    # BGE-M3 on CPU
+    python3 story_embeddings.py --model hashing    # dependency-light stand-in
+    python3 story_embeddings.py --threads 8 --max-batch-tokens 16384
+"""
+
+import os
+import re
+import sys
+import json
+import time
+import hashlib
+import argparse
+from pathlib import Path
+
+try:
+    import numpy as np
+except ImportError:
+    print("Error: numpy not installed")
+    print("Install with: ../venv/bin/pip install numpy")
+    sys.exit(1)
+
+PROCESSED_DIR = Path("stories-tmp/processed")
+CACHE_DIR = Path("stories-tmp/embeddings")
+
+BGE_MODEL = "BAAI/bge-m3"
+MAX_LENGTH = 512            # Tokens per input (stories are truncated)
+MAX_BATCH_TOKENS = 8192     # Approximate token budget per batch
+CHARS_PER_TOKEN = 4         # Rough estimate used for batching only
+
+def story_items(story_dir):
+    """(id, text) pairs for one story: the whole story, then each page"""
+    with open(story_dir / "story.json", 'r', encoding='utf-8') as f:
+        story = json.load(f)
+    slug = story_dir.name
+
+    pages_text = " ".join(f"{p['content']} {p['coaching']}".strip() for p in story["pages"])
+    tags = ", ".join(story.get("tags", []))
+    items = [(slug, f"{story['title']}. {tags}. {pages_text}".strip())]
+    for page in story["pages"]:
+        items.append((f"{slug}#p{page['number']}", f"{page['content']} {page['coaching']}".strip()))
+    return items
+
+def corpus_items(processed_dir):
+    items = []
+    for story_dir in sorted(d for d in processed_dir.iterdir() if d.is_dir()):
+        if (story_dir / "story.json").exists():
+            items.extend(story_items(story_dir))
+    return items
+
+def text_hash(model_id, text):
+    return hashlib.sha256(f"{model_id}\n{text}".encode("utf-8")).hexdigest()
+
+def length_batches(texts, max_batch_tokens):
+    """
+    Indices of `texts` grouped into batches, sorted by length so each batch
+    pads to a similar size; a batch holds at most max_batch_tokens (padded).
+    """
+    order = sorted(range(len(texts)), key=lambda i: len(texts[i]))
+    batches = []
+    batch = []
+    for i in order:
+        tokens = min(MAX_LENGTH, len(texts[i]) // CHARS_PER_TOKEN + 1)
+        # Sorted ascending, so the current text is the longest in the batch
+        if batch and tokens * (len(batch) + 1) > max_batch_tokens:
+            batches.append(batch)
+            batch = []
+        batch.append(i)
+    if batch:
+        batches.append(batch)
+    return batches
+
+class BgeEmbedder:
+    """BGE-M3 dense embeddings on CPU via FlagEmbedding"""
+
+    def __init__(self, model_name=BGE_MODEL):
+        try:
+            from FlagEmbedding import BGEM3FlagModel
+        except ImportError:
+            print("Error: FlagEmbedding not installed")
+            print("Install with: ../venv/bin/pip install FlagEmbedding")
+            sys.exit(1)
+        self.model_id = model_name
+        self.model = BGEM3FlagModel(model_name, use_fp16=False, devices="cpu")
+        self.dim = 1024
+
+    def encode(self, texts):
+        output = self.model.encode(texts, batch_size=len(texts), max_length=MAX_LENGTH,
+                                   return_dense=True, return_sparse=False,
+                                   return_colbert_vecs=False)
+        return np.asarray(output["dense_vecs"], dtype=np.float32)
+
+class HashingEmbedder:
+    """
+    Deterministic feature-hashing stand-in (no model download). Vectors are
+    normalised bags of hashed word unigrams/bigrams - good enough to test
+    the cache, batching and index tooling end to end.
+    """
+
+    def __init__(self, dim=384):
+        self.model_id = f"hashing-{dim}"
+        self.dim = dim
+
+    def encode(self, texts):
+        vectors = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for row, text in enumerate(texts):
+            words = re.findall(r"\w+", text.lower())
+            for feature in words + [f"{a} {b}" for a, b in zip(words, words[1:])]:
+                h = int.from_bytes(hashlib.blake2b(feature.encode(), digest_size=8).digest(), "little")
+                vectors[row, h % self.dim] += 1.0 if (h >> 63) else -1.0
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        return vectors / np.maximum(norms, 1e-12)
+
+def make_embedder(name):
+    if name == "hashing":
+        return HashingEmbedder()
+    return BgeEmbedder(name)
+
+def load_cache(cache_dir):
+    """Return (meta, matrix or None) from an existing cache"""
+    ids_path = Path(cache_dir) / "ids.json"
+    vectors_path = Path(cache_dir) / "vectors.f16"
+    if not ids_path.exists() or not vectors_path.exists():
+        return None, None
+    with open(ids_path) as f:
+        meta = json.load(f)
+    if not meta["items"]:
+        return meta, None
+    matrix = np.memmap(vectors_path, dtype=np.float16, mode="r",
+                       shape=(len(meta["items"]), meta["dim"]))
+    return meta, matrix
+
+def write_cache(cache_dir, model_id, dim, items, hashes, vectors):
+    """Atomically replace the cache with `vectors` (float16) and its sidecar"""
+    cache_dir = Path(cache_dir)
+    cache_dir.mkdir(parents=True, exist_ok=True)
+    tmp_vectors = cache_dir / "vectors.f16.tmp"
+    if items:
+        matrix = np.memmap(tmp_vectors, dtype=np.float16, mode="w+", shape=(len(items), dim))
+        matrix[:] = vectors
+        matrix.flush()
+        del matrix
+    else:
+        tmp_vectors.write_bytes(b"")
+
+    meta = {
+        "model": model_id,
+        "dim": dim,
+        "dtype": "float16",
+        "items": [{"id": item_id, "hash": h} for (item_id, _), h in zip(items, hashes)],
+    }
+    tmp_ids = cache_dir / "ids.json.tmp"
+    with open(tmp_ids, 'w') as f:
+        json.dump(meta, f)
+    os.replace(tmp_vectors, cache_dir / "vectors.f16")
+    os.replace(tmp_ids, cache_dir / "ids.json")
+
+def build_embeddings(processed_dir, cache_dir, embedder, max_batch_tokens=MAX_BATCH_TOKENS):
+    """Embed new/changed items and rewrite the cache; returns stats"""
+    items = corpus_items(processed_dir)
+    hashes = [text_hash(embedder.model_id, text) for _, text in items]
+
+    old_meta, old_matrix = load_cache(cache_dir)
+    old_rows = {}
+    if old_meta and old_meta["model"] == embedder.model_id and old_matrix is not None:
+        old_rows = {item["hash"]: row for row, item in enumerate(old_meta["items"])}
+
+    vectors = np.zeros((len(items), embedder.dim), dtype=np.float16)
+    todo = []
+    for row, h in enumerate(hashes):
+        if h in old_rows:
+            vectors[row] = old_matrix[old_rows[h]]
+        else:
+            todo.append(row)
+
+    texts = [items[row][1] for row in todo]
+    started = time.monotonic()
+    batches = length_batches(texts, max_batch_tokens)
+    for n, batch in enumerate(batches, 1):
+        encoded = embedder.encode([texts[i] for i in batch])
+        for i, vector in zip(batch, encoded):
+            vectors[todo[i]] = vector.astype(np.float16)
+        print(f"  Batch {n}/{len(batches)}: {len(batch)} texts")
+    elapsed = time.monotonic() - started
+
+    write_cache(cache_dir, embedder.model_id, embedder.dim, items, hashes, vectors)
+    return {
+        "items": len(items),
+        "embedded": len(todo),
+        "reused": len(items) - len(todo),
+        "batches": len(batches),
+        "seconds": elapsed,
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Embed story text into a memory-mapped cache")
+    parser.add_argument("--source", type=Path, default=PROCESSED_DIR,
+                        help=f"Processed stories directory (default: {PROCESSED_DIR})")
+    parser.add_argument("--cache", type=Path, default=CACHE_DIR,
+                        help=f"Embedding cache directory (default: {CACHE_DIR})")
+    parser.add_argument("--model", default=BGE_MODEL,
+                        help=f"Model name, or 'hashing' for the stand-in (default: {BGE_MODEL})")
+    parser.add_argument("--threads", type=int, default=os.cpu_count(),
+                        help="CPU threads for inference (default: all cores)")
+    parser.add_argument("--max-batch-tokens", type=int, default=MAX_BATCH_TOKENS,
+                        help=f"Padded token budget per batch (default: {MAX_BATCH_TOKENS})")
+    args = parser.parse_args()
+
+    print("=== Embedding Stories ===")
+    print(f"Source: {args.source}")
+    print(f"Cache: {args.cache}")
+
+    if not args.source.exists():
+        print(f"❌ Directory not found: {args.source}")
+        return 1
+
+    if args.model != "hashing":
+        try:
+            import torch
+            torch.set_num_threads(args.threads)
+        except ImportError:
+            pass
+
+    embedder = make_embedder(args.model)
+    print(f"Model: {embedder.model_id} ({embedder.dim} dims)\n")
+
+    stats = build_embeddings(args.source, args.cache, embedder, args.max_batch_tokens)
+
+    print(f"\n=== Embedding Complete ===")
+    print(f"Items: {stats['items']} (stories + pages)")
+    print(f"Embedded: {stats['embedded']} in {stats['batches']} batches ({stats['seconds']:.1f}s)")
+    print(f"Reused from cache: {stats['reused']}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,230 @@
+"""
+Story Images - single-decode image pass for the story pipeline
+
+Each source PNG is read and decoded exactly once. From that one decoded
+image process_image() derives everything later stages need:
+
+- the WebP output (encoded in memory, hashed, then written)
+- dimensions
+- sha256 of the source and of the WebP bytes
+- a 64-bit dHash perceptual hash of the full-size image
+- optional thumbnails, each resized from the previous (largest first),
+  so no step touches the full-size image twice
+
+The WebP mode is picked per image from a cheap analysis of a downsampled
+copy (analyze()): exact color count, how much of the image its 256 most
+common colors cover, edge density and alpha usage.
+
+- lossless: at most 256 colors - flat illustrations encode exactly and
+  smaller than lossy, with no ringing around outlines or text
+- palette:  nearly flat (anti-aliased edges, light noise) or text-heavy -
+  quantized to 256 colors, then encoded losslessly
+- lossy:    everything else, at WEBP_QUALITY
+
+Each image is encoded once in the chosen mode. Only when the statistics
+sit within AMBIGUITY_MARGIN of a threshold (or the image has more colors
+than a flat illustration usually does) is the other candidate - lossy
+for lossless/palette, palette for lossy - encoded as well, and the
+smaller one kept. The encoding record says which happened ("decision":
+"analysis" = one encode, "compared" = two), and "baseline_bytes" holds the
+lossy size whenever a lossy encode was made, so savings can be reported.
+
+The returned record is stored in manifest.json under "images", so later
+stages (dedup, tagging, sync) can use the hashes and sizes instead of
+decoding the image again.
+
+Pillow is imported on first use, so image_size() works without it.
+"""
+
+import io
+import struct
+import hashlib
+from pathlib import Path
+
+WEBP_QUALITY = 85
+WEBP_METHOD = 4          # cwebp's default speed/size trade-off
+DHASH_SIZE = (9, 8)
+
+ANALYSIS_SIZE = 512      # Longest side of the copy analyze() looks at
+PALETTE_COVERAGE = 0.97  # Top-256 color coverage that makes an image "nearly flat"
+TEXT_COVERAGE = 0.90     # ...or this coverage with text-like edge density
+TEXT_EDGE_DENSITY = 0.12
+EDGE_THRESHOLD = 48      # FIND_EDGES response counted as an edge pixel
+AMBIGUITY_MARGIN = 0.02  # Coverage/edge density this close to a threshold is a toss-up
+FLAT_COLORS = 64         # Up to this many colors, lossless is not worth second-guessing
+
+def image_size(path):
+    """(width, height) from a PNG or WebP header without decoding, or None if unknown or truncated"""
+    with open(path, 'rb') as f:
+        header = f.read(30)
+    try:
+        return _header_size(header)
+    except struct.error:
+        return None
+
+def _header_size(header):
+    if header[:8] == b"\x89PNG\r\n\x1a\n":
+        return struct.unpack(">II", header[16:24])
+    if header[:4] != b"RIFF" or header[8:12] != b"WEBP":
+        return None
+    chunk = header[12:16]
+    if chunk == b"VP8 ":
+        width, height = struct.unpack("<HH", header[26:30])
+        return width & 0x3FFF, height & 0x3FFF
+    if chunk == b"VP8L":
+        bits = int.from_bytes(header[21:25], "little")
+        return (bits & 0x3FFF) + 1, ((bits >> 14) & 0x3FFF) + 1
+    if chunk == b"VP8X":
+        return int.from_bytes(header[24:27], "little") + 1, int.from_bytes(header[27:30], "little") + 1
+    return None
+
+def _pil():
+    try:
+        from PIL import Image
+    except ImportError:
+        raise RuntimeError("pillow not installed - install with: ../venv/bin/pip install pillow")
+    return Image
+
+def dhash(img):
+    """64-bit difference hash of a decoded image, as 16 hex digits"""
+    Image = _pil()
+    pixels = img.convert("L").resize(DHASH_SIZE, Image.Resampling.LANCZOS).tobytes()
+    width = DHASH_SIZE[0]
+    bits = 0
+    for y in range(DHASH_SIZE[1]):
+        row = pixels[y * width:(y + 1) * width]
+        for x in range(width - 1):
+            bits = (bits << 1) | (row[x + 1] > row[x])
+    return f"{bits:016x}"
+
+def encode_webp(img, quality=WEBP_QUALITY, lossless=False):
+    buffer = io.BytesIO()
+    if lossless:
+        img.save(buffer, "WEBP", lossless=True, method=WEBP_METHOD)
+    else:
+        img.save(buffer, "WEBP", quality=quality, method=WEBP_METHOD)
+    return buffer.getvalue()
+
+def analyze(img):
+    """Color, edge and alpha statistics of a decoded RGB/RGBA image"""
+    Image = _pil()
+    from PIL import ImageFilter
+
+    small = img
+    if max(img.size) > ANALYSIS_SIZE:
+        scale = ANALYSIS_SIZE / max(img.size)
+        # NEAREST keeps the original colors, so counts stay meaningful
+        small = img.resize((max(1, round(img.width * scale)), max(1, round(img.height * scale))),
+                           Image.Resampling.NEAREST)
+    pixels = small.width * small.height
+
+    alpha = "none"
+    if small.mode == "RGBA":
+        if small.getchannel("A").getextrema()[0] < 255:
+            histogram = small.getchannel("A").histogram()
+            alpha = "binary" if histogram[0] + histogram[255] == pixels else "graded"
+
+    full_colors = img.getcolors(maxcolors=256)
+    counts = sorted((n for n, _ in small.getcolors(maxcolors=pixels)), reverse=True)
+    edges = small.convert("L").filter(ImageFilter.FIND_EDGES).histogram()
+    return {
+        "colors": len(full_colors) if full_colors else None,
+        "top256_coverage": round(sum(counts[:256]) / pixels, 4),
+        "edge_density": round(sum(edges[EDGE_THRESHOLD:]) / pixels, 4),
+        "alpha": alpha,
+    }
+
+def choose_mode(stats):
+    """"lossless", "palette" or "lossy" for analyze() statistics"""
+    if stats["colors"] is not None:
+        return "lossless"
+    coverage = stats["top256_coverage"]
+    if coverage >= PALETTE_COVERAGE or (coverage >= TEXT_COVERAGE and stats["edge_density"] >= TEXT_EDGE_DENSITY):
+        return "palette"
+    return "lossy"
+
+def is_ambiguous(stats):
+    """True if the analysis is too close to call and both candidates should be encoded"""
+    if stats["colors"] is not None:
+        return stats["colors"] > FLAT_COLORS
+    coverage, edges = stats["top256_coverage"], stats["edge_density"]
+    near = lambda value, threshold: abs(value - threshold) < AMBIGUITY_MARGIN
+    if near(coverage, PALETTE_COVERAGE):
+        return True
+    # The text rule only matters while the other side of it is met
+    return ((near(coverage, TEXT_COVERAGE) and edges >= TEXT_EDGE_DENSITY - AMBIGUITY_MARGIN)
+            or (near(edges, TEXT_EDGE_DENSITY) and coverage >= TEXT_COVERAGE - AMBIGUITY_MARGIN))
+
+def encode_mode(img, mode, quality=WEBP_QUALITY):
+    """WebP bytes of `img` in one of the choose_mode() modes"""
+    Image = _pil()
+    if mode == "lossy":
+        return encode_webp(img, quality)
+    if mode == "palette":
+        img = img.quantize(256, method=Image.Quantize.FASTOCTREE, dither=Image.Dither.NONE).convert(img.mode)
+    return encode_webp(img, lossless=True)
+
+def encode_auto(img, quality=WEBP_QUALITY):
+    """(webp bytes, encoding record) using the content-aware mode"""
+    stats = analyze(img)
+    if stats["alpha"] == "none" and img.mode == "RGBA":
+        img = img.convert("RGB")
+    mode = choose_mode(stats)
+    webp = encode_mode(img, mode, quality)
+    record = {"mode": mode, "decision": "analysis", **stats}
+    if mode == "lossy":
+        record["baseline_bytes"] = len(webp)
+    if not is_ambiguous(stats):
+        return webp, record
+
+    other = "palette" if mode == "lossy" else "lossy"
+    alternative = encode_mode(img, other, quality)
+    record["decision"] = "compared"
+    record["baseline_bytes"] = len(webp) if mode == "lossy" else len(alternative)
+    if len(alternative) < len(webp):
+        return alternative, {**record, "mode": other, "rejected": mode}
+    return webp, {**record, "rejected": other}
+
+def process_image(src, dest, thumbnail_widths=(), quality=WEBP_QUALITY, mode="auto"):
+    """
+    Decode `src` once and write `dest` (WebP) plus thumbnails next to it
+    (thumb-<width>/<dest name>). Returns the manifest record. mode "auto"
+    picks the encoding per image; "lossy" always uses `quality`.
+    Thumbnails are always lossy.
+    """
+    Image = _pil()
+    src, dest = Path(src), Path(dest)
+    data = src.read_bytes()
+    with Image.open(io.BytesIO(data)) as img:
+        img.load()
+        if img.mode not in ("RGB", "RGBA"):
+            img = img.convert("RGBA" if "transparency" in img.info or img.mode in ("LA", "PA") else "RGB")
+
+        if mode == "auto":
+            webp, encoding = encode_auto(img, quality)
+        else:
+            webp, encoding = encode_webp(img, quality), {"mode": "lossy"}
+        dest.write_bytes(webp)
+        record = {
+            "source": src.name,
+            "source_sha256": hashlib.sha256(data).hexdigest(),
+            "width": img.width,
+            "height": img.height,
+            "webp_sha256": hashlib.sha256(webp).hexdigest(),
+            "webp_bytes": len(webp),
+            "encoding": encoding,
+            "thumbnails": {},
+            # From the full image, so it matches a dHash of the decoded WebP
+            "dhash": dhash(img),
+        }
+
+        # Cascade: each derivative is resized from the previous, smaller one
+        current = img
+        for width in sorted((w for w in thumbnail_widths if w < img.width), reverse=True):
+            height = max(1, round(img.height * width / img.width))
+            current = current.resize((width, height), Image.Resampling.LANCZOS, reducing_gap=2.0)
+            thumb_dir = dest.parent / f"thumb-{width}"
+            thumb_dir.mkdir(exist_ok=True)
+            (thumb_dir / dest.name).write_bytes(encode_webp(current, quality))
+            record["thumbnails"][str(width)] = f"thumb-{width}/{dest.name}"
+    return record
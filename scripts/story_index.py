@@ -0,0 +1,345 @@
+#!/usr/bin/env python3
+"""
+Story Index - Local vector search over story and page embeddings
+
+Serves "similar stories" and semantic search from the embedding cache
+written by story_embeddings.py, without a hosted model or database:
+
+- exact: brute-force cosine similarity (one matrix-vector product)
+- ivf:   inverted-file index - k-means centroids, only the `nprobe`
+         nearest lists are scanned
+
+Index layout (stories-tmp/index/):
+
+    vectors.f32    float32 [n, dim], append-only, memory-mapped
+    assign.i32     IVF list of each row, append-only, memory-mapped
+    centroids.npy  IVF centroids [nlist, dim]
+    meta.json      {"model", "dim", "rows": [{"id", "hash"}], "deleted": [row...]}
+
+Opening an index maps the files and sorts the list assignments - no vector
+data is read until a query touches it. sync() applies the current embedding
+cache incrementally: new or changed items are appended, removed or changed
+ones are tombstoned.
+
+Usage:
+    python3 story_index.py build                    # (re)build from the embedding cache
+    python3 story_index.py sync                     # apply cache changes incrementally
+    python3 story_index.py similar <slug> [-k 10]   # stories similar to a story
+    python3 story_index.py search "waiting in line" # semantic search (embeds the query)
+    python3 story_index.py bench --synthetic 50000  # QPS / p99 / recall@10 benchmark
+"""
+
+import sys
+import json
+import time
+import argparse
+from pathlib import Path
+
+try:
+    import numpy as np
+except ImportError:
+    print("Error: numpy not installed")
+    print("Install with: ../venv/bin/pip install numpy")
+    sys.exit(1)
+
+from story_embeddings import CACHE_DIR, load_cache, make_embedder
+
+INDEX_DIR = Path("stories-tmp/index")
+
+NPROBE = 8              # IVF lists scanned per query
+KMEANS_ITERATIONS = 15
+KMEANS_SAMPLE = 20000   # Rows used to train centroids
+
+def normalize(vectors):
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-12)
+
+def default_nlist(n):
+    """~sqrt(n) lists, at least 1"""
+    return max(1, int(np.sqrt(n)))
+
+def train_centroids(vectors, nlist, seed=0):
+    """Spherical k-means on a sample of rows"""
+    rng = np.random.default_rng(seed)
+    n = len(vectors)
+    sample = vectors[np.sort(rng.choice(n, size=min(n, KMEANS_SAMPLE), replace=False))]
+    sample = np.asarray(sample, dtype=np.float32)
+    centroids = sample[rng.choice(len(sample), size=min(nlist, len(sample)), replace=False)].copy()
+    for _ in range(KMEANS_ITERATIONS):
+        labels = np.argmax(sample @ centroids.T, axis=1)
+        for c in range(len(centroids)):
+            members = sample[labels == c]
+            if len(members):
+                centroids[c] = members.mean(axis=0)
+        centroids = normalize(centroids)
+    return centroids
+
+def top_k(scores, rows, k):
+    """Highest `k` scores (descending) and their row numbers"""
+    if len(scores) > k:
+        part = np.argpartition(-scores, k)[:k]
+        scores, rows = scores[part], rows[part]
+    order = np.argsort(-scores)
+    return scores[order], rows[order]
+
+class StoryIndex:
+    def __init__(self, index_dir=INDEX_DIR):
+        self.dir = Path(index_dir)
+        with open(self.dir / "meta.json") as f:
+            self.meta = json.load(f)
+        self.dim = self.meta["dim"]
+        self.rows = self.meta["rows"]
+        self.deleted = set(self.meta["deleted"])
+        self.centroids = np.load(self.dir / "centroids.npy")
+        self._map()
+
+    def _map(self):
+        n = len(self.rows)
+        self.vectors = (np.memmap(self.dir / "vectors.f32", dtype=np.float32, mode="r", shape=(n, self.dim))
+                        if n else np.zeros((0, self.dim), dtype=np.float32))
+        assign = (np.memmap(self.dir / "assign.i32", dtype=np.int32, mode="r", shape=(n,))
+                  if n else np.zeros(0, dtype=np.int32))
+        # Inverted lists: rows sorted by list, plus offsets into that order
+        self.list_order = np.argsort(assign, kind="stable").astype(np.int64)
+        self.list_offsets = np.searchsorted(assign[self.list_order], np.arange(len(self.centroids) + 1))
+        self.alive = np.ones(n, dtype=bool)
+        if self.deleted:
+            self.alive[list(self.deleted)] = False
+        self.row_of = {row["id"]: i for i, row in enumerate(self.rows) if i not in self.deleted}
+
+    @classmethod
+    def build(cls, index_dir, ids, hashes, vectors, model, nlist=None):
+        """Write a fresh index from (ids, hashes, vectors)"""
+        index_dir = Path(index_dir)
+        index_dir.mkdir(parents=True, exist_ok=True)
+        vectors = normalize(vectors)
+        centroids = (train_centroids(vectors, nlist or default_nlist(len(vectors)))
+                     if len(vectors) else np.zeros((1, vectors.shape[1]), dtype=np.float32))
+        assign = (np.argmax(vectors @ centroids.T, axis=1).astype(np.int32)
+                  if len(vectors) else np.zeros(0, dtype=np.int32))
+
+        vectors.tofile(index_dir / "vectors.f32")
+        assign.tofile(index_dir / "assign.i32")
+        np.save(index_dir / "centroids.npy", centroids)
+        meta = {
+            "model": model,
+            "dim": int(vectors.shape[1]),
+            "rows": [{"id": i, "hash": h} for i, h in zip(ids, hashes)],
+            "deleted": [],
+        }
+        with open(index_dir / "meta.json", 'w') as f:
+            json.dump(meta, f)
+        return cls(index_dir)
+
+    def save_meta(self):
+        self.meta["rows"] = self.rows
+        self.meta["deleted"] = sorted(self.deleted)
+        tmp = self.dir / "meta.json.tmp"
+        with open(tmp, 'w') as f:
+            json.dump(self.meta, f)
+        tmp.replace(self.dir / "meta.json")
+
+    def add(self, ids, hashes, vectors):
+        """Append items (replacing any live item with the same id)"""
+        vectors = normalize(vectors)
+        self.delete([i for i in ids if i in self.row_of], save=False)
+        assign = np.argmax(vectors @ self.centroids.T, axis=1).astype(np.int32)
+        with open(self.dir / "vectors.f32", 'ab') as f:
+            f.write(vectors.tobytes())
+        with open(self.dir / "assign.i32", 'ab') as f:
+            f.write(assign.tobytes())
+        self.rows.extend({"id": i, "hash": h} for i, h in zip(ids, hashes))
+        self.save_meta()
+        self._map()
+
+    def delete(self, ids, save=True):
+        """Tombstone items by id"""
+        for item_id in ids:
+            row = self.row_of.pop(item_id, None)
+            if row is not None:
+                self.deleted.add(row)
+                self.alive[row] = False
+        if save:
+            self.save_meta()
+
+    def sync(self, cache_dir=CACHE_DIR):
+        """Apply the embedding cache incrementally; returns (added, deleted)"""
+        cache_meta, cache_matrix = load_cache(cache_dir)
+        if cache_meta is None:
+            raise FileNotFoundError(f"No embedding cache in {cache_dir} - run story_embeddings.py first")
+        if cache_meta["model"] != self.meta["model"]:
+            raise ValueError(f"Cache model {cache_meta['model']} != index model {self.meta['model']}")
+        live = {self.rows[row]["id"]: self.rows[row]["hash"] for row in self.row_of.values()}
+        cached = {item["id"]: (n, item["hash"]) for n, item in enumerate(cache_meta["items"])}
+
+        removed = [i for i in live if i not in cached]
+        changed = [i for i, (_, h) in cached.items() if live.get(i) != h]
+        self.delete(removed, save=False)
+        if changed:
+            rows = [cached[i][0] for i in changed]
+            self.add(changed, [cached[i][1] for i in changed], cache_matrix[rows])
+        else:
+            self.save_meta()
+        return len(changed), len(removed)
+
+    def search_exact(self, query, k=10):
+        scores = self.vectors @ normalize(query)
+        rows = np.flatnonzero(self.alive)
+        return top_k(scores[rows], rows, k)
+
+    def search_ivf(self, query, k=10, nprobe=NPROBE):
+        query = normalize(query)
+        lists = np.argsort(-(self.centroids @ query))[:nprobe]
+        rows = np.concatenate([self.list_order[self.list_offsets[c]:self.list_offsets[c + 1]] for c in lists])
+        rows = rows[self.alive[rows]]
+        if not len(rows):
+            return np.zeros(0, dtype=np.float32), rows
+        rows.sort()   # sequential access into the memory map
+        return top_k(self.vectors[rows] @ query, rows, k)
+
+    def results(self, scores, rows):
+        return [(self.rows[row]["id"], float(score)) for score, row in zip(scores, rows)]
+
+    def similar(self, item_id, k=10, exact=False):
+        """Items most similar to an indexed item (the item itself excluded)"""
+        query = self.vectors[self.row_of[item_id]]
+        scores, rows = (self.search_exact(query, k + 1) if exact else self.search_ivf(query, k + 1))
+        return [r for r in self.results(scores, rows) if r[0] != item_id][:k]
+
+def build_from_cache(cache_dir=CACHE_DIR, index_dir=INDEX_DIR, nlist=None):
+    meta, matrix = load_cache(cache_dir)
+    if meta is None:
+        raise FileNotFoundError(f"No embedding cache in {cache_dir} - run story_embeddings.py first")
+    vectors = matrix if matrix is not None else np.zeros((0, meta["dim"]), dtype=np.float16)
+    return StoryIndex.build(index_dir, [i["id"] for i in meta["items"]],
+                            [i["hash"] for i in meta["items"]], vectors, meta["model"], nlist)
+
+def synthetic_vectors(n, dim, clusters=256, seed=0):
+    """Clustered unit vectors - closer to real embeddings than uniform noise"""
+    rng = np.random.default_rng(seed)
+    centers = normalize(rng.standard_normal((clusters, dim)))
+    labels = rng.integers(0, clusters, size=n)
+    return normalize(centers[labels] + rng.standard_normal((n, dim)) / np.sqrt(dim))
+
+def benchmark(index, queries, k=10, nprobe=NPROBE):
+    """QPS, p50/p99 latency and recall@k of IVF against exact search"""
+    results = {}
+    exact_rows = []
+    for name in ("exact", "ivf"):
+        latencies = []
+        hits = 0
+        for n, query in enumerate(queries):
+            started = time.perf_counter()
+            if name == "exact":
+                _, rows = index.search_exact(query, k)
+            else:
+                _, rows = index.search_ivf(query, k, nprobe)
+            latencies.append(time.perf_counter() - started)
+            if name == "exact":
+                exact_rows.append(set(rows.tolist()))
+            else:
+                hits += len(exact_rows[n] & set(rows.tolist()))
+        latencies = np.array(latencies) * 1000
+        results[name] = {
+            "qps": len(queries) / (latencies.sum() / 1000),
+            "p50_ms": float(np.percentile(latencies, 50)),
+            "p99_ms": float(np.percentile(latencies, 99)),
+            "recall": 1.0 if name == "exact" else hits / (k * len(queries)),
+        }
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description="Local vector index for story similarity search")
+    parser.add_argument("--index", type=Path, default=INDEX_DIR,
+                        help=f"Index directory (default: {INDEX_DIR})")
+    parser.add_argument("--cache", type=Path, default=CACHE_DIR,
+                        help=f"Embedding cache directory (default: {CACHE_DIR})")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    build = sub.add_parser("build", help="Build the index from the embedding cache")
+    build.add_argument("--nlist", type=int, help="IVF lists (default: sqrt(n))")
+    sub.add_parser("sync", help="Apply embedding cache changes incrementally")
+    similar = sub.add_parser("similar", help="Items similar to an indexed story or page")
+    similar.add_argument("id", help="Story slug, or slug#pN for a page")
+    similar.add_argument("-k", type=int, default=10)
+    similar.add_argument("--exact", action="store_true")
+    search = sub.add_parser("search", help="Semantic search for a text query")
+    search.add_argument("query")
+    search.add_argument("-k", type=int, default=10)
+    search.add_argument("--exact", action="store_true")
+    bench = sub.add_parser("bench", help="Benchmark exact vs IVF search")
+    bench.add_argument("--synthetic", type=int, metavar="N",
+                       help="Benchmark a synthetic N-vector index instead of --index")
+    bench.add_argument("--dim", type=int, default=1024, help="Synthetic vector size (default: 1024)")
+    bench.add_argument("--queries", type=int, default=500)
+    bench.add_argument("--nprobe", type=int, default=NPROBE)
+    args = parser.parse_args()
+
+    if args.command == "build":
+        started = time.monotonic()
+        try:
+            index = build_from_cache(args.cache, args.index, args.nlist)
+        except FileNotFoundError as e:
+            print(f"❌ {e}")
+            return 1
+        print(f"✓ Built index: {len(index.row_of)} items, {len(index.centroids)} lists "
+              f"({time.monotonic() - started:.1f}s) → {args.index}")
+        return 0
+
+    if args.command == "bench" and args.synthetic:
+        print(f"=== Index Benchmark: synthetic {args.synthetic:,} × {args.dim} ===")
+        vectors = synthetic_vectors(args.synthetic + args.queries, args.dim)
+        vectors, queries = vectors[:args.synthetic], vectors[args.synthetic:]
+        bench_dir = args.index.with_name(args.index.name + "-bench")
+        started = time.monotonic()
+        StoryIndex.build(bench_dir, [str(i) for i in range(len(vectors))],
+                         [""] * len(vectors), vectors, "synthetic")
+        print(f"Build: {time.monotonic() - started:.1f}s")
+        index_dir = bench_dir
+    else:
+        index_dir = args.index
+        queries = None
+
+    started = time.perf_counter()
+    index = StoryIndex(index_dir)
+    print(f"Open: {(time.perf_counter() - started) * 1000:.1f} ms ({len(index.row_of)} items)")
+
+    if args.command == "sync":
+        try:
+            added, deleted = index.sync(args.cache)
+        except (FileNotFoundError, ValueError) as e:
+            print(f"❌ {e}")
+            return 1
+        print(f"✓ Synced: {added} added/updated, {deleted} deleted")
+        return 0
+
+    if args.command == "similar":
+        if args.id not in index.row_of:
+            print(f"❌ Not in index: {args.id}")
+            return 1
+        for item_id, score in index.similar(args.id, args.k, args.exact):
+            print(f"  {score:.3f}  {item_id}")
+        return 0
+
+    if args.command == "search":
+        embedder = make_embedder("hashing" if index.meta["model"].startswith("hashing") else index.meta["model"])
+        query = embedder.encode([args.query])[0]
+        scores, rows = index.search_exact(query, args.k) if args.exact else index.search_ivf(query, args.k)
+        for item_id, score in index.results(scores, rows):
+            print(f"  {score:.3f}  {item_id}")
+        return 0
+
+    if args.command == "bench":
+        if queries is None:
+            rng = np.random.default_rng(1)
+            live = np.flatnonzero(index.alive)
+            queries = index.vectors[rng.choice(live, size=min(args.queries, len(live)), replace=False)]
+        results = benchmark(index, queries, nprobe=args.nprobe)
+        print(f"\n{'mode':<8}{'QPS':>10}{'p50 ms':>10}{'p99 ms':>10}{'recall@10':>12}")
+        for name, r in results.items():
+            print(f"{name:<8}{r['qps']:>10.0f}{r['p50_ms']:>10.2f}{r['p99_ms']:>10.2f}{r['recall']:>12.3f}")
+        return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,444 @@
+#!/usr/bin/env python3
+"""
+Story Queue - Shared lease queue for multi-host story ingest
+
+Several machines mounting the same stories-tmp volume run
+`batch-process-stories.py --worker`; this module is the queue they share:
+a SQLite table (stories-tmp/ingest-queue.db) of story folders with leases.
+
+    pending ──claim──▶ leased ──complete──▶ done
+                         │  ▲
+           lease expires │  │ heartbeat extends the lease
+                         ▼  │
+                       (reclaimable) ──after MAX_ATTEMPTS──▶ failed
+
+- claim() takes the next pending job, or one whose lease expired (a host
+  that died or stalled), under BEGIN IMMEDIATE so two hosts never get the
+  same lease. Each claim gets a fresh lease token.
+- While a job runs, a heartbeat thread extends the lease every
+  LEASE_SECONDS / 3; if the heartbeat finds the lease gone it stops. A lease
+  past lease_expires is lost even before another worker claims it.
+- Each job gets JOB_DEADLINE_SECONDS. Past it the heartbeat stops renewing
+  and the worker abandons the job (released as a failed attempt), so a hung
+  handler cannot hold its lease forever.
+- Workers build output in a private staging directory. complete() checks
+  the token and renames staging into place inside the same write
+  transaction, so exactly one lease holder publishes a story and marks it
+  done; a worker whose lease was reclaimed discards its output.
+
+The database uses SQLite's rollback journal (journal_mode=DELETE), not WAL:
+WAL keeps its index in shared memory, which only works between processes
+on one machine, so hosts on a shared volume would read inconsistent
+snapshots. The rollback journal relies on file locks alone, so the volume
+must provide POSIX advisory locks that are coherent across every host
+(local disk, or e.g. NFSv4 with locking enabled - many NFS and SMB setups
+do not, and then two hosts can claim the same job). simulate runs every
+host on one machine and cannot detect a volume without working locks.
+
+Usage:
+    python3 story_queue.py status
+    python3 story_queue.py reset-failed
+    python3 story_queue.py simulate --hosts 4 --stories 60 --crash-rate 0.1
+"""
+
+import os
+import sys
+import time
+import uuid
+import shutil
+import random
+import signal
+import socket
+import sqlite3
+import argparse
+import threading
+import multiprocessing
+from pathlib import Path
+
+QUEUE_FILE = Path("stories-tmp/ingest-queue.db")
+STAGING_DIR = Path("stories-tmp/.staging")
+
+LEASE_SECONDS = 120
+JOB_DEADLINE_SECONDS = 3600
+MAX_ATTEMPTS = 3
+POLL_SECONDS = 2
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    slug            TEXT PRIMARY KEY,
+    source          TEXT NOT NULL,
+    state           TEXT NOT NULL DEFAULT 'pending',    -- pending | leased | done | failed
+    owner           TEXT,
+    lease_token     TEXT,
+    lease_expires   REAL,
+    attempts        INTEGER NOT NULL DEFAULT 0,
+    completions     INTEGER NOT NULL DEFAULT 0,
+    error           TEXT,
+    enqueued_at     REAL NOT NULL,
+    finished_at     REAL
+);
+CREATE INDEX IF NOT EXISTS jobs_state ON jobs(state, lease_expires);
+"""
+
+def worker_name():
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+class LeaseLost(Exception):
+    """The job's lease expired and was claimed by another worker"""
+
+class StoryQueue:
+    def __init__(self, path=QUEUE_FILE, lease_seconds=LEASE_SECONDS):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.lease_seconds = lease_seconds
+        # Autocommit mode; transactions are opened explicitly with BEGIN IMMEDIATE
+        self.conn = sqlite3.connect(self.path, timeout=60, isolation_level=None, check_same_thread=False)
+        self.lock = threading.Lock()
+        # Rollback journal: WAL needs shared memory and breaks across hosts
+        self.conn.execute("PRAGMA journal_mode=DELETE")
+        self.conn.executescript(SCHEMA)
+
+    def _write(self, fn):
+        """Run fn(conn) in one IMMEDIATE transaction"""
+        with self.lock:
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                result = fn(self.conn)
+                self.conn.execute("COMMIT")
+                return result
+            except BaseException:
+                self.conn.execute("ROLLBACK")
+                raise
+
+    def enqueue(self, jobs):
+        """Add (slug, source path) pairs not already queued; returns count added"""
+        now = time.time()
+        def insert(conn):
+            before = conn.total_changes
+            conn.executemany(
+                "INSERT OR IGNORE INTO jobs (slug, source, enqueued_at) VALUES (?, ?, ?)",
+                [(slug, str(source), now) for slug, source in jobs],
+            )
+            return conn.total_changes - before
+        return self._write(insert)
+
+    def claim(self, owner):
+        """Lease the next runnable job: (slug, source, token) or None"""
+        def take(conn):
+            now = time.time()
+            row = conn.execute(
+                "SELECT slug, source FROM jobs "
+                "WHERE (state = 'pending' OR (state = 'leased' AND lease_expires < ?)) "
+                "AND attempts < ? ORDER BY state = 'leased', slug LIMIT 1",
+                (now, MAX_ATTEMPTS),
+            ).fetchone()
+            if row is None:
+                # Expired leases that ran out of attempts are failed for good
+                conn.execute(
+                    "UPDATE jobs SET state = 'failed', error = COALESCE(error, 'lease expired') "
+                    "WHERE state = 'leased' AND lease_expires < ? AND attempts >= ?",
+                    (now, MAX_ATTEMPTS),
+                )
+                return None
+            token = uuid.uuid4().hex
+            conn.execute(
+                "UPDATE jobs SET state = 'leased', owner = ?, lease_token = ?, lease_expires = ?, "
+                "attempts = attempts + 1 WHERE slug = ?",
+                (owner, token, now + self.lease_seconds, row[0]),
+            )
+            return row[0], row[1], token
+        return self._write(take)
+
+    def heartbeat(self, slug, token):
+        """Extend a lease; False if it was lost or had already expired"""
+        def extend(conn):
+            now = time.time()
+            return conn.execute(
+                "UPDATE jobs SET lease_expires = ? WHERE slug = ? AND lease_token = ? AND state = 'leased' "
+                "AND lease_expires >= ?",
+                (now + self.lease_seconds, slug, token, now),
+            ).rowcount == 1
+        return self._write(extend)
+
+    def complete(self, slug, token, publish=None):
+        """
+        Mark a job done if `token` still holds an unexpired lease, calling
+        publish() inside the same transaction. Raises LeaseLost otherwise.
+        """
+        def finish(conn):
+            held = conn.execute(
+                "SELECT 1 FROM jobs WHERE slug = ? AND lease_token = ? AND state = 'leased' "
+                "AND lease_expires >= ?",
+                (slug, token, time.time()),
+            ).fetchone()
+            if not held:
+                raise LeaseLost(slug)
+            if publish:
+                publish()
+            conn.execute(
+                "UPDATE jobs SET state = 'done', completions = completions + 1, lease_token = NULL, "
+                "error = NULL, finished_at = ? WHERE slug = ?",
+                (time.time(), slug),
+            )
+        self._write(finish)
+
+    def fail(self, slug, token, error):
+        """Release a lease after an error; the job is retried until MAX_ATTEMPTS"""
+        def release(conn):
+            conn.execute(
+                "UPDATE jobs SET state = CASE WHEN attempts >= ? THEN 'failed' ELSE 'pending' END, "
+                "lease_token = NULL, error = ? WHERE slug = ? AND lease_token = ?",
+                (MAX_ATTEMPTS, str(error)[:2000], slug, token),
+            )
+        self._write(release)
+
+    def reset_failed(self):
+        return self._write(lambda conn: conn.execute(
+            "UPDATE jobs SET state = 'pending', attempts = 0, error = NULL WHERE state = 'failed'"
+        ).rowcount)
+
+    def counts(self):
+        with self.lock:
+            rows = self.conn.execute("SELECT state, COUNT(*) FROM jobs GROUP BY state").fetchall()
+        return {state: n for state, n in rows}
+
+    def drained(self):
+        """True when nothing is pending or leased"""
+        counts = self.counts()
+        return not counts.get("pending") and not counts.get("leased")
+
+class Heartbeat(threading.Thread):
+    """Keeps a lease alive while a job runs, for at most `deadline` seconds"""
+
+    def __init__(self, queue, slug, token, deadline=JOB_DEADLINE_SECONDS):
+        super().__init__(daemon=True)
+        self.queue, self.slug, self.token = queue, slug, token
+        self.expires = time.monotonic() + deadline
+        self.stopped = threading.Event()
+        self.lost = False
+        self.expired = False
+
+    def run(self):
+        while not self.stopped.wait(self.queue.lease_seconds / 3):
+            if time.monotonic() >= self.expires:
+                # Stop renewing; the lease runs out and the job can be reclaimed
+                self.expired = True
+                return
+            if not self.queue.heartbeat(self.slug, self.token):
+                self.lost = True
+                return
+
+    def stop(self):
+        self.stopped.set()
+        self.join()
+
+def publish_dir(staged, final):
+    """Replace `final` with `staged` (same filesystem, so the swap is two renames)"""
+    if final.exists():
+        old = final.with_name(f".{final.name}.old-{uuid.uuid4().hex[:8]}")
+        final.rename(old)
+        staged.rename(final)
+        shutil.rmtree(old, ignore_errors=True)
+    else:
+        final.parent.mkdir(parents=True, exist_ok=True)
+        staged.rename(final)
+
+def run_worker(queue, handler, output_dir, staging_dir=STAGING_DIR, owner=None, exit_when_drained=True,
+               on_published=None, on_failed=None, job_deadline=JOB_DEADLINE_SECONDS):
+    """
+    Claim and process jobs until the queue drains. handler(slug, source,
+    staging_parent) must write the story to staging_parent/<slug> and
+    return True on success. A handler still running after `job_deadline`
+    seconds is abandoned: its thread is left behind (Python cannot kill
+    it), the job is released as a failed attempt and its staging output is
+    discarded. on_published(slug) runs after a story is published and
+    on_failed(slug, source, error) after a failed or abandoned attempt.
+    Returns {"done", "failed", "lost", "abandoned"} counts.
+    """
+    owner = owner or worker_name()
+    stats = {"done": 0, "failed": 0, "lost": 0, "abandoned": 0}
+    while True:
+        job = queue.claim(owner)
+        if job is None:
+            if exit_when_drained and queue.drained():
+                return stats
+            time.sleep(POLL_SECONDS)
+            continue
+
+        slug, source, token = job
+        staging_parent = Path(staging_dir) / token
+        staging_parent.mkdir(parents=True, exist_ok=True)
+        heartbeat = Heartbeat(queue, slug, token, job_deadline)
+        heartbeat.start()
+        result = {}
+
+        def run_handler():
+            try:
+                result["ok"] = handler(slug, Path(source), staging_parent)
+            except Exception as e:
+                result["ok"], result["error"] = False, e
+
+        worker = threading.Thread(target=run_handler, daemon=True)
+        worker.start()
+        worker.join(job_deadline)
+        heartbeat.stop()
+        ok = result.get("ok", False)
+        error = result.get("error") or (None if ok else "stage failed")
+
+        try:
+            if worker.is_alive():
+                error = f"exceeded job deadline ({job_deadline:g}s)"
+                queue.fail(slug, token, error)
+                stats["abandoned"] += 1
+                if on_failed:
+                    on_failed(slug, Path(source), error)
+            elif ok and not heartbeat.lost:
+                queue.complete(slug, token, lambda: publish_dir(staging_parent / slug, Path(output_dir) / slug))
+                stats["done"] += 1
+                if on_published:
+                    on_published(slug)
+            elif heartbeat.lost:
+                raise LeaseLost(slug)
+            else:
+                queue.fail(slug, token, error)
+                stats["failed"] += 1
+                if on_failed:
+                    on_failed(slug, Path(source), error)
+        except LeaseLost:
+            stats["lost"] += 1
+        finally:
+            shutil.rmtree(staging_parent, ignore_errors=True)
+
+# --- Local multi-host simulation --------------------------------------------
+
+def _simulated_host(queue_path, output_dir, staging_dir, host, work_seconds, crash_rate, lease_seconds,
+                    job_deadline, incidents, seed):
+    """
+    One simulated host: sleeps to mimic work, and sometimes dies, freezes
+    (SIGSTOP, so the heartbeat stops too) or hangs in the handler mid-job.
+    Each incident is reported as (pid, slug, kind) before it happens.
+    """
+    rng = random.Random(seed)
+    queue = StoryQueue(queue_path, lease_seconds)
+
+    def handler(slug, source, staging_parent):
+        out = staging_parent / slug
+        out.mkdir(parents=True)
+        time.sleep(work_seconds * rng.uniform(0.5, 1.5))
+        roll = rng.random()
+        if roll < crash_rate:
+            kind = ("die", "freeze", "hang")[int(roll / crash_rate * 3)]
+            incidents.put((os.getpid(), slug, kind))
+            if kind == "die":
+                os._exit(1)                               # host dies holding the lease
+            if kind == "freeze":
+                os.kill(os.getpid(), signal.SIGSTOP)      # whole host stalls until SIGCONT
+            else:
+                threading.Event().wait()                  # handler hangs, heartbeat keeps running
+        (out / "manifest.json").write_text(f'{{"slug": "{slug}", "host": "{host}"}}')
+        return True
+
+    stats = run_worker(queue, handler, output_dir, staging_dir, owner=host, job_deadline=job_deadline)
+    print(f"  {host}: {stats}")
+
+def simulate(hosts, stories, work_seconds, crash_rate, lease_seconds, root):
+    """
+    Run `hosts` worker processes over a fresh queue; returns (elapsed, jobs,
+    problems). Frozen hosts are resumed after three lease lengths. A job is a
+    problem if it was not published exactly once, or if a host died, froze
+    or hung on it and it was never reclaimed.
+    """
+    root = Path(root)
+    shutil.rmtree(root, ignore_errors=True)
+    queue_path, output_dir, staging_dir = root / "queue.db", root / "processed", root / ".staging"
+    queue = StoryQueue(queue_path, lease_seconds)
+    queue.enqueue([(f"story-{n:04d}", root / "source" / f"story-{n:04d}") for n in range(stories)])
+    job_deadline = max(lease_seconds, work_seconds * 1.5) * 2
+    incidents = multiprocessing.SimpleQueue()
+    stalled = set()
+    frozen = {}                                           # pid -> time to send SIGCONT
+
+    started = time.monotonic()
+    alive = []
+    host_number = 0
+    # Replace hosts that crash, like a supervisor restarting a worker; a
+    # frozen host still looks alive, so it is not replaced
+    while not queue.drained():
+        while not incidents.empty():
+            pid, slug, kind = incidents.get()
+            stalled.add(slug)
+            if kind == "freeze":
+                frozen[pid] = time.monotonic() + lease_seconds * 3
+        for pid, resume_at in list(frozen.items()):
+            if time.monotonic() >= resume_at:
+                os.kill(pid, signal.SIGCONT)
+                del frozen[pid]
+        alive = [p for p in alive if p.is_alive()]
+        while len(alive) < hosts:
+            host_number += 1
+            p = multiprocessing.Process(target=_simulated_host, args=(
+                queue_path, output_dir, staging_dir, f"host-{host_number}", work_seconds,
+                crash_rate, lease_seconds, job_deadline, incidents, host_number))
+            p.start()
+            alive.append(p)
+        time.sleep(0.05)
+    for pid in frozen:
+        os.kill(pid, signal.SIGCONT)
+    for p in alive:
+        p.join()
+    elapsed = time.monotonic() - started
+
+    with queue.lock:
+        jobs = queue.conn.execute("SELECT slug, state, completions, attempts FROM jobs").fetchall()
+    published = {d.name for d in output_dir.iterdir() if not d.name.startswith(".")} if output_dir.exists() else set()
+    problems = [slug for slug, state, completions, attempts in jobs
+                if (state == "done") != (completions == 1 and slug in published) or completions > 1
+                or (slug in stalled and attempts < 2)]
+    return elapsed, jobs, problems
+
+def main():
+    parser = argparse.ArgumentParser(description="Shared ingest queue for multi-host processing")
+    parser.add_argument("--queue", type=Path, default=QUEUE_FILE,
+                        help=f"Queue database (default: {QUEUE_FILE})")
+    sub = parser.add_subparsers(dest="command", required=True)
+    sub.add_parser("status", help="Job counts by state")
+    sub.add_parser("reset-failed", help="Requeue failed jobs")
+    sim = sub.add_parser("simulate", help="Multi-process harness simulating several hosts")
+    sim.add_argument("--hosts", type=int, nargs="+", default=[1, 2, 4])
+    sim.add_argument("--stories", type=int, default=60)
+    sim.add_argument("--work-seconds", type=float, default=0.1, help="Mean time per story")
+    sim.add_argument("--crash-rate", type=float, default=0.05,
+                     help="Fraction of jobs whose host dies, freezes or hangs")
+    sim.add_argument("--lease-seconds", type=float, default=1.0)
+    sim.add_argument("--root", type=Path, default=Path("stories-tmp/queue-sim"))
+    args = parser.parse_args()
+
+    if args.command == "status":
+        queue = StoryQueue(args.queue)
+        for state, n in sorted(queue.counts().items()):
+            print(f"  {state:<8}{n:>6}")
+        return 0
+
+    if args.command == "reset-failed":
+        print(f"✓ Requeued {StoryQueue(args.queue).reset_failed()} failed jobs")
+        return 0
+
+    if args.command == "simulate":
+        print(f"=== Queue Simulation: {args.stories} stories, crash rate {args.crash_rate:.0%} ===")
+        results = []
+        for hosts in args.hosts:
+            print(f"\n{hosts} host(s):")
+            elapsed, jobs, problems = simulate(hosts, args.stories, args.work_seconds,
+                                               args.crash_rate, args.lease_seconds, args.root)
+            done = sum(1 for _, state, _, _ in jobs if state == "done")
+            retries = sum(attempts - 1 for _, _, _, attempts in jobs if attempts > 1)
+            results.append((hosts, elapsed, done, retries, problems))
+
+        print(f"\n{'hosts':<7}{'seconds':>9}{'stories/s':>11}{'done':>7}{'retries':>9}{'exactly-once':>14}")
+        for hosts, elapsed, done, retries, problems in results:
+            print(f"{hosts:<7}{elapsed:>9.1f}{done / elapsed:>11.1f}{done:>7}{retries:>9}"
+                  f"{'✓' if not problems else '✗ ' + str(len(problems)):>14}")
+        return 0 if all(not r[4] for r in results) else 1
+
+if __name__ == "__main__":
+    sys.exit(main())
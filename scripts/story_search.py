@@ -0,0 +1,440 @@
+#!/usr/bin/env python3
+"""
+Story Search - Incremental BM25 full-text index over story pages
+
+Indexes every page of stories-tmp/processed/*/story.json as one document
+("slug#pN") with three fields - story title, page content, coaching note -
+scored with BM25F (per-field length normalisation and weights).
+
+On-disk layout (stories-tmp/search/):
+
+    segments.json            {"segments": [...], "deleted": {segment: [[start, end], ...]}}
+    stories.json             {slug: {"sha256", "segment", "docs": [start, end]}}  (writer only)
+    seg-000001/
+        segment.json         {"docs", "terms", "length_sums"}
+        terms.u64            sorted 64-bit term hashes
+        term_meta.i64        [offset, nbytes, df] per term
+        postings.bin         per term: doc-id deltas, then title/content/coaching
+                             term frequencies, each a block of varints
+        lengths.u16          [docs, 3] field lengths in tokens
+        docs.txt, docs.off   doc ids and their byte offsets
+
+Everything but the two small JSON files is memory-mapped, so opening the
+index reads almost nothing. An update hashes each story.json, writes the new
+or changed stories to a fresh segment and tombstones their old documents;
+once there are more than MAX_SEGMENTS segments they are merged by
+re-indexing their live stories. Document frequencies include tombstoned
+documents until the next merge, as in most segment-based engines.
+
+Usage:
+    python3 story_search.py update                       # index new/changed stories
+    python3 story_search.py search "waiting for a turn"  # top pages
+    python3 story_search.py merge                        # merge all segments
+    python3 story_search.py bench --stories 50000        # synthetic latency benchmark
+"""
+
+import os
+import re
+import sys
+import json
+import time
+import shutil
+import random
+import hashlib
+import argparse
+from pathlib import Path
+from collections import Counter
+
+try:
+    import numpy as np
+except ImportError:
+    print("Error: numpy not installed")
+    print("Install with: ../venv/bin/pip install numpy")
+    sys.exit(1)
+
+PROCESSED_DIR = Path("stories-tmp/processed")
+INDEX_DIR = Path("stories-tmp/search")
+
+FIELDS = ("title", "content", "coaching")
+FIELD_WEIGHTS = np.array([2.0, 1.0, 0.5])
+K1 = 1.2
+B = 0.75
+MAX_SEGMENTS = 8
+
+STOPWORDS = frozenset(
+    "a an and are as at be but by for from has have he her his i in is it its "
+    "me my of on or our she so that the their them they this to was we were "
+    "will with you your".split()
+)
+
+def tokenize(text):
+    return [t for t in re.findall(r"\w+", text.casefold()) if t not in STOPWORDS]
+
+def term_hash(term):
+    return int.from_bytes(hashlib.blake2b(term.encode("utf-8"), digest_size=8).digest(), "little")
+
+def varint_encode(values):
+    """Unsigned LEB128 encoding of a non-negative int array"""
+    values = np.asarray(values, dtype=np.uint64)
+    if not len(values):
+        return b""
+    nbytes = np.ones(len(values), dtype=np.int64)
+    for k in range(1, 10):
+        nbytes += values >= (np.uint64(1) << np.uint64(7 * k))
+    width = int(nbytes.max())
+    shifts = (np.arange(width, dtype=np.uint64) * np.uint64(7))
+    groups = ((values[:, None] >> shifts) & np.uint64(0x7F)).astype(np.uint8)
+    more = np.arange(width)[None, :] < (nbytes[:, None] - 1)
+    groups |= (more * 0x80).astype(np.uint8)
+    return groups[np.arange(width)[None, :] < nbytes[:, None]].tobytes()
+
+def varint_decode(buf):
+    """Inverse of varint_encode"""
+    data = np.frombuffer(buf, dtype=np.uint8)
+    last = data < 0x80
+    if last.all():
+        return data.astype(np.int64)
+    # Byte position within its value, then sum the shifted 7-bit groups per value
+    starts = np.concatenate(([0], np.flatnonzero(last)[:-1] + 1))
+    value_of = np.concatenate(([0], np.cumsum(last[:-1])))
+    position = np.arange(len(data)) - starts[value_of]
+    groups = (data & 0x7F).astype(np.int64) << (7 * position)
+    return np.add.reduceat(groups, starts)
+
+def story_docs(story_dir):
+    """(doc id, [title, content, coaching] tokens) for each page of a story"""
+    with open(story_dir / "story.json", 'r', encoding='utf-8') as f:
+        story = json.load(f)
+    title = tokenize(story["title"])
+    return [
+        (f"{story_dir.name}#p{page['number']}", [title, tokenize(page["content"]), tokenize(page["coaching"])])
+        for page in story["pages"]
+    ]
+
+def write_segment(seg_dir, docs):
+    """Write one segment from an iterable of (doc id, [field tokens, ...])"""
+    seg_dir.mkdir(parents=True)
+    postings = {}
+    lengths = []
+    doc_ids = []
+    for doc, (doc_id, fields) in enumerate(docs):
+        doc_ids.append(doc_id)
+        lengths.append([min(len(tokens), 65535) for tokens in fields])
+        for f, tokens in enumerate(fields):
+            for term, tf in Counter(tokens).items():
+                entry = postings.get(term)
+                if entry is None or entry[0][-1] != doc:
+                    entry = postings.setdefault(term, ([], [], [], []))
+                    entry[0].append(doc)
+                    for column in entry[1:]:
+                        column.append(0)
+                entry[f + 1][-1] = tf
+
+    hashes = sorted((term_hash(term), term) for term in postings)
+    meta = np.zeros((len(hashes), 3), dtype=np.int64)
+    offset = 0
+    with open(seg_dir / "postings.bin", 'wb') as f:
+        for n, (_, term) in enumerate(hashes):
+            docs_col, *tf_cols = postings[term]
+            deltas = np.diff(np.asarray(docs_col, dtype=np.int64), prepend=0)
+            blob = varint_encode(deltas) + b"".join(varint_encode(col) for col in tf_cols)
+            f.write(blob)
+            meta[n] = (offset, len(blob), len(docs_col))
+            offset += len(blob)
+
+    np.array([h for h, _ in hashes], dtype=np.uint64).tofile(seg_dir / "terms.u64")
+    meta.tofile(seg_dir / "term_meta.i64")
+    lengths = np.array(lengths, dtype=np.uint16).reshape(-1, len(FIELDS))
+    lengths.tofile(seg_dir / "lengths.u16")
+
+    encoded = [doc_id.encode("utf-8") for doc_id in doc_ids]
+    (seg_dir / "docs.txt").write_bytes(b"".join(encoded))
+    np.cumsum([0] + [len(e) for e in encoded], dtype=np.int64).tofile(seg_dir / "docs.off")
+
+    with open(seg_dir / "segment.json", 'w') as f:
+        json.dump({
+            "docs": len(doc_ids),
+            "terms": len(hashes),
+            "length_sums": lengths.sum(axis=0, dtype=np.int64).tolist(),
+        }, f)
+    return len(doc_ids)
+
+def mmap_array(path, dtype, shape):
+    if not shape[0]:
+        return np.zeros(shape, dtype=dtype)
+    return np.memmap(path, dtype=dtype, mode="r", shape=shape)
+
+class Segment:
+    def __init__(self, seg_dir, deleted_ranges):
+        with open(seg_dir / "segment.json") as f:
+            self.meta = json.load(f)
+        n, m = self.meta["docs"], self.meta["terms"]
+        self.terms = mmap_array(seg_dir / "terms.u64", np.uint64, (m,))
+        self.term_meta = mmap_array(seg_dir / "term_meta.i64", np.int64, (m, 3))
+        self.postings = mmap_array(seg_dir / "postings.bin", np.uint8, (int(self.term_meta[-1, :2].sum()) if m else 0,))
+        self.lengths = mmap_array(seg_dir / "lengths.u16", np.uint16, (n, len(FIELDS)))
+        self.doc_text = mmap_array(seg_dir / "docs.txt", np.uint8, ((seg_dir / "docs.txt").stat().st_size,))
+        self.doc_offsets = mmap_array(seg_dir / "docs.off", np.int64, (n + 1,))
+        self.alive = np.ones(n, dtype=bool)
+        for start, end in deleted_ranges:
+            self.alive[start:end] = False
+        self.norms = None
+
+    def field_norms(self, avg_lengths):
+        """Per-document field weight / BM25 length normalisation, computed on first use"""
+        if self.norms is None:
+            self.norms = (FIELD_WEIGHTS / (1 - B + B * self.lengths / avg_lengths)).astype(np.float32)
+        return self.norms
+
+    def lookup(self, term):
+        """(df, offset, nbytes) of a term, or None"""
+        h = np.uint64(term_hash(term))
+        i = int(np.searchsorted(self.terms, h))
+        if i < len(self.terms) and self.terms[i] == h:
+            offset, nbytes, df = self.term_meta[i]
+            return int(df), int(offset), int(nbytes)
+        return None
+
+    def read_postings(self, entry):
+        """(doc numbers, [docs, fields] term frequencies)"""
+        df, offset, nbytes = entry
+        values = varint_decode(self.postings[offset:offset + nbytes].tobytes())
+        docs = np.cumsum(values[:df])
+        return docs, values[df:].reshape(len(FIELDS), df).T
+
+    def doc_id(self, doc):
+        return self.doc_text[self.doc_offsets[doc]:self.doc_offsets[doc + 1]].tobytes().decode("utf-8")
+
+class SearchIndex:
+    """Memory-mapped reader over all segments"""
+
+    def __init__(self, index_dir=INDEX_DIR):
+        self.dir = Path(index_dir)
+        with open(self.dir / "segments.json") as f:
+            manifest = json.load(f)
+        self.segments = [Segment(self.dir / name, manifest["deleted"].get(name, []))
+                         for name in manifest["segments"]]
+        self.docs = sum(s.meta["docs"] for s in self.segments)
+        sums = np.sum([s.meta["length_sums"] for s in self.segments], axis=0) if self.segments else np.zeros(len(FIELDS))
+        self.avg_lengths = np.maximum(sums / max(self.docs, 1), 1.0)
+
+    def search(self, query, k=10):
+        """Top-k (doc id, score) by BM25F"""
+        terms = list(dict.fromkeys(tokenize(query)))
+        entries = [[s.lookup(t) for t in terms] for s in self.segments]
+        hits = []
+        for t in range(len(terms)):
+            df = sum(e[t][0] for e in entries if e[t])
+            if not df:
+                continue
+            idf = np.log(1 + (self.docs - df + 0.5) / (df + 0.5))
+            for segment, seg_entries in zip(self.segments, entries):
+                if seg_entries[t]:
+                    docs, tfs = segment.read_postings(seg_entries[t])
+                    tf = (tfs * segment.field_norms(self.avg_lengths)[docs]).sum(axis=1)
+                    hits.append((segment, docs, idf * tf * (K1 + 1) / (tf + K1)))
+
+        results = []
+        for segment in self.segments:
+            parts = [(docs, scores) for s, docs, scores in hits if s is segment]
+            if not parts:
+                continue
+            docs = np.concatenate([d for d, _ in parts])
+            weights = np.concatenate([s for _, s in parts])
+            if len(parts) == 1:
+                candidates, scores = docs, weights
+            elif len(docs) * 8 < len(segment.alive):
+                # Few hits: accumulate over the matched docs only
+                candidates, inverse = np.unique(docs, return_inverse=True)
+                scores = np.bincount(inverse, weights=weights)
+            else:
+                scores = np.bincount(docs, weights=weights, minlength=len(segment.alive))
+                candidates = np.arange(len(scores))
+            scores = np.where(segment.alive[candidates], scores, 0)
+            top = np.argpartition(-scores, min(k, len(scores) - 1))[:k]
+            results.extend((float(scores[i]), segment, int(candidates[i])) for i in top if scores[i] > 0)
+        results.sort(key=lambda r: -r[0])
+        return [(segment.doc_id(doc), score) for score, segment, doc in results[:k]]
+
+def load_json(path, default):
+    if path.exists():
+        with open(path) as f:
+            return json.load(f)
+    return default
+
+def save_json(path, data):
+    tmp = path.with_name(path.name + ".tmp")
+    with open(tmp, 'w') as f:
+        json.dump(data, f)
+    os.replace(tmp, path)
+
+def next_segment_name(manifest):
+    numbers = [int(name.split("-")[1]) for name in manifest["segments"]]
+    return f"seg-{max(numbers, default=0) + 1:06d}"
+
+def add_segment(index_dir, manifest, stories, slugs, story_dirs):
+    """Index `slugs` into a new segment, tombstoning their previous documents"""
+    for slug in slugs:
+        old = stories.get(slug)
+        if old:
+            manifest["deleted"].setdefault(old["segment"], []).append(old["docs"])
+    name = next_segment_name(manifest)
+    docs = []
+    ranges = {}
+    for slug in slugs:
+        start = len(docs)
+        docs.extend(story_docs(story_dirs[slug][0]))
+        ranges[slug] = [start, len(docs)]
+    write_segment(index_dir / name, docs)
+    manifest["segments"].append(name)
+    for slug in slugs:
+        stories[slug] = {"sha256": story_dirs[slug][1], "segment": name, "docs": ranges[slug]}
+
+def drop_dead_segments(manifest, stories):
+    """Unlist segments with no live documents; returns their names for deletion"""
+    live = {entry["segment"] for entry in stories.values()}
+    dead = [n for n in manifest["segments"] if n not in live]
+    for name in dead:
+        manifest["segments"].remove(name)
+        manifest["deleted"].pop(name, None)
+    return dead
+
+def update_index(processed_dir, index_dir=INDEX_DIR, merge=False):
+    """Apply new/changed/removed stories; returns (changed, removed, segments)"""
+    index_dir = Path(index_dir)
+    index_dir.mkdir(parents=True, exist_ok=True)
+    manifest = load_json(index_dir / "segments.json", {"segments": [], "deleted": {}})
+    stories = load_json(index_dir / "stories.json", {})
+
+    # slug → (story dir, story.json sha256)
+    story_dirs = {
+        d.name: (d, hashlib.sha256((d / "story.json").read_bytes()).hexdigest())
+        for d in sorted(processed_dir.iterdir()) if (d / "story.json").exists()
+    }
+
+    changed = [slug for slug, (_, sha256) in story_dirs.items()
+               if stories.get(slug, {}).get("sha256") != sha256]
+    removed = [slug for slug in stories if slug not in story_dirs]
+    for slug in removed:
+        old = stories.pop(slug)
+        manifest["deleted"].setdefault(old["segment"], []).append(old["docs"])
+
+    if changed:
+        add_segment(index_dir, manifest, stories, changed, story_dirs)
+    if merge or len(manifest["segments"]) > MAX_SEGMENTS:
+        add_segment(index_dir, manifest, stories, sorted(stories), story_dirs)
+    dead = drop_dead_segments(manifest, stories)
+
+    # Segment files first, then the manifest that makes them visible, and only
+    # then remove the segments it no longer references
+    save_json(index_dir / "stories.json", stories)
+    save_json(index_dir / "segments.json", manifest)
+    for name in dead:
+        shutil.rmtree(index_dir / name, ignore_errors=True)
+    return changed, removed, len(manifest["segments"])
+
+SYLLABLES = ["ba", "ki", "lo", "me", "nu", "ra", "so", "ti", "ve", "zu", "da", "fo", "ga", "pi"]
+
+def synthetic_docs(stories, pages, words, vocabulary=50000, seed=0):
+    """
+    Zipf-distributed pages: (doc id, [title, content, coaching] tokens).
+    The 100 most frequent ranks are left out - in real text those are
+    stopwords, which tokenize() drops.
+    """
+    rng = np.random.default_rng(seed)
+    vocab_rng = random.Random(0)    # Same vocabulary for every seed
+    vocab = ["".join(vocab_rng.choice(SYLLABLES) for _ in range(vocab_rng.randint(2, 4))) + str(i)
+             for i in range(vocabulary)]
+    vocab = np.array(vocab)
+    weights = 1.0 / np.arange(101, vocabulary + 101)
+    cdf = np.cumsum(weights / weights.sum())
+
+    def draw(n):
+        ranks = np.minimum(np.searchsorted(cdf, rng.random(n)), vocabulary - 1)
+        return vocab[ranks].tolist()
+
+    for s in range(stories):
+        title = draw(4)
+        for p in range(1, pages + 1):
+            yield f"story-{s}#p{p}", [title, draw(words), draw(words // 3)]
+
+def benchmark(index, queries, k=10):
+    latencies = []
+    for query in queries:
+        started = time.perf_counter()
+        index.search(query, k)
+        latencies.append((time.perf_counter() - started) * 1000)
+    latencies = np.array(latencies)
+    return {
+        "qps": len(queries) / (latencies.sum() / 1000),
+        "p50_ms": float(np.percentile(latencies, 50)),
+        "p99_ms": float(np.percentile(latencies, 99)),
+        "max_ms": float(latencies.max()),
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="BM25 full-text index over story pages")
+    parser.add_argument("--source", type=Path, default=PROCESSED_DIR,
+                        help=f"Processed stories directory (default: {PROCESSED_DIR})")
+    parser.add_argument("--index", type=Path, default=INDEX_DIR,
+                        help=f"Index directory (default: {INDEX_DIR})")
+    sub = parser.add_subparsers(dest="command", required=True)
+    sub.add_parser("update", help="Index new, changed and removed stories")
+    sub.add_parser("merge", help="Merge all segments into one")
+    search = sub.add_parser("search", help="Search page text")
+    search.add_argument("query")
+    search.add_argument("-k", type=int, default=10)
+    bench = sub.add_parser("bench", help="Query latency on a synthetic corpus")
+    bench.add_argument("--stories", type=int, default=50000)
+    bench.add_argument("--pages", type=int, default=8, help="Pages per story (default: 8)")
+    bench.add_argument("--words", type=int, default=40, help="Content words per page (default: 40)")
+    bench.add_argument("--queries", type=int, default=1000)
+    args = parser.parse_args()
+
+    if args.command in ("update", "merge"):
+        if not args.source.exists():
+            print(f"❌ Directory not found: {args.source}")
+            return 1
+        started = time.monotonic()
+        changed, removed, segments = update_index(args.source, args.index, merge=args.command == "merge")
+        print(f"✓ Indexed {len(changed)} changed stories, removed {len(removed)} "
+              f"({segments} segments, {time.monotonic() - started:.1f}s) → {args.index}")
+        return 0
+
+    if args.command == "search":
+        started = time.perf_counter()
+        index = SearchIndex(args.index)
+        results = index.search(args.query, args.k)
+        print(f"{len(results)} results ({(time.perf_counter() - started) * 1000:.1f} ms)")
+        for doc_id, score in results:
+            print(f"  {score:6.2f}  {doc_id}")
+        return 0
+
+    if args.command == "bench":
+        bench_dir = args.index.with_name(args.index.name + "-bench")
+        shutil.rmtree(bench_dir, ignore_errors=True)
+        bench_dir.mkdir(parents=True)
+        print(f"=== Search Benchmark: {args.stories:,} stories × {args.pages} pages ===")
+        started = time.monotonic()
+        docs = write_segment(bench_dir / "seg-000001",
+                             synthetic_docs(args.stories, args.pages, args.words))
+        save_json(bench_dir / "segments.json", {"segments": ["seg-000001"], "deleted": {}})
+        size = sum(p.stat().st_size for p in (bench_dir / "seg-000001").iterdir())
+        print(f"Build: {docs:,} docs in {time.monotonic() - started:.1f}s, {size / 1e6:.1f} MB")
+
+        started = time.perf_counter()
+        index = SearchIndex(bench_dir)
+        print(f"Open: {(time.perf_counter() - started) * 1000:.1f} ms")
+
+        sample = list(synthetic_docs(args.queries, 1, 12, seed=1))
+        results = {}
+        for terms in (1, 2, 4):
+            queries = [" ".join(fields[1][:terms]) for _, fields in sample]
+            results[f"{terms}-term"] = benchmark(index, queries)
+        print(f"\n{'query':<10}{'QPS':>10}{'p50 ms':>10}{'p99 ms':>10}{'max ms':>10}")
+        for name, r in results.items():
+            print(f"{name:<10}{r['qps']:>10.0f}{r['p50_ms']:>10.2f}{r['p99_ms']:>10.2f}{r['max_ms']:>10.2f}")
+        return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,307 @@
+#!/usr/bin/env python3
+"""
+Story Tagging - Batched local image auto-tagging for processed stories
+
+Many stories have no **Tags:** line, so story.json ends up with an empty
+tag list. This optional stage tags cover.webp and page-N.webp with a local
+vision-language model (Qwen2.5-VL via transformers, CPU) constrained to
+TAG_VOCABULARY, and records the result in each story's manifest.json:
+
+    "image_tags":     {"cover.webp": [...], "page-1.webp": [...]}
+    "suggested_tags": [...]    # most frequent image tags for the story
+
+Folders without a manifest.json have not been processed and are skipped.
+
+--apply copies suggested_tags into story.json for stories with no tags,
+and records the new tags in the story catalog (story_catalog.py).
+
+Images are sorted by pixel count and packed into batches under a pixel
+budget. Results are cached by (model id, image sha256) in
+stories-tmp/image-tags/cache.json, so each image is tagged once per model.
+
+--model standin uses a tiny deterministic tagger (no download, no torch)
+so the stage can be exercised and benchmarked on any Linux box.
+
+Usage:
+    python3 story_tagging.py                         # Qwen2.5-VL on CPU
+    python3 story_tagging.py --model standin         # stand-in model
+    python3 story_tagging.py --threads 4 --apply
+"""
+
+import os
+import re
+import sys
+import json
+import time
+import hashlib
+import argparse
+from pathlib import Path
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+from story_config import file_sha256
+from story_images import image_size
+from story_catalog import Catalog
+
+PROCESSED_DIR = Path("stories-tmp/processed")
+CACHE_FILE = Path("stories-tmp/image-tags/cache.json")
+
+QWEN_MODEL = "Qwen/Qwen2.5-VL-3B-Instruct"
+MAX_IMAGE_PIXELS = 448 * 448         # Images are downscaled to this before inference
+MAX_BATCH_PIXELS = 8 * 448 * 448     # Approximate pixel budget per batch
+MAX_TAGS = 5
+
+TAG_VOCABULARY = [
+    "Feelings", "Friendship", "Family", "School", "Sharing", "Kindness",
+    "Patience", "Bedtime", "Routines", "Safety", "Health", "Food",
+    "Animals", "Nature", "Play", "Sports", "Music", "Art",
+    "Holidays", "Community", "Transportation", "Doctor", "Growing Up", "Manners",
+]
+
+def story_images(story_dir):
+    """Cover then pages in order"""
+    images = []
+    cover = story_dir / "cover.webp"
+    if cover.exists():
+        images.append(cover)
+    pages = [p for p in story_dir.glob("page-*.webp") if p.stem[5:].isdigit()]
+    images.extend(sorted(pages, key=lambda p: int(p.stem[5:])))
+    return images
+
+def pixel_batches(pixels, max_batch_pixels):
+    """
+    Indices grouped into batches sorted by pixel count, so each batch
+    resizes to a similar size; a batch holds at most max_batch_pixels.
+    """
+    order = sorted(range(len(pixels)), key=lambda i: pixels[i])
+    batches = []
+    batch = []
+    used = 0
+    for i in order:
+        cost = min(pixels[i], MAX_IMAGE_PIXELS)
+        if batch and used + cost > max_batch_pixels:
+            batches.append(batch)
+            batch = []
+            used = 0
+        batch.append(i)
+        used += cost
+    if batch:
+        batches.append(batch)
+    return batches
+
+def parse_tags(text):
+    """Vocabulary tags mentioned in model output, in order, at most MAX_TAGS"""
+    known = {tag.casefold(): tag for tag in TAG_VOCABULARY}
+    tags = []
+    for part in re.split(r"[,\n;]", text):
+        tag = known.get(part.strip(" .-*\"'").casefold())
+        if tag and tag not in tags:
+            tags.append(tag)
+    return tags[:MAX_TAGS]
+
+class QwenTagger:
+    """Qwen2.5-VL on CPU via transformers"""
+
+    def __init__(self, model_name=QWEN_MODEL):
+        try:
+            import torch
+            from PIL import Image
+            from transformers import AutoProcessor, Qwen2_5_VLForConditionalGeneration
+        except ImportError:
+            print("Error: transformers/torch/pillow not installed")
+            print("Install with: ../venv/bin/pip install -r ../requirements.txt")
+            sys.exit(1)
+        self.torch = torch
+        self.Image = Image
+        self.model_id = model_name
+        self.processor = AutoProcessor.from_pretrained(model_name, max_pixels=MAX_IMAGE_PIXELS)
+        self.processor.tokenizer.padding_side = "left"
+        self.model = Qwen2_5_VLForConditionalGeneration.from_pretrained(
+            model_name, torch_dtype=torch.float32, device_map="cpu"
+        )
+        self.prompt = self.processor.apply_chat_template([{
+            "role": "user",
+            "content": [
+                {"type": "image"},
+                {"type": "text", "text": (
+                    "This is an illustration from a children's social story. "
+                    f"Choose up to {MAX_TAGS} topics it shows from this list and answer "
+                    f"with a comma-separated list only: {', '.join(TAG_VOCABULARY)}"
+                )},
+            ],
+        }], tokenize=False, add_generation_prompt=True)
+
+    def tag(self, paths):
+        images = [self.Image.open(p).convert("RGB") for p in paths]
+        inputs = self.processor(text=[self.prompt] * len(images), images=images,
+                                padding=True, return_tensors="pt")
+        with self.torch.inference_mode():
+            output = self.model.generate(**inputs, max_new_tokens=32, do_sample=False)
+        answers = self.processor.batch_decode(output[:, inputs["input_ids"].shape[1]:],
+                                              skip_special_tokens=True)
+        return [parse_tags(answer) for answer in answers]
+
+class StandinTagger:
+    """
+    Tiny deterministic stand-in: a fixed random projection of the image's
+    byte histogram scores each vocabulary tag. Meaningless tags, but real
+    file I/O and stable output - enough to test caching and batching.
+    """
+
+    def __init__(self):
+        self.model_id = "standin-bytehist-v1"
+        self.weights = [
+            [hashlib.blake2b(f"{tag}:{b}".encode(), digest_size=2).digest()[0] - 128 for b in range(256)]
+            for tag in TAG_VOCABULARY
+        ]
+
+    def tag(self, paths):
+        results = []
+        for path in paths:
+            histogram = Counter(path.read_bytes())
+            scores = [sum(w[b] * n for b, n in histogram.items()) for w in self.weights]
+            ranked = sorted(range(len(TAG_VOCABULARY)), key=lambda i: -scores[i])
+            results.append([TAG_VOCABULARY[i] for i in ranked[:3]])
+        return results
+
+def make_tagger(name):
+    if name == "standin":
+        return StandinTagger()
+    return QwenTagger(name)
+
+def load_cache(path):
+    if Path(path).exists():
+        with open(path) as f:
+            return json.load(f)
+    return {}
+
+def save_cache(path, cache):
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(path.name + ".tmp")
+    with open(tmp, 'w') as f:
+        json.dump(cache, f)
+    os.replace(tmp, path)
+
+def suggested_tags(image_tags):
+    """Tags ranked by how many of the story's images carry them"""
+    counts = Counter(tag for tags in image_tags.values() for tag in tags)
+    return [tag for tag, _ in counts.most_common(MAX_TAGS)]
+
+def tag_stories(processed_dir, cache_path, tagger, threads, max_batch_pixels=MAX_BATCH_PIXELS, apply=False,
+                catalog=None):
+    """Tag uncached images, then update manifests; returns stats"""
+    story_dirs = sorted(d for d in processed_dir.iterdir() if d.is_dir())
+    # manifest.json marks a story as processed; tagging must not create one
+    unprocessed = [d for d in story_dirs if not (d / "manifest.json").exists()]
+    for story_dir in unprocessed:
+        print(f"  ⚠ Skipping {story_dir.name}: no manifest.json (not processed)")
+    story_dirs = [d for d in story_dirs if d not in unprocessed]
+    images = [(story_dir, path) for story_dir in story_dirs for path in story_images(story_dir)]
+
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        hashes = list(pool.map(lambda item: file_sha256(item[1]), images))
+    keys = [f"{tagger.model_id}:{h}" for h in hashes]
+
+    cache = load_cache(cache_path)
+    todo = sorted({key: n for n, key in enumerate(keys) if key not in cache}.values())
+    pixels = [(lambda size: size[0] * size[1] if size else MAX_IMAGE_PIXELS)(image_size(images[n][1]))
+              for n in todo]
+
+    started = time.monotonic()
+    batches = pixel_batches(pixels, max_batch_pixels)
+    for number, batch in enumerate(batches, 1):
+        rows = [todo[i] for i in batch]
+        for row, tags in zip(rows, tagger.tag([images[row][1] for row in rows])):
+            cache[keys[row]] = tags
+        # Persist after every batch so an interrupted run keeps its work
+        save_cache(cache_path, cache)
+        print(f"  Batch {number}/{len(batches)}: {len(batch)} images")
+    elapsed = time.monotonic() - started
+
+    applied = 0
+    for story_dir in story_dirs:
+        image_tags = {path.name: cache[key] for (d, path), key in zip(images, keys) if d == story_dir}
+        manifest_path = story_dir / "manifest.json"
+        with open(manifest_path) as f:
+            manifest = json.load(f)
+        manifest["image_tags"] = image_tags
+        manifest["suggested_tags"] = suggested_tags(image_tags)
+        manifest["tagging_model"] = tagger.model_id
+        with open(manifest_path, 'w') as f:
+            json.dump(manifest, f, indent=2)
+
+        story_path = story_dir / "story.json"
+        if apply and story_path.exists():
+            with open(story_path, 'r', encoding='utf-8') as f:
+                story = json.load(f)
+            if not story.get("tags") and manifest["suggested_tags"]:
+                story["tags"] = manifest["suggested_tags"]
+                data = json.dumps(story, indent=2, ensure_ascii=False)
+                with open(story_path, 'w', encoding='utf-8') as f:
+                    f.write(data)
+                if catalog:
+                    catalog.record_story_json(story_dir.name, story, hashlib.sha256(data.encode('utf-8')).hexdigest())
+                applied += 1
+
+    return {
+        "images": len(images),
+        "tagged": len(todo),
+        "cached": len(images) - len(todo),
+        "batches": len(batches),
+        "seconds": elapsed,
+        "applied": applied,
+        "skipped": len(unprocessed),
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Tag story images with a local vision model")
+    parser.add_argument("--source", type=Path, default=PROCESSED_DIR,
+                        help=f"Processed stories directory (default: {PROCESSED_DIR})")
+    parser.add_argument("--cache", type=Path, default=CACHE_FILE,
+                        help=f"Tag cache file (default: {CACHE_FILE})")
+    parser.add_argument("--model", default=QWEN_MODEL,
+                        help=f"Model name, or 'standin' for the stand-in (default: {QWEN_MODEL})")
+    parser.add_argument("--threads", type=int, default=min(8, os.cpu_count() or 1),
+                        help="CPU threads for hashing and inference (default: up to 8)")
+    parser.add_argument("--max-batch-pixels", type=int, default=MAX_BATCH_PIXELS,
+                        help=f"Pixel budget per batch (default: {MAX_BATCH_PIXELS})")
+    parser.add_argument("--apply", action="store_true",
+                        help="Write suggested tags into story.json files that have none")
+    args = parser.parse_args()
+
+    print("=== Tagging Story Images ===")
+    print(f"Source: {args.source}")
+    print(f"Cache: {args.cache}")
+
+    if not args.source.exists():
+        print(f"❌ Directory not found: {args.source}")
+        return 1
+
+    if args.model != "standin":
+        try:
+            import torch
+            torch.set_num_threads(args.threads)
+        except ImportError:
+            pass
+
+    tagger = make_tagger(args.model)
+    print(f"Model: {tagger.model_id} ({args.threads} threads)\n")
+
+    stats = tag_stories(args.source, args.cache, tagger, args.threads, args.max_batch_pixels, args.apply,
+                        Catalog() if args.apply else None)
+
+    print(f"\n=== Tagging Complete ===")
+    print(f"Images: {stats['images']}")
+    print(f"Tagged: {stats['tagged']} in {stats['batches']} batches ({stats['seconds']:.1f}s)")
+    if stats['tagged'] and stats['seconds'] > 0:
+        print(f"Throughput: {stats['tagged'] / stats['seconds']:.1f} images/s")
+    print(f"Reused from cache: {stats['cached']}")
+    if stats['skipped']:
+        print(f"⚠ Skipped {stats['skipped']} stories with no manifest.json")
+    if args.apply:
+        print(f"Stories given suggested tags: {stats['applied']}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
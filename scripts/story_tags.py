@@ -0,0 +1,282 @@
+#!/usr/bin/env python3
+"""
+Story Tags - Normalized tag inverted index with facet counts
+
+Tags in story.json are free text ("sharing", " Sharing ", "Taking Turns").
+This builds stories-tmp/tag-index.json from stories-tmp/processed/*/story.json:
+
+    "stories":  [{"slug", "size", "mtime", "sha256", "tags"}]   # doc id = position
+    "labels":   {tag key: display label}
+    "postings": {tag key: [doc id, ...]}                          # sorted ints
+    "facets":   {tag key: story count}
+
+Tag keys are case-folded, trimmed, whitespace-collapsed and mapped through
+SYNONYMS. Queries intersect (AND) or merge (OR) sorted posting arrays.
+
+Doc ids are never reused: a removed story leaves a tombstone (slug None), so
+updating one story.json only touches that story's postings.
+
+Usage:
+    python3 story_tags.py build                       # full rebuild
+    python3 story_tags.py update                      # re-index changed story.json files
+    python3 story_tags.py update my-story             # re-index one story
+    python3 story_tags.py facets
+    python3 story_tags.py query --all sharing school --any feelings emotions
+"""
+
+import os
+import re
+import sys
+import json
+import argparse
+from pathlib import Path
+
+try:
+    import numpy as np
+except ImportError:
+    print("Error: numpy not installed")
+    print("Install with: ../venv/bin/pip install numpy")
+    sys.exit(1)
+
+from story_config import file_sha256
+
+PROCESSED_DIR = Path("stories-tmp/processed")
+INDEX_FILE = Path("stories-tmp/tag-index.json")
+
+# Variant (after case-folding) → canonical tag key
+SYNONYMS = {
+    "emotions": "feelings",
+    "emotion": "feelings",
+    "feeling": "feelings",
+    "friends": "friendship",
+    "friend": "friendship",
+    "making friends": "friendship",
+    "taking turns": "sharing",
+    "turn taking": "sharing",
+    "turn-taking": "sharing",
+    "waiting": "patience",
+    "bed time": "bedtime",
+    "sleep": "bedtime",
+    "routine": "routines",
+    "daily routines": "routines",
+    "classroom": "school",
+    "preschool": "school",
+    "doctor visit": "doctor",
+    "going to the doctor": "doctor",
+    "being kind": "kindness",
+    "kind": "kindness",
+    "manner": "manners",
+    "holiday": "holidays",
+}
+
+def tag_key(tag):
+    """Canonical key for a free-text tag, or None for an empty one"""
+    key = re.sub(r"\s+", " ", tag.casefold()).strip(" .,;:-_#*\"'")
+    if not key:
+        return None
+    return SYNONYMS.get(key, key)
+
+def normalize_tags(tags):
+    """Unique tag keys in first-seen order"""
+    keys = []
+    for tag in tags:
+        key = tag_key(tag)
+        if key and key not in keys:
+            keys.append(key)
+    return keys
+
+class TagIndex:
+    def __init__(self, data=None):
+        data = data or {"stories": [], "labels": {}, "postings": {}}
+        self.stories = data["stories"]
+        self.labels = data["labels"]
+        self.postings = {key: np.array(ids, dtype=np.int32) for key, ids in data["postings"].items()}
+        self.doc_of = {s["slug"]: n for n, s in enumerate(self.stories) if s["slug"] is not None}
+
+    @classmethod
+    def load(cls, path=INDEX_FILE):
+        if not Path(path).exists():
+            return cls()
+        with open(path) as f:
+            return cls(json.load(f))
+
+    def save(self, path=INDEX_FILE):
+        data = {
+            "stories": self.stories,
+            "labels": self.labels,
+            "postings": {key: ids.tolist() for key, ids in sorted(self.postings.items())},
+            "facets": self.facets(),
+        }
+        path = Path(path)
+        tmp = path.with_name(path.name + ".tmp")
+        with open(tmp, 'w') as f:
+            json.dump(data, f, separators=(",", ":"))
+        os.replace(tmp, path)
+
+    def facets(self):
+        """Story count per tag, most common first"""
+        counts = {key: len(ids) for key, ids in self.postings.items()}
+        return dict(sorted(counts.items(), key=lambda kv: (-kv[1], kv[0])))
+
+    def _remove_doc(self, doc):
+        for key in self.stories[doc]["tags"]:
+            ids = self.postings[key]
+            ids = ids[ids != doc]
+            if len(ids):
+                self.postings[key] = ids
+            else:
+                del self.postings[key]
+                self.labels.pop(key, None)
+
+    def _add_doc(self, doc, keys):
+        for key in keys:
+            ids = self.postings.get(key, np.zeros(0, dtype=np.int32))
+            self.postings[key] = np.insert(ids, np.searchsorted(ids, doc), doc)
+
+    def index_story(self, story_dir):
+        """(Re)index one story directory; returns True if anything changed"""
+        slug = story_dir.name
+        story_path = story_dir / "story.json"
+        doc = self.doc_of.get(slug)
+
+        if not story_path.exists():
+            if doc is None:
+                return False
+            self._remove_doc(doc)
+            self.stories[doc] = {"slug": None, "tags": []}
+            del self.doc_of[slug]
+            return True
+
+        stat = story_path.stat()
+        if doc is not None:
+            entry = self.stories[doc]
+            if entry["size"] == stat.st_size and entry["mtime"] == stat.st_mtime_ns:
+                return False
+            sha256 = file_sha256(story_path)
+            if entry["sha256"] == sha256:
+                entry["mtime"] = stat.st_mtime_ns
+                return False
+        else:
+            sha256 = file_sha256(story_path)
+
+        with open(story_path, 'r', encoding='utf-8') as f:
+            raw_tags = json.load(f).get("tags", [])
+        keys = normalize_tags(raw_tags)
+        for tag in raw_tags:
+            key = tag_key(tag)
+            if key and key not in self.labels:
+                # Keep the author's capitalisation when it is just a spelling of the key
+                label = re.sub(r"\s+", " ", tag.strip())
+                self.labels[key] = label if label.casefold() == key and not label.islower() else key.title()
+
+        if doc is None:
+            doc = len(self.stories)
+            self.stories.append(None)
+            self.doc_of[slug] = doc
+        else:
+            self._remove_doc(doc)
+        self.stories[doc] = {
+            "slug": slug,
+            "size": stat.st_size,
+            "mtime": stat.st_mtime_ns,
+            "sha256": sha256,
+            "tags": keys,
+        }
+        self._add_doc(doc, keys)
+        return True
+
+    def update(self, processed_dir):
+        """Re-index every new, changed or removed story; returns changed slugs"""
+        present = {d.name for d in processed_dir.iterdir() if d.is_dir()}
+        changed = []
+        for slug in sorted(present | set(self.doc_of)):
+            if self.index_story(processed_dir / slug):
+                changed.append(slug)
+        return changed
+
+    def query(self, all_tags=(), any_tags=()):
+        """Doc ids having every tag in all_tags and at least one of any_tags"""
+        empty = np.zeros(0, dtype=np.int32)
+        result = None
+        # Intersect smallest postings first
+        for ids in sorted((self.postings.get(tag_key(t), empty) for t in all_tags), key=len):
+            result = ids if result is None else np.intersect1d(result, ids, assume_unique=True)
+            if not len(result):
+                return result
+        if any_tags:
+            union = empty
+            for t in any_tags:
+                union = np.union1d(union, self.postings.get(tag_key(t), empty))
+            result = union if result is None else np.intersect1d(result, union, assume_unique=True)
+        if result is None:
+            result = np.array(sorted(self.doc_of.values()), dtype=np.int32)
+        return result
+
+    def drilldown(self, docs):
+        """Facet counts restricted to a result set"""
+        counts = {}
+        for key, ids in self.postings.items():
+            n = len(np.intersect1d(docs, ids, assume_unique=True))
+            if n:
+                counts[key] = n
+        return dict(sorted(counts.items(), key=lambda kv: (-kv[1], kv[0])))
+
+    def slugs(self, docs):
+        return [self.stories[doc]["slug"] for doc in docs]
+
+def main():
+    parser = argparse.ArgumentParser(description="Build and query the story tag index")
+    parser.add_argument("--source", type=Path, default=PROCESSED_DIR,
+                        help=f"Processed stories directory (default: {PROCESSED_DIR})")
+    parser.add_argument("--index", type=Path, default=INDEX_FILE,
+                        help=f"Index file (default: {INDEX_FILE})")
+    sub = parser.add_subparsers(dest="command", required=True)
+    sub.add_parser("build", help="Rebuild the index from scratch")
+    update = sub.add_parser("update", help="Re-index changed stories")
+    update.add_argument("slugs", nargs="*", help="Only these stories")
+    sub.add_parser("facets", help="Story count per tag")
+    query = sub.add_parser("query", help="Stories matching tags")
+    query.add_argument("--all", nargs="+", default=[], metavar="TAG", help="Stories with every tag")
+    query.add_argument("--any", nargs="+", default=[], metavar="TAG", help="Stories with at least one tag")
+    args = parser.parse_args()
+
+    if args.command in ("build", "update"):
+        if not args.source.exists():
+            print(f"❌ Directory not found: {args.source}")
+            return 1
+        index = TagIndex() if args.command == "build" else TagIndex.load(args.index)
+        if args.command == "update" and args.slugs:
+            changed = [slug for slug in args.slugs if index.index_story(args.source / slug)]
+        else:
+            changed = index.update(args.source)
+        if changed or args.command == "build":
+            args.index.parent.mkdir(parents=True, exist_ok=True)
+            index.save(args.index)
+        for slug in changed[:20]:
+            print(f"  ✓ {slug}")
+        if len(changed) > 20:
+            print(f"  ... and {len(changed) - 20} more")
+        print(f"✓ Indexed {len(index.doc_of)} stories, {len(index.postings)} tags "
+              f"({len(changed)} changed) → {args.index}")
+        return 0
+
+    index = TagIndex.load(args.index)
+
+    if args.command == "facets":
+        for key, count in index.facets().items():
+            print(f"  {count:>5}  {index.labels.get(key, key)}")
+        return 0
+
+    if args.command == "query":
+        docs = index.query(args.all, args.any)
+        print(f"{len(docs)} stories")
+        for slug in index.slugs(docs):
+            print(f"  {slug}")
+        if len(docs):
+            print("\nRefine by:")
+            for key, count in list(index.drilldown(docs).items())[:15]:
+                print(f"  {count:>5}  {index.labels.get(key, key)}")
+        return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,269 @@
+#!/usr/bin/env python3
+"""
+Sync Story Assets - Push processed story images to R2/S3
+
+Uploads stories-tmp/processed/*/cover.webp, page-N.webp and their
+thumb-<width>/ derivatives to object storage under content-hash keys:
+
+    community/{slug}/{name}.{sha256[:16]}.webp
+    community/{slug}/thumb-{width}/{name}.{sha256[:16]}.webp
+
+Because a key names exact bytes, objects are immutable and served with a
+one-year Cache-Control. The key of every uploaded file is recorded in the
+story's manifest.json ("objects", keyed by path within the story folder),
+which doubles as the sync manifest: a file whose hash matches its manifest
+entry is skipped without any request. --check-remote additionally HEADs
+those keys to confirm they still exist. Stories without a manifest.json
+(not processed by batch-process-stories.py) are skipped with a warning.
+
+Uploads run on a thread pool; files above the multipart threshold are sent
+as concurrent multipart parts. A story's manifest is saved as soon as its
+last upload finishes, so an interrupted run keeps the stories it finished.
+
+Usage:
+    export R2_ENDPOINT_URL=https://<account>.r2.cloudflarestorage.com
+    export R2_ACCESS_KEY_ID=... R2_SECRET_ACCESS_KEY=... R2_BUCKET=icraft-assets
+    python3 sync-story-assets.py
+    python3 sync-story-assets.py --dry-run
+    python3 sync-story-assets.py --endpoint-url http://127.0.0.1:9000   # local MinIO/moto
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import mimetypes
+from pathlib import Path
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from story_config import file_sha256
+from story_catalog import Catalog
+
+PROCESSED_DIR = Path("stories-tmp/processed")
+KEY_PREFIX = "community"
+
+CACHE_CONTROL = "public, max-age=31536000, immutable"
+MULTIPART_THRESHOLD = 8 * 1024 * 1024
+MULTIPART_CHUNKSIZE = 8 * 1024 * 1024
+WORKERS = 16
+MAX_CONCURRENCY = 4         # Threads per multipart upload
+
+mimetypes.add_type("image/webp", ".webp")
+
+def object_key(slug, name, sha256):
+    """Content-hash key for `name`, a path relative to the story folder"""
+    stem, dot, suffix = name.rpartition(".")
+    return f"{KEY_PREFIX}/{slug}/{stem}.{sha256[:16]}{dot}{suffix}"
+
+def story_assets(story_dir):
+    """
+    Processed images of one story as [(name, path)], cover first then pages
+    in order, each followed by its thumbnails (largest first). `name` is the
+    path relative to the story folder, e.g. "thumb-320/page-1.webp".
+    """
+    images = []
+    cover = story_dir / "cover.webp"
+    if cover.exists():
+        images.append(cover)
+    pages = [p for p in story_dir.glob("page-*.webp") if p.stem[5:].isdigit()]
+    images.extend(sorted(pages, key=lambda p: int(p.stem[5:])))
+
+    assets = []
+    for image in images:
+        assets.append((image.name, image))
+        thumbs = [t for t in story_dir.glob(f"thumb-*/{image.name}") if t.parent.name[6:].isdigit()]
+        for thumb in sorted(thumbs, key=lambda t: -int(t.parent.name[6:])):
+            assets.append((f"{thumb.parent.name}/{image.name}", thumb))
+    return assets
+
+def make_client(endpoint_url, workers=WORKERS):
+    try:
+        import boto3
+        from botocore.config import Config
+    except ImportError:
+        print("Error: boto3 not installed")
+        print("Install with: ../venv/bin/pip install boto3")
+        sys.exit(1)
+
+    return boto3.client(
+        "s3",
+        endpoint_url=endpoint_url,
+        aws_access_key_id=os.environ.get("R2_ACCESS_KEY_ID"),
+        aws_secret_access_key=os.environ.get("R2_SECRET_ACCESS_KEY"),
+        region_name=os.environ.get("R2_REGION", "auto"),
+        # Every worker may run a multipart upload with MAX_CONCURRENCY connections
+        config=Config(max_pool_connections=workers * MAX_CONCURRENCY,
+                      retries={"max_attempts": 5, "mode": "adaptive"}),
+    )
+
+def remote_exists(client, bucket, key):
+    from botocore.exceptions import ClientError
+    try:
+        client.head_object(Bucket=bucket, Key=key)
+        return True
+    except ClientError as e:
+        if e.response["Error"]["Code"] in ("404", "NoSuchKey", "NotFound"):
+            return False
+        raise
+
+def upload(client, bucket, path, key, transfer_config):
+    client.upload_file(
+        str(path), bucket, key,
+        ExtraArgs={
+            "ContentType": mimetypes.guess_type(path.name)[0] or "application/octet-stream",
+            "CacheControl": CACHE_CONTROL,
+        },
+        Config=transfer_config,
+    )
+
+def load_manifest(story_dir):
+    """Parsed manifest.json, or None if the story has none"""
+    path = story_dir / "manifest.json"
+    if not path.exists():
+        return None
+    with open(path) as f:
+        return json.load(f)
+
+def save_manifest(story_dir, manifest):
+    """Write manifest.json atomically (temp file + rename)"""
+    path = story_dir / "manifest.json"
+    tmp_path = path.with_name(path.name + ".tmp")
+    with open(tmp_path, 'w') as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(tmp_path, path)
+
+def main():
+    parser = argparse.ArgumentParser(description="Sync processed story images to R2/S3")
+    parser.add_argument("--source", type=Path, default=PROCESSED_DIR,
+                        help=f"Processed stories directory (default: {PROCESSED_DIR})")
+    parser.add_argument("--bucket", default=os.environ.get("R2_BUCKET"),
+                        help="Bucket name (default: $R2_BUCKET)")
+    parser.add_argument("--endpoint-url", default=os.environ.get("R2_ENDPOINT_URL"),
+                        help="S3 endpoint (default: $R2_ENDPOINT_URL)")
+    parser.add_argument("--workers", type=int, default=WORKERS,
+                        help=f"Concurrent uploads (default: {WORKERS})")
+    parser.add_argument("--check-remote", action="store_true",
+                        help="HEAD keys already in manifest.json before skipping them")
+    parser.add_argument("--dry-run", action="store_true",
+                        help="Show what would be uploaded")
+    args = parser.parse_args()
+
+    print("=== Syncing Story Assets ===")
+    print(f"Source: {args.source}")
+    print(f"Bucket: {args.bucket} @ {args.endpoint_url or 'AWS default'}")
+
+    if not args.source.exists():
+        print(f"❌ Directory not found: {args.source}")
+        return 1
+    if not args.bucket and not args.dry_run:
+        print("❌ No bucket - set R2_BUCKET or pass --bucket")
+        return 1
+
+    client = make_client(args.endpoint_url, args.workers) if not args.dry_run or args.check_remote else None
+
+    # Plan: hash every asset and diff against manifest.json
+    manifests = {}
+    pending = []
+    skipped_files = 0
+    skipped_bytes = 0
+    no_manifest = 0
+
+    for story_dir in sorted(d for d in args.source.iterdir() if d.is_dir()):
+        manifest = load_manifest(story_dir)
+        if manifest is None:
+            print(f"⚠ {story_dir.name}: no manifest.json, skipping (run batch-process-stories.py first)")
+            no_manifest += 1
+            continue
+        manifests[story_dir] = manifest
+        objects = manifest.setdefault("objects", {})
+
+        for name, path in story_assets(story_dir):
+            sha256 = file_sha256(path)
+            key = object_key(story_dir.name, name, sha256)
+            size = path.stat().st_size
+            known = objects.get(name)
+
+            if known and known["key"] == key and not (
+                args.check_remote and not remote_exists(client, args.bucket, key)
+            ):
+                skipped_files += 1
+                skipped_bytes += size
+                continue
+            pending.append((story_dir, name, path, key, sha256, size))
+
+    pending_bytes = sum(item[5] for item in pending)
+    print(f"\nFiles to upload: {len(pending)} ({pending_bytes:,} bytes)")
+    print(f"Unchanged, skipped: {skipped_files} ({skipped_bytes:,} bytes)")
+    if no_manifest:
+        print(f"Stories without manifest.json, skipped: {no_manifest}")
+    print()
+
+    if args.dry_run:
+        for _, _, path, key, _, size in pending:
+            print(f"  Would upload: {path} → {key} ({size:,} bytes)")
+        print("\nThis was a DRY RUN. Run without --dry-run to apply changes.")
+        return 0
+
+    from boto3.s3.transfer import TransferConfig
+    transfer_config = TransferConfig(
+        multipart_threshold=MULTIPART_THRESHOLD,
+        multipart_chunksize=MULTIPART_CHUNKSIZE,
+        max_concurrency=MAX_CONCURRENCY,
+        use_threads=True,
+    )
+
+    catalog = Catalog()
+    remaining = Counter(item[0] for item in pending)
+    uploaded = Counter()
+    uploaded_bytes = 0
+    failed = 0
+    started = time.monotonic()
+
+    def finish_story(story_dir):
+        """
+        Record a story's keys once all of its uploads are done, so a crash
+        keeps every finished story and never points at missing objects
+        """
+        if not uploaded[story_dir]:
+            return
+        save_manifest(story_dir, manifests[story_dir])
+        for name, obj in manifests[story_dir]["objects"].items():
+            catalog.record_object(story_dir.name, name, obj["key"], obj["sha256"], obj["bytes"])
+
+    with ThreadPoolExecutor(max_workers=args.workers) as pool:
+        futures = {}
+        for item in pending:
+            _, _, path, key, _, _ = item
+            futures[pool.submit(upload, client, args.bucket, path, key, transfer_config)] = item
+        for future in as_completed(futures):
+            story_dir, name, path, key, sha256, size = futures[future]
+            try:
+                future.result()
+            except Exception as e:
+                failed += 1
+                print(f"❌ {path}: {e}")
+            else:
+                uploaded_bytes += size
+                uploaded[story_dir] += 1
+                manifests[story_dir]["objects"][name] = {"key": key, "sha256": sha256, "bytes": size}
+                print(f"✓ {key} ({size:,} bytes)")
+            remaining[story_dir] -= 1
+            if not remaining[story_dir]:
+                finish_story(story_dir)
+
+    elapsed = time.monotonic() - started
+
+    print(f"\n=== Sync Complete ===")
+    print(f"Uploaded: {len(pending) - failed} files, {uploaded_bytes:,} bytes in {elapsed:.1f}s")
+    if elapsed > 0:
+        print(f"Throughput: {uploaded_bytes / elapsed / 1e6:.2f} MB/s, "
+              f"{(len(pending) - failed) / elapsed:.1f} files/s")
+    print(f"Skipped: {skipped_files} files, {skipped_bytes:,} bytes")
+    print(f"Failed: {failed}")
+
+    return 0 if failed == 0 else 1
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,24 @@
+"""
+Shared test setup for the story tools
+
+The tools are scripts, not a package: put scripts/ on sys.path so they
+import each other by name as they do when run, and load the hyphenated
+ones (upload-stories-api.py, ...) with load_script().
+"""
+
+import sys
+import importlib.util
+from pathlib import Path
+
+SCRIPTS_DIR = Path(__file__).resolve().parent.parent
+
+if str(SCRIPTS_DIR) not in sys.path:
+    sys.path.insert(0, str(SCRIPTS_DIR))
+
+def load_script(filename, name=None):
+    """Import scripts/<filename> as a module without running its main()"""
+    name = name or filename[:-3].replace("-", "_")
+    spec = importlib.util.spec_from_file_location(name, SCRIPTS_DIR / filename)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
@@ -0,0 +1,82 @@
+import json
+
+import canvas_compact as cc
+
+def text_node(text, x, **attrs):
+    return {"className": "Text", "attrs": {"text": text, "x": x, "fontFamily": "Comic Neue",
+                                           "fontSize": 28, "fill": "#333333", **attrs}}
+
+def stage(*children, width=800.0, height=600):
+    layer = {"className": "Layer", "attrs": {}, "children": list(children)}
+    return {"className": "Stage", "attrs": {"width": width, "height": height}, "children": [layer]}
+
+def round_trip(cover, pages):
+    payload = cc.compact_story(cover, pages)
+    # The payload must survive storage as JSON
+    payload = json.loads(json.dumps(payload))
+    return payload, cc.expand_story(payload)
+
+def test_defaults_are_stripped_and_round_trip():
+    node = text_node("Hello", 10, rotation=0, opacity=1, visible=True, fontStyle="normal")
+    cover = stage(node)
+    payload, (expanded, pages) = round_trip(cover, [])
+
+    layer = payload["cover_canvas_state"]["children"][0]["children"][0]
+    assert "rotation" not in layer["attrs"]
+    assert "opacity" not in layer["attrs"]
+    assert "fontStyle" not in layer.get("$style", {})
+    assert cc.round_trip_mismatch([cover, []], [expanded, pages]) is None
+
+def test_non_default_attrs_survive():
+    cover = stage(text_node("Hi", 5, rotation=15, opacity=0.5))
+    _, (expanded, pages) = round_trip(cover, [])
+    attrs = expanded["children"][0]["children"][0]["attrs"]
+    assert attrs["rotation"] == 15 and attrs["opacity"] == 0.5
+    assert cc.round_trip_mismatch([cover, []], [expanded, pages]) is None
+
+def test_styles_are_split_and_merged_back():
+    cover = stage(text_node("Title", 0))
+    payload, (expanded, _) = round_trip(cover, [])
+
+    node = payload["cover_canvas_state"]["children"][0]["children"][0]
+    assert node["$style"] == {"fill": "#333333", "fontFamily": "Comic Neue", "fontSize": 28}
+    assert node["attrs"] == {"text": "Title"}
+    assert expanded["children"][0]["children"][0]["attrs"]["fontFamily"] == "Comic Neue"
+
+def test_repeated_objects_become_refs():
+    shared = {"className": "Image", "attrs": {"src": "https://cdn.example.com/owl.webp",
+                                              "width": 400, "height": 300}}
+    cover = stage(shared)
+    pages = [{"pageNumber": n, "canvasState": json.dumps(stage(shared))} for n in (1, 2, 3)]
+    payload, (expanded_cover, expanded_pages) = round_trip(cover, pages)
+
+    assert payload["defs"]
+    assert '"$ref"' in json.dumps(payload["pages"])
+    assert cc.round_trip_mismatch([cover, pages], [expanded_cover, expanded_pages]) is None
+    # JSON-encoded page canvases come back as strings
+    assert isinstance(expanded_pages[0]["canvasState"], str)
+
+def test_marker_keys_in_original_are_kept_literally():
+    cover = stage(
+        {"className": "Text", "attrs": {"text": "$ref", "$style": "bold", "rotation": 0}},
+        {"className": "Rect", "attrs": {"x": 1}, "$style": {"fill": "red"}},
+        {"$ref": 0},
+        {"$json": "{}", "$lit": 1},
+    )
+    _, (expanded, pages) = round_trip(cover, [])
+
+    assert expanded == cc.decode(cc.canonicalize(cover))
+    assert cc.round_trip_mismatch([cover, []], [expanded, pages]) is None
+
+def test_mismatch_is_reported_against_raw_original():
+    cover = stage(text_node("Hello", 10, rotation=0))
+    _, (expanded, pages) = round_trip(cover, [])
+
+    broken = json.loads(json.dumps(expanded))
+    broken["children"][0]["children"][0]["attrs"]["x"] = 11
+    assert cc.round_trip_mismatch([cover, []], [broken, pages]) == "$[0].children[0].children[0].attrs.x"
+
+    # An attr dropped from the compact form only matches when the original had the default
+    dropped = json.loads(json.dumps(expanded))
+    del dropped["children"][0]["children"][0]["attrs"]["fontSize"]
+    assert cc.round_trip_mismatch([cover, []], [dropped, pages]) is not None
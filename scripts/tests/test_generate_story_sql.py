@@ -0,0 +1,97 @@
+import io
+import json
+import uuid
+
+from conftest import load_script
+
+gen = load_script("generate-story-sql.py")
+
+STORY = {
+    "title": 'The "Brave" Fox\\Hound',
+    "tags": ['Sharing, Turns', 'Say "please"', "back\\slash", "  "],
+    "pages": [
+        {"number": 1, "content": "Line one\nLine\ttwo\r", "coaching": 'Ask: "why?" \\ it\'s fine'},
+        {"number": 2, "content": "{curly}", "coaching": ""},
+    ],
+}
+
+def write_story(processed, slug, manifest=None):
+    story_dir = processed / slug
+    story_dir.mkdir(parents=True)
+    (story_dir / "story.json").write_text(json.dumps(STORY))
+    (story_dir / "manifest.json").write_text(json.dumps(manifest or {
+        "processed_at": "2026-01-01T00:00:00+00:00",
+        "images": {"cover.webp": {"width": 800, "height": 600}},
+    }))
+    return story_dir
+
+def copy_unescape(field):
+    """Inverse of the COPY text escaping"""
+    if field == r"\N":
+        return None
+    out, chars = [], iter(field)
+    for c in chars:
+        if c == "\\":
+            c = {"t": "\t", "n": "\n", "r": "\r", "\\": "\\"}[next(chars)]
+        out.append(c)
+    return "".join(out)
+
+def parse_array(literal):
+    """Postgres array literal of quoted elements -> list of strings"""
+    assert literal[0] == "{" and literal[-1] == "}"
+    items, chars = [], iter(literal[1:-1])
+    for c in chars:
+        if c == ",":
+            continue
+        assert c == '"'
+        item = []
+        for c in chars:
+            if c == "\\":
+                item.append(next(chars))
+            elif c == '"':
+                break
+            else:
+                item.append(c)
+        items.append("".join(item))
+    return items
+
+def test_ids_are_deterministic_uuid5(tmp_path):
+    story_dir = write_story(tmp_path / "processed", "brave-fox")
+    first = gen.build_row(story_dir, "user-1", "")
+    second = gen.build_row(story_dir, "user-1", "https://img.example.com/")
+    expected = uuid.uuid5(gen.STORY_NAMESPACE, "brave-fox")
+    assert first["id"] == second["id"] == str(expected)
+    assert [p["id"] for p in first["pages"]] == [p["id"] for p in second["pages"]] == [
+        str(uuid.uuid5(expected, "page-1")), str(uuid.uuid5(expected, "page-2"))]
+    assert first["tags"] == STORY["tags"][:3]
+    assert second["pages"][0]["imageUrl"] == "https://img.example.com/brave-fox/page-1.webp"
+    assert first["cover_canvas_state"]["attrs"] == {"width": 800, "height": 600}
+
+def test_copy_text_round_trips_special_characters(tmp_path):
+    story_dir = write_story(tmp_path / "processed", "brave-fox")
+    row = gen.build_row(story_dir, "user-1", "")
+    out = io.StringIO()
+    gen.write_copy([row], out)
+
+    lines = out.getvalue().split("\n")
+    start = next(n for n, line in enumerate(lines) if line.startswith("COPY "))
+    assert lines[start + 2] == "\\."                      # one data line: newlines are escaped
+    fields = [copy_unescape(f) for f in lines[start + 1].split("\t")]
+    assert len(fields) == len(gen.COLUMNS)
+    values = dict(zip((name for name, _ in gen.COLUMNS), fields))
+
+    assert values["title"] == STORY["title"]
+    assert values["original_story_id"] is None
+    assert values["is_approved"] == "t" and values["is_featured"] == "f"
+    assert parse_array(values["tags"]) == STORY["tags"][:3]
+    assert json.loads(values["cover_canvas_state"]) == row["cover_canvas_state"]
+    pages = [json.loads(p) for p in parse_array(values["pages"])]
+    assert pages == row["pages"]
+    assert pages[0]["content"] == STORY["pages"][0]["content"]
+    assert parse_array(values["ai_generator_history"]) == []
+
+def test_insert_values_escape_quotes():
+    assert gen.sql_string("it's") == "'it''s'"
+    assert gen.sql_value(["a'b"], "text[]") == "ARRAY['a''b']::text[]"
+    assert gen.sql_value([], "jsonb[]") == "'{}'::jsonb[]"
+    assert gen.sql_value(None, "uuid") == "NULL"
@@ -0,0 +1,29 @@
+import pytest
+
+import stories
+
+@pytest.fixture
+def ran(monkeypatch, tmp_path):
+    calls = []
+    monkeypatch.setattr(stories, "run_script", lambda script, command, args: calls.append((script, args)) or 0)
+    monkeypatch.setenv("STORIES_ROOT", str(tmp_path))
+    monkeypatch.chdir(tmp_path)
+    return calls
+
+def test_upload_defaults_to_playwright(ran):
+    assert stories.main(["--env-file", "missing.env", "upload", "--workers", "4"]) == 0
+    assert ran == [("upload-stories-playwright.py", ["--workers", "4"])]
+
+@pytest.mark.parametrize("argv", [
+    ["upload", "--workers", "4", "--via", "api"],
+    ["upload", "--via=api", "--workers", "4"],
+    ["upload", "--workers", "4", "--via=api"],
+])
+def test_upload_via_is_found_anywhere(ran, argv):
+    assert stories.main(["--env-file", "missing.env", *argv]) == 0
+    assert ran == [("upload-stories-api.py", ["--workers", "4"])]
+
+def test_upload_rejects_unknown_uploader(ran):
+    with pytest.raises(SystemExit):
+        stories.main(["--env-file", "missing.env", "upload", "--via", "ftp"])
+    assert ran == []
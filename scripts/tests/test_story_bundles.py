@@ -0,0 +1,42 @@
+import sys
+import json
+
+import story_bundles
+
+MANIFEST = {
+    "images": {"cover.webp": {"width": 800, "height": 600,
+                              "thumbnails": {"320": "thumb-320/cover.webp", "160": "thumb-160/cover.webp"}}},
+}
+
+def test_unsynced_story_uses_local_paths():
+    ref = story_bundles.image_ref("https://cdn.example.com/", "fox", "cover.webp", MANIFEST)
+    assert ref["url"] == "https://cdn.example.com/fox/cover.webp"
+    assert ref["thumbnails"] == {"320": "https://cdn.example.com/fox/thumb-320/cover.webp",
+                                 "160": "https://cdn.example.com/fox/thumb-160/cover.webp"}
+
+def test_synced_story_only_references_object_keys():
+    manifest = dict(MANIFEST, objects={
+        "cover.webp": {"key": "community/fox/cover.0123456789abcdef.webp"},
+        "thumb-320/cover.webp": {"key": "community/fox/thumb-320/cover.fedcba9876543210.webp"},
+    })
+    ref = story_bundles.image_ref("https://cdn.example.com", "fox", "cover.webp", manifest)
+    assert ref["url"] == "https://cdn.example.com/community/fox/cover.0123456789abcdef.webp"
+    # thumb-160 is not synced yet, so it is left out
+    assert ref["thumbnails"] == {"320": "https://cdn.example.com/community/fox/thumb-320/cover.fedcba9876543210.webp"}
+
+def test_missing_encoding_is_rebuilt(tmp_path, monkeypatch):
+    story_dir = tmp_path / "processed" / "fox"
+    story_dir.mkdir(parents=True)
+    (story_dir / "story.json").write_text(json.dumps(
+        {"title": "Fox", "tags": ["animals"], "pages": [{"number": 1, "content": "Hi", "coaching": "Wave"}]}))
+    (story_dir / "manifest.json").write_text(json.dumps({"slug": "fox"}))
+    out = tmp_path / "bundles"
+    monkeypatch.setattr(sys, "argv", ["story_bundles.py", "--source", str(tmp_path / "processed"),
+                                      "--output", str(out)])
+
+    assert story_bundles.main() == 0
+    name = json.loads((out / "index.json").read_text())["fox"]
+    (out / f"{name}.br").unlink()
+
+    assert story_bundles.main() == 0
+    assert (out / f"{name}.br").exists()
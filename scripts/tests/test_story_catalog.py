@@ -0,0 +1,28 @@
+import sys
+import json
+
+import pytest
+
+import story_catalog
+from story_catalog import Catalog
+
+STORY = {"title": "Fox", "tags": ["animals"], "pages": [{"number": 1, "content": "Hi", "coaching": "Wave"}]}
+
+def test_export_only_writes_processed_stories(tmp_path, monkeypatch):
+    db = tmp_path / "catalog.db"
+    processed = tmp_path / "processed"
+    catalog = Catalog(db)
+    catalog.upsert_story("fox", name="Fox", status="processed", processed_at="2026-01-01T00:00:00")
+    catalog.record_story_json("fox", STORY)
+    catalog.upsert_story("broken", status="failed")
+    catalog.record_upload("uploaded-only", "complete", "remote-1")
+
+    with pytest.raises(ValueError):
+        catalog.export_story("broken", processed / "broken")
+    with pytest.raises(KeyError):
+        catalog.export_story("missing", processed / "missing")
+
+    monkeypatch.setattr(sys, "argv", ["story_catalog.py", "--catalog", str(db), "--source", str(processed), "export"])
+    assert story_catalog.main() == 0
+    assert sorted(d.name for d in processed.iterdir()) == ["fox"]
+    assert json.loads((processed / "fox" / "story.json").read_text())["tags"] == ["animals"]
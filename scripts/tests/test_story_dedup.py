@@ -0,0 +1,54 @@
+import json
+import random
+
+import story_dedup as dedup
+
+def write_story(story_dir, pages):
+    story_dir.mkdir(parents=True)
+    story = {"title": story_dir.name, "tags": [],
+             "pages": [{"number": n, "content": text, "coaching": ""} for n, text in enumerate(pages, 1)]}
+    (story_dir / "story.json").write_text(json.dumps(story))
+
+def test_empty_text_stories_are_not_text_duplicates(tmp_path):
+    write_story(tmp_path / "blank-fox", ["", "   "])
+    write_story(tmp_path / "blank-owl", ["!!!"])
+    cache = {}
+    signatures = {d.name: dedup.fingerprint(d, cache, {})[0] for d in sorted(tmp_path.iterdir())}
+
+    assert signatures == {"blank-fox": None, "blank-owl": None}
+    assert dedup.text_pairs(signatures) == {}
+    # Cached as "no signature", and still no match on a cached run
+    cached = {d.name: dedup.fingerprint(d, cache, {})[0] for d in sorted(tmp_path.iterdir())}
+    assert dedup.text_pairs(cached) == {}
+
+def test_copied_text_is_a_text_duplicate(tmp_path):
+    text = "the little fox shared his lunch with a new friend at the park on a sunny day"
+    write_story(tmp_path / "fox", [text, "they played together until the sun went down"])
+    write_story(tmp_path / "fox-copy", [text, "they played together until the sun went down"])
+    write_story(tmp_path / "blank", [""])
+    cache = {}
+    signatures = {d.name: dedup.fingerprint(d, cache, {})[0] for d in sorted(tmp_path.iterdir())}
+
+    assert set(dedup.text_pairs(signatures)) == {("fox", "fox-copy")}
+
+def test_cover_pairs_matches_brute_force():
+    rng = random.Random(7)
+    dhashes = {}
+    for n in range(300):
+        h = rng.getrandbits(64)
+        dhashes[f"s{n}"] = h
+        # Near copies at every distance up to one past the limit
+        flips = rng.sample(range(64), n % (dedup.COVER_DISTANCE + 2))
+        for bit in flips:
+            h ^= 1 << bit
+        dhashes[f"s{n}-copy"] = h
+
+    slugs = sorted(dhashes)
+    expected = {}
+    for i, a in enumerate(slugs):
+        for b in slugs[i + 1:]:
+            distance = bin(dhashes[a] ^ dhashes[b]).count("1")
+            if distance <= dedup.COVER_DISTANCE:
+                expected[(a, b)] = distance
+
+    assert dedup.cover_pairs(dhashes) == expected
@@ -0,0 +1,62 @@
+import json
+
+import numpy as np
+
+import story_embeddings as se
+
+def write_story(processed, slug, title, pages, tags=()):
+    story_dir = processed / slug
+    story_dir.mkdir(parents=True, exist_ok=True)
+    (story_dir / "story.json").write_text(json.dumps({
+        "title": title, "tags": list(tags),
+        "pages": [{"number": n, "content": content, "coaching": ""} for n, content in enumerate(pages, 1)],
+    }))
+
+def test_hashing_embedder_is_deterministic_and_normalised():
+    embedder = se.HashingEmbedder(dim=64)
+    vectors = embedder.encode(["the owl hoots at night", "the owl hoots at night", "a fox runs", ""])
+    assert vectors.shape == (4, 64) and vectors.dtype == np.float32
+    assert np.allclose(np.linalg.norm(vectors[:3], axis=1), 1.0)
+    assert np.array_equal(vectors[0], vectors[1])
+    assert not vectors[3].any()                           # no words, zero vector
+    # Shared words make texts closer than unrelated ones
+    near, far = embedder.encode(["the owl hoots loudly", "bears eat honey"])
+    assert vectors[0] @ near > vectors[0] @ far
+
+def test_length_batches_respect_token_budget():
+    texts = ["x" * 400, "x" * 40, "x" * 4000, "x" * 40]
+    batches = se.length_batches(texts, max_batch_tokens=250)
+    assert sorted(i for batch in batches for i in batch) == [0, 1, 2, 3]
+    assert batches[0] == [1, 3]                           # shortest first
+    for batch in batches:
+        longest = max(min(se.MAX_LENGTH, len(texts[i]) // se.CHARS_PER_TOKEN + 1) for i in batch)
+        assert len(batch) == 1 or longest * len(batch) <= 250
+
+def test_cache_reuses_unchanged_rows(tmp_path):
+    processed, cache = tmp_path / "processed", tmp_path / "embeddings"
+    write_story(processed, "owl", "Owl", ["Owl hoots.", "Owl sleeps."], tags=["Animals"])
+    write_story(processed, "fox", "Fox", ["Fox runs."])
+    embedder = se.HashingEmbedder(dim=32)
+
+    first = se.build_embeddings(processed, cache, embedder)
+    assert (first["items"], first["embedded"], first["reused"]) == (5, 5, 0)
+    meta, matrix = se.load_cache(cache)
+    assert isinstance(matrix, np.memmap) and matrix.shape == (5, 32)
+    before = {item["id"]: np.array(matrix[row]) for row, item in enumerate(meta["items"])}
+
+    # Edit one page and delete a story: only the changed texts are embedded again
+    write_story(processed, "owl", "Owl", ["Owl hoots.", "Owl wakes up."], tags=["Animals"])
+    for path in (processed / "fox").iterdir():
+        path.unlink()
+    (processed / "fox").rmdir()
+    second = se.build_embeddings(processed, cache, embedder)
+    assert (second["items"], second["embedded"], second["reused"]) == (3, 2, 1)
+
+    meta, matrix = se.load_cache(cache)
+    assert [item["id"] for item in meta["items"]] == ["owl", "owl#p1", "owl#p2"]
+    assert np.array_equal(matrix[1], before["owl#p1"])
+    expected = embedder.encode(["Owl wakes up."])[0].astype(np.float16)
+    assert np.array_equal(matrix[2], expected)
+
+    # Another model never reuses these vectors
+    assert se.build_embeddings(processed, cache, se.HashingEmbedder(dim=16))["reused"] == 0
@@ -0,0 +1,57 @@
+from PIL import Image, ImageDraw
+
+import story_images
+
+def flat_image(size=(640, 480)):
+    img = Image.new("RGB", size, (250, 243, 221))
+    draw = ImageDraw.Draw(img)
+    draw.rectangle([0, size[1] * 2 // 3, size[0], size[1]], fill=(6, 214, 160))
+    draw.ellipse([100, 80, 300, 260], fill=(239, 71, 111), outline=(30, 30, 30), width=3)
+    return img
+
+def test_truncated_headers_have_no_size(tmp_path):
+    png = tmp_path / "short.png"
+    png.write_bytes(b"\x89PNG\r\n\x1a\n\x00\x00")
+    webp = tmp_path / "short.webp"
+    webp.write_bytes(b"RIFF\x00\x00\x00\x00WEBPVP8 \x00\x00")
+
+    assert story_images.image_size(png) is None
+    assert story_images.image_size(webp) is None
+
+def test_dhash_is_taken_from_the_full_image(tmp_path):
+    src = tmp_path / "Page1.png"
+    flat_image().save(src)
+    dest = tmp_path / "page-1.webp"
+
+    record = story_images.process_image(src, dest, thumbnail_widths=(320, 160))
+
+    assert record["encoding"]["mode"] == "lossless"
+    assert set(record["thumbnails"]) == {"320", "160"}
+    with Image.open(dest) as webp:
+        assert record["dhash"] == story_images.dhash(webp)
+
+def count_encodes(monkeypatch):
+    calls = []
+    encode = story_images.encode_webp
+    monkeypatch.setattr(story_images, "encode_webp", lambda *a, **k: calls.append(k) or encode(*a, **k))
+    return calls
+
+def test_clear_cut_image_is_encoded_once(monkeypatch):
+    calls = count_encodes(monkeypatch)
+    webp, encoding = story_images.encode_auto(flat_image())
+
+    assert encoding["mode"] == "lossless"
+    assert encoding["decision"] == "analysis"
+    assert len(calls) == 1
+
+def test_ambiguous_image_compares_both_candidates(monkeypatch):
+    stats = {"colors": None, "top256_coverage": story_images.PALETTE_COVERAGE + 0.005,
+             "edge_density": 0.05, "alpha": "none"}
+    monkeypatch.setattr(story_images, "analyze", lambda img: dict(stats))
+    calls = count_encodes(monkeypatch)
+    webp, encoding = story_images.encode_auto(flat_image())
+
+    assert encoding["decision"] == "compared"
+    assert len(calls) == 2
+    assert {encoding["mode"], encoding["rejected"]} == {"palette", "lossy"}
+    assert encoding["baseline_bytes"] >= len(webp)
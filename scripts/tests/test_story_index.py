@@ -0,0 +1,73 @@
+import json
+
+import numpy as np
+import pytest
+
+import story_index as si
+import story_embeddings as se
+
+def build(tmp_path, n=2000, dim=32, nlist=None):
+    vectors = si.synthetic_vectors(n + 50, dim, clusters=40)
+    index = si.StoryIndex.build(tmp_path / "index", [f"s{i}" for i in range(n)], [""] * n,
+                                vectors[:n], "synthetic", nlist)
+    return index, vectors[n:]
+
+def test_ivf_recall_against_exact(tmp_path):
+    index, queries = build(tmp_path)
+    assert len(index.centroids) == si.default_nlist(2000)
+
+    # Probing every list is exact search
+    every = si.benchmark(index, queries, nprobe=len(index.centroids))
+    assert every["ivf"]["recall"] == 1.0
+    assert si.benchmark(index, queries)["ivf"]["recall"] >= 0.9
+
+    scores, rows = index.search_exact(queries[0], 10)
+    assert np.all(np.diff(scores) <= 0)
+    assert np.allclose(scores, index.vectors[rows] @ si.normalize(queries[0]), atol=1e-5)
+
+def test_add_replaces_and_delete_tombstones(tmp_path):
+    index, queries = build(tmp_path, n=300)
+    query = si.normalize(queries[0])
+
+    index.add(["new"], ["h1"], [query])
+    assert index.results(*index.search_ivf(query, 1)) == [("new", pytest.approx(1.0))]
+
+    # Re-adding an id replaces its vector, the old row is tombstoned
+    index.add(["new"], ["h2"], [-query])
+    reopened = si.StoryIndex(tmp_path / "index")
+    assert len(reopened.rows) == 302 and len(reopened.row_of) == 301
+    assert reopened.rows[reopened.row_of["new"]]["hash"] == "h2"
+    assert "new" not in [item for item, _ in reopened.results(*reopened.search_exact(query, 5))]
+
+    reopened.delete(["new", "s0"])
+    reopened = si.StoryIndex(tmp_path / "index")
+    assert "new" not in reopened.row_of and "s0" not in reopened.row_of
+    found = {item for item, _ in reopened.results(*reopened.search_exact(reopened.vectors[0], 300))}
+    assert "s0" not in found and "new" not in found
+
+def test_sync_applies_cache_changes(tmp_path):
+    processed, cache = tmp_path / "processed", tmp_path / "embeddings"
+    for slug, text in [("owl", "Owl hoots."), ("fox", "Fox runs.")]:
+        (processed / slug).mkdir(parents=True)
+        (processed / slug / "story.json").write_text(json.dumps(
+            {"title": slug, "pages": [{"number": 1, "content": text, "coaching": ""}]}))
+    embedder = se.HashingEmbedder(dim=16)
+    se.build_embeddings(processed, cache, embedder)
+    index = si.build_from_cache(cache, tmp_path / "index")
+    assert set(index.row_of) == {"owl", "owl#p1", "fox", "fox#p1"}
+
+    (processed / "owl" / "story.json").write_text(json.dumps(
+        {"title": "owl", "pages": [{"number": 1, "content": "Owl naps.", "coaching": ""}]}))
+    for path in (processed / "fox").iterdir():
+        path.unlink()
+    (processed / "fox").rmdir()
+    se.build_embeddings(processed, cache, embedder)
+
+    assert index.sync(cache) == (2, 2)                    # owl + owl#p1 changed, fox + fox#p1 removed
+    assert set(index.row_of) == {"owl", "owl#p1"}
+    assert index.sync(cache) == (0, 0)
+
+def test_sync_without_cache_raises(tmp_path):
+    index, _ = build(tmp_path, n=50)
+    with pytest.raises(FileNotFoundError):
+        index.sync(tmp_path / "missing")
@@ -0,0 +1,85 @@
+import time
+import threading
+
+import pytest
+
+import story_queue as sq
+
+def write_story(slug, staging_parent):
+    out = staging_parent / slug
+    out.mkdir(parents=True)
+    (out / "manifest.json").write_text("{}")
+    return True
+
+def make_queue(tmp_path, lease_seconds, slugs=("a",)):
+    queue = sq.StoryQueue(tmp_path / "queue.db", lease_seconds)
+    queue.enqueue([(slug, tmp_path / "source" / slug) for slug in slugs])
+    return queue
+
+def job_row(queue, slug):
+    with queue.lock:
+        return queue.conn.execute("SELECT state, attempts, completions FROM jobs WHERE slug = ?",
+                                  (slug,)).fetchone()
+
+def test_expired_lease_cannot_be_renewed_or_completed(tmp_path):
+    queue = make_queue(tmp_path, 0.1)
+    slug, _, token = queue.claim("host-1")
+    time.sleep(0.2)
+    assert not queue.heartbeat(slug, token)
+    with pytest.raises(sq.LeaseLost):
+        queue.complete(slug, token)
+
+def test_heartbeat_stops_renewing_at_deadline(tmp_path):
+    queue = make_queue(tmp_path, 0.3)
+    slug, _, token = queue.claim("host-1")
+    heartbeat = sq.Heartbeat(queue, slug, token, deadline=0.15)
+    heartbeat.start()
+    time.sleep(0.6)
+    assert heartbeat.expired and not heartbeat.lost
+    # The lease was left to run out, so another host can take the job
+    assert queue.claim("host-2")[0] == slug
+    heartbeat.stop()
+
+def test_hung_handler_is_abandoned_and_the_job_reclaimed(tmp_path):
+    queue = make_queue(tmp_path, 0.3)
+    release = threading.Event()
+    calls = []
+
+    def handler(slug, source, staging_parent):
+        calls.append(slug)
+        if len(calls) == 1:
+            release.wait()                                # hangs until the test ends
+        return write_story(slug, staging_parent)
+
+    stats = sq.run_worker(queue, handler, tmp_path / "processed", tmp_path / ".staging",
+                          owner="host-1", job_deadline=0.5)
+    release.set()
+    assert stats == {"done": 1, "failed": 0, "lost": 0, "abandoned": 1}
+    assert job_row(queue, "a") == ("done", 2, 1)
+    assert (tmp_path / "processed" / "a" / "manifest.json").exists()
+
+def test_simulation_reclaims_stalled_jobs(tmp_path):
+    _, jobs, problems = sq.simulate(hosts=2, stories=12, work_seconds=0.02, crash_rate=0.5,
+                                    lease_seconds=0.3, root=tmp_path / "sim")
+    assert problems == []
+    assert any(attempts > 1 for _, _, _, attempts in jobs)
+
+def test_queue_uses_rollback_journal(tmp_path):
+    queue = make_queue(tmp_path, 1.0)
+    with queue.lock:
+        assert queue.conn.execute("PRAGMA journal_mode").fetchone()[0] == "delete"
+
+def test_failures_are_reported(tmp_path):
+    queue = make_queue(tmp_path, 1.0, slugs=("a", "b"))
+    failures = []
+
+    def handler(slug, source, staging_parent):
+        if slug == "b":
+            raise RuntimeError("pandoc failed")
+        return write_story(slug, staging_parent)
+
+    stats = sq.run_worker(queue, handler, tmp_path / "processed", tmp_path / ".staging", owner="host-1",
+                          on_failed=lambda slug, source, error: failures.append((slug, source.name, str(error))))
+    assert stats["done"] == 1 and stats["failed"] == sq.MAX_ATTEMPTS
+    assert failures == [("b", "b", "pandoc failed")] * sq.MAX_ATTEMPTS
+    assert job_row(queue, "b")[0] == "failed"
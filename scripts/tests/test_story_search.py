@@ -0,0 +1,89 @@
+import json
+
+import numpy as np
+
+import story_search as ss
+
+def write_story(processed, slug, title, pages):
+    story_dir = processed / slug
+    story_dir.mkdir(parents=True, exist_ok=True)
+    (story_dir / "story.json").write_text(json.dumps({
+        "title": title,
+        "pages": [{"number": n, "content": content, "coaching": coaching}
+                  for n, (content, coaching) in enumerate(pages, 1)],
+    }))
+
+def index_dirs(index_dir):
+    return sorted(d.name for d in index_dir.iterdir() if d.is_dir())
+
+def test_varint_round_trip():
+    values = np.array([0, 1, 127, 128, 300, 16383, 16384, 2**21, 2**35 + 7, 2**63 - 1], dtype=np.uint64)
+    encoded = ss.varint_encode(values)
+    assert encoded[:4] == bytes([0, 1, 127, 0x80]) and encoded[4] == 1
+    assert ss.varint_decode(encoded).astype(np.uint64).tolist() == values.tolist()
+    # Single-byte values take the fast path
+    assert ss.varint_decode(ss.varint_encode([5, 0, 99])).tolist() == [5, 0, 99]
+    assert ss.varint_encode([]) == b""
+
+def test_bm25f_ranks_title_and_frequency(tmp_path):
+    processed, index_dir = tmp_path / "processed", tmp_path / "search"
+    write_story(processed, "owl", "The Sleepy Owl", [("The owl sleeps all day.", "Talk about rest.")])
+    write_story(processed, "fox", "Fox Finds a Friend", [
+        ("An owl hoots. The owl and the owl's friend fly.", "Count the birds."),
+        ("The fox runs home.", "Talk about home."),
+    ])
+    write_story(processed, "bear", "Bear Shares", [("The bear shares honey.", "Why share?")])
+    ss.update_index(processed, index_dir)
+    index = ss.SearchIndex(index_dir)
+
+    results = index.search("owl")
+    assert [doc for doc, _ in results] == ["owl#p1", "fox#p1"]
+    assert results[0][1] > results[1][1] > 0
+    assert index.search("fox home")[0][0] == "fox#p2"
+    assert index.search("the") == []                      # stopwords only
+    assert index.search("penguin") == []
+
+def test_update_replaces_and_deletes_stories(tmp_path):
+    processed, index_dir = tmp_path / "processed", tmp_path / "search"
+    write_story(processed, "owl", "Owl", [("Owl hoots at night.", "")])
+    write_story(processed, "fox", "Fox", [("Fox runs.", "")])
+    write_story(processed, "bear", "Bear", [("Bear eats honey.", "")])
+    assert ss.update_index(processed, index_dir)[:2] == (["bear", "fox", "owl"], [])
+
+    write_story(processed, "owl", "Owl", [("Owl naps in the sun.", "")])
+    (processed / "fox" / "story.json").unlink()
+    (processed / "fox").rmdir()
+    changed, removed, segments = ss.update_index(processed, index_dir)
+    assert (changed, removed, segments) == (["owl"], ["fox"], 2)
+
+    index = ss.SearchIndex(index_dir)
+    assert index.search("night") == [] and index.search("fox") == []
+    assert [doc for doc, _ in index.search("sun")] == ["owl#p1"]
+    assert [doc for doc, _ in index.search("honey")] == ["bear#p1"]
+
+    # The merge drops both old segments, after the manifest stops listing them
+    assert ss.update_index(processed, index_dir, merge=True)[2] == 1
+    manifest = json.loads((index_dir / "segments.json").read_text())
+    assert index_dirs(index_dir) == manifest["segments"] == ["seg-000003"]
+    index = ss.SearchIndex(index_dir)
+    assert [doc for doc, _ in index.search("owl sun")] == ["owl#p1"]
+    assert [doc for doc, _ in index.search("honey")] == ["bear#p1"]
+
+def test_dead_segments_are_removed_after_the_manifest_is_saved(tmp_path, monkeypatch):
+    processed, index_dir = tmp_path / "processed", tmp_path / "search"
+    write_story(processed, "owl", "Owl", [("Owl hoots.", "")])
+    ss.update_index(processed, index_dir)
+    write_story(processed, "owl", "Owl", [("Owl naps.", "")])
+
+    seen = []
+    save_json = ss.save_json
+    def record(path, data):
+        save_json(path, data)
+        if path.name == "segments.json":
+            seen.append(index_dirs(index_dir))
+    monkeypatch.setattr(ss, "save_json", record)
+
+    ss.update_index(processed, index_dir)
+    # The replaced segment still existed when segments.json was written
+    assert seen == [["seg-000001", "seg-000002"]]
+    assert index_dirs(index_dir) == ["seg-000002"]
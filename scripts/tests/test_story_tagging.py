@@ -0,0 +1,74 @@
+import json
+
+from PIL import Image
+
+import story_tagging
+from story_catalog import Catalog
+
+def make_story(processed, slug, colors, tags=(), manifest=True):
+    story_dir = processed / slug
+    story_dir.mkdir(parents=True)
+    for n, color in enumerate(colors):
+        name = "cover.webp" if n == 0 else f"page-{n}.webp"
+        Image.new("RGB", (64 + 16 * n, 48), color).save(story_dir / name, "WEBP")
+    (story_dir / "story.json").write_text(json.dumps(
+        {"title": slug.title(), "tags": list(tags), "pages": [{"number": 1, "content": "Hi", "coaching": ""}]}))
+    if manifest:
+        (story_dir / "manifest.json").write_text(json.dumps({"slug": slug, "name": slug.title()}))
+    return story_dir
+
+def run(processed, cache, **kwargs):
+    return story_tagging.tag_stories(processed, cache, story_tagging.StandinTagger(), threads=2, **kwargs)
+
+def test_pixel_batches_respect_budget():
+    pixels = [400, 100, 300, 200, 100]
+    batches = story_tagging.pixel_batches(pixels, 500)
+    assert sorted(i for batch in batches for i in batch) == list(range(5))
+    assert all(sum(pixels[i] for i in batch) <= 500 for batch in batches)
+    # Sorted by size, so similar images share a batch
+    assert [[pixels[i] for i in batch] for batch in batches] == [[100, 100, 200], [300], [400]]
+
+def test_tags_are_batched_and_cached_by_model_and_sha256(tmp_path):
+    processed, cache = tmp_path / "processed", tmp_path / "cache.json"
+    make_story(processed, "fox", ["red", "green", "blue"])
+    make_story(processed, "owl", ["red", "white"])          # cover identical to fox's
+
+    stats = run(processed, cache, max_batch_pixels=2 * 64 * 48)
+    assert stats["images"] == 5 and stats["tagged"] == 4 and stats["cached"] == 1
+    assert stats["batches"] > 1
+
+    manifest = json.loads((processed / "fox" / "manifest.json").read_text())
+    assert set(manifest["image_tags"]) == {"cover.webp", "page-1.webp", "page-2.webp"}
+    assert manifest["tagging_model"] == "standin-bytehist-v1"
+    assert manifest["suggested_tags"] and manifest["name"] == "Fox"
+    assert all(key.startswith("standin-bytehist-v1:") for key in json.loads(cache.read_text()))
+
+    rerun = run(processed, cache)
+    assert (rerun["tagged"], rerun["cached"], rerun["batches"]) == (0, 5, 0)
+    assert json.loads((processed / "fox" / "manifest.json").read_text()) == manifest
+
+def test_unprocessed_story_is_skipped(tmp_path):
+    processed, cache = tmp_path / "processed", tmp_path / "cache.json"
+    make_story(processed, "fox", ["red"])
+    make_story(processed, "draft", ["blue"], manifest=False)
+
+    stats = run(processed, cache)
+    assert stats["skipped"] == 1 and stats["images"] == 1
+    assert not (processed / "draft" / "manifest.json").exists()
+
+def test_apply_writes_story_json_and_catalog(tmp_path):
+    processed, cache = tmp_path / "processed", tmp_path / "cache.json"
+    make_story(processed, "fox", ["red", "green"])
+    make_story(processed, "owl", ["white"], tags=["Animals"])
+    catalog = Catalog(tmp_path / "catalog.db")
+
+    stats = run(processed, cache, apply=True, catalog=catalog)
+    assert stats["applied"] == 1
+    suggested = json.loads((processed / "fox" / "manifest.json").read_text())["suggested_tags"]
+    assert json.loads((processed / "fox" / "story.json").read_text())["tags"] == suggested
+    assert json.loads((processed / "owl" / "story.json").read_text())["tags"] == ["Animals"]
+
+    rows = catalog.query("SELECT tag FROM tags WHERE slug = 'fox'")
+    assert sorted(row["tag"] for row in rows) == sorted(suggested)
+    assert catalog.query("SELECT tag_count FROM stories WHERE slug = 'fox'")[0]["tag_count"] == len(suggested)
+    assert not catalog.query("SELECT 1 FROM tags WHERE slug = 'owl'")
@@ -0,0 +1,69 @@
+import os
+import json
+
+import story_tags as st
+
+def write_story(processed, slug, tags):
+    story_dir = processed / slug
+    story_dir.mkdir(parents=True, exist_ok=True)
+    path = story_dir / "story.json"
+    path.write_text(json.dumps({"title": slug, "tags": tags, "pages": []}))
+    # Force a new mtime so the size+mtime shortcut never hides an edit
+    stat = path.stat()
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+
+def test_tags_are_normalised_and_synonyms_folded():
+    assert st.tag_key("  Taking   Turns ") == "sharing"
+    assert st.tag_key("Emotions.") == "feelings"
+    assert st.tag_key("#School") == "school"
+    assert st.tag_key(" -- ") is None
+    assert st.normalize_tags(["Sharing", "taking turns", "Feelings", "emotion", ""]) == ["sharing", "feelings"]
+
+def build(tmp_path):
+    processed = tmp_path / "processed"
+    write_story(processed, "bear", ["Sharing", "School"])
+    write_story(processed, "duck", ["taking turns", "Feelings"])
+    write_story(processed, "fox", ["Emotions", "Friends"])
+    write_story(processed, "owl", ["School", "Bedtime"])
+    index = st.TagIndex()
+    assert index.update(processed) == ["bear", "duck", "fox", "owl"]
+    return processed, index
+
+def test_and_or_queries(tmp_path):
+    _, index = build(tmp_path)
+    assert index.slugs(index.query(all_tags=["sharing"])) == ["bear", "duck"]
+    assert index.slugs(index.query(all_tags=["Turn-Taking", "school"])) == ["bear"]
+    assert index.slugs(index.query(any_tags=["feeling", "bed time"])) == ["duck", "fox", "owl"]
+    assert index.slugs(index.query(all_tags=["school"], any_tags=["sharing", "sleep"])) == ["bear", "owl"]
+    assert index.slugs(index.query(all_tags=["school", "unknown"])) == []
+    assert index.slugs(index.query()) == ["bear", "duck", "fox", "owl"]
+    assert index.facets()["sharing"] == 2 and index.facets()["school"] == 2
+    assert index.labels["school"] == "School" and index.labels["friendship"] == "Friendship"
+
+def test_deleted_story_leaves_a_tombstone(tmp_path):
+    processed, index = build(tmp_path)
+    path = tmp_path / "tag-index.json"
+    for child in (processed / "duck").iterdir():
+        child.unlink()
+    (processed / "duck").rmdir()
+
+    assert index.update(processed) == ["duck"]
+    index.save(path)
+    index = st.TagIndex.load(path)
+    # Doc ids are not reused: duck's slot stays empty and the others keep their ids
+    assert index.stories[1] == {"slug": None, "tags": []}
+    assert index.doc_of == {"bear": 0, "fox": 2, "owl": 3}
+    assert index.slugs(index.query(any_tags=["sharing", "feelings"])) == ["bear", "fox"]
+    assert json.loads(path.read_text())["facets"]["sharing"] == 1
+
+    write_story(processed, "duck", ["Sharing"])
+    assert index.update(processed) == ["duck"]
+    assert index.doc_of["duck"] == 4
+    assert index.slugs(index.query(all_tags=["sharing"])) == ["bear", "duck"]
+
+def test_update_only_reindexes_changed_stories(tmp_path):
+    processed, index = build(tmp_path)
+    assert index.update(processed) == []
+    write_story(processed, "owl", ["School"])
+    assert index.update(processed) == ["owl"]
+    assert "bedtime" not in index.postings and "bedtime" not in index.labels
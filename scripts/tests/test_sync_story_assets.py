@@ -0,0 +1,75 @@
+import sys
+import json
+import time
+
+import pytest
+
+pytest.importorskip("boto3")
+
+from conftest import load_script
+
+sync = load_script("sync-story-assets.py")
+
+class FakeClient:
+    """Records uploaded keys; the upload of `crash_on` kills the run once `crash_after` exists"""
+
+    def __init__(self, crash_on=None, crash_after=None):
+        self.crash_on, self.crash_after = crash_on, crash_after
+        self.keys = []
+
+    def upload_file(self, filename, bucket, key, ExtraArgs=None, Config=None):
+        if self.crash_on and self.crash_on in key:
+            deadline = time.monotonic() + 5
+            while not self.crash_after() and time.monotonic() < deadline:
+                time.sleep(0.01)
+            raise SystemExit("killed")
+        self.keys.append((filename, key))
+
+def make_story(processed, slug, names):
+    story_dir = processed / slug
+    story_dir.mkdir(parents=True)
+    (story_dir / "manifest.json").write_text(json.dumps({"slug": slug}))
+    for name in names:
+        (story_dir / name).write_bytes(f"{slug} {name}".encode())
+    return story_dir
+
+def run(monkeypatch, processed, client):
+    monkeypatch.setattr(sync, "make_client", lambda endpoint_url, workers=sync.WORKERS: client)
+    monkeypatch.setattr(sys, "argv", ["sync-story-assets.py", "--source", str(processed),
+                                      "--bucket", "test", "--workers", "1"])
+    return sync.main()
+
+def test_pool_fits_every_multipart_thread():
+    client = sync.make_client("http://127.0.0.1:9", workers=16)
+    assert client.meta.config.max_pool_connections == 16 * sync.MAX_CONCURRENCY
+
+def test_finished_stories_are_saved_before_a_crash(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    processed = tmp_path / "processed"
+    make_story(processed, "fox", ["cover.webp", "page-1.webp"])
+    make_story(processed, "owl", ["cover.webp", "page-1.webp"])
+
+    fox_saved = lambda: "objects" in json.loads((processed / "fox" / "manifest.json").read_text())
+    with pytest.raises(SystemExit):
+        run(monkeypatch, processed, FakeClient(crash_on="community/owl/page-1", crash_after=fox_saved))
+    fox = json.loads((processed / "fox" / "manifest.json").read_text())
+    assert set(fox["objects"]) == {"cover.webp", "page-1.webp"}
+    assert "objects" not in json.loads((processed / "owl" / "manifest.json").read_text())
+
+    # The re-run only sends what the crash lost
+    client = FakeClient()
+    assert run(monkeypatch, processed, client) == 0
+    assert sorted(key.split("/")[1] for _, key in client.keys) == ["owl", "owl"]
+
+def test_each_file_is_uploaded_under_its_own_key(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    processed = tmp_path / "processed"
+    story_dir = make_story(processed, "fox", ["cover.webp", "page-1.webp"])
+    (story_dir / "thumb-320").mkdir()
+    (story_dir / "thumb-320" / "cover.webp").write_bytes(b"small cover")
+
+    client = FakeClient()
+    assert run(monkeypatch, processed, client) == 0
+    objects = json.loads((story_dir / "manifest.json").read_text())["objects"]
+    assert sorted(client.keys) == sorted((str(story_dir / name), obj["key"]) for name, obj in objects.items())
+    assert objects["thumb-320/cover.webp"]["key"].startswith("community/fox/thumb-320/cover.")
@@ -0,0 +1,57 @@
+import json
+
+from upload_ledger import UploadLedger, LEGACY_TARGET
+
+def test_targets_do_not_share_uploads(tmp_path):
+    path = tmp_path / "ledger.json"
+    image = tmp_path / "cover.webp"
+    image.write_bytes(b"webp bytes")
+
+    app = UploadLedger("https://dev.icraftstories.com/", path)
+    sha256, record = app.uploaded_image("fox", "cover", image)
+    assert record is None
+    app.record_image("fox", "cover", sha256, "img-1", "https://dev.icraftstories.com/i/1")
+    app.complete_story("fox", "story-1")
+
+    api = UploadLedger("https://api.dev.icraftstories.com", path)
+    assert not api.is_complete("fox")
+    assert api.uploaded_image("fox", "cover", image) == (sha256, None)
+    assert api.uploaded_image("owl", "cover", image) == (sha256, None)
+    api.record_image("fox", "cover", sha256, "api-9", "https://cdn.example.com/9")
+
+    # Switching back reads the first target's records, untouched by the second
+    app = UploadLedger("https://dev.icraftstories.com", path)
+    assert app.is_complete("fox")
+    assert app.uploaded_image("owl", "cover", image)[1]["remote_id"] == "img-1"
+    assert app.summary()["blobs"] == 1
+
+def test_version_1_ledger_is_not_reused(tmp_path):
+    path = tmp_path / "ledger.json"
+    path.write_text(json.dumps({
+        "version": 1,
+        "stories": {"fox": {"status": "complete", "remote_id": "old", "images": {}}},
+        "blobs": {},
+    }))
+
+    ledger = UploadLedger("https://api.dev.icraftstories.com", path)
+    assert not ledger.is_complete("fox")
+    ledger.save()
+    saved = json.loads(path.read_text())
+    assert saved["version"] == 2
+    assert saved["targets"][LEGACY_TARGET]["stories"]["fox"]["remote_id"] == "old"
+
+def test_edited_story_is_pending_again(tmp_path):
+    path = tmp_path / "ledger.json"
+    story_json = tmp_path / "story.json"
+    story_json.write_text('{"title": "Fox"}')
+
+    ledger = UploadLedger("https://api.dev.icraftstories.com", path)
+    ledger.start_story("fox", story_json)
+    ledger.complete_story("fox", "story-1")
+    assert ledger.is_complete("fox", story_json)
+
+    story_json.write_text('{"title": "Fox and Friends"}')
+    reloaded = UploadLedger("https://api.dev.icraftstories.com", path)
+    assert not reloaded.is_complete("fox", story_json)
+    # Without the story.json only the recorded status is checked
+    assert reloaded.is_complete("fox")
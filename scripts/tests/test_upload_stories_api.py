@@ -0,0 +1,88 @@
+import json
+import uuid
+
+import pytest
+
+pytest.importorskip("requests")
+
+from conftest import load_script
+from upload_ledger import UploadLedger
+
+api = load_script("upload-stories-api.py")
+
+STORY = {"title": "Fox", "tags": ["Animals"], "pages": [
+    {"number": 1, "content": "Fox wakes up.", "coaching": "Mornings"},
+    {"number": 2, "content": "Fox eats.", "coaching": "Meals"},
+]}
+
+@pytest.fixture
+def standin(request):
+    server, url = api.start_standin(fail_images=getattr(request, "param", 0))
+    yield server, url
+    server.shutdown()
+
+def make_story(processed, slug):
+    story_dir = processed / slug
+    story_dir.mkdir(parents=True)
+    (story_dir / "story.json").write_text(json.dumps(STORY))
+    for name in ("cover.webp", "page-1.webp", "page-2.webp"):
+        (story_dir / name).write_bytes(f"RIFF {slug} {name}".encode())
+    return story_dir
+
+def uploader(url, ledger_path):
+    return api.ApiStoryUploader(url, api.STANDIN_IMAGES_ENDPOINT, api.STANDIN_STORIES_ENDPOINT,
+                                image_workers=2, ledger=UploadLedger(url, ledger_path))
+
+def test_story_uploads_with_images_and_rerun_skips_it(tmp_path, standin):
+    server, url = standin
+    processed, ledger_path = tmp_path / "processed", tmp_path / "ledger.json"
+    make_story(processed, "fox")
+
+    assert uploader(url, ledger_path).upload_all_stories(processed) == 0
+    store = server.store
+    assert len(store["images"]) == 3 and len(store["stories"]) == 1
+    (story,) = store["stories"].values()
+    assert story["title"] == "Fox" and story["coverImageUrl"].startswith("standin://images/")
+    assert [page["imageUrl"] is not None for page in story["pages"]] == [True, True]
+
+    # A fresh uploader reads the ledger and sends nothing
+    rerun = uploader(url, ledger_path)
+    assert rerun.ledger.is_complete("fox")
+    assert rerun.upload_all_stories(processed) == 0
+    assert len(store["images"]) == 3 and len(store["stories"]) == 1
+
+@pytest.mark.parametrize("standin", [1], indirect=True)
+def test_retried_image_is_stored_once(tmp_path, standin):
+    server, url = standin
+    story_dir = make_story(tmp_path / "processed", "fox")
+
+    # The first response is a 503 after the image was stored; the retry carries the same key
+    uploaded = uploader(url, tmp_path / "ledger.json").upload_image(story_dir / "cover.webp", "cover")
+    assert list(server.store["images"]) == [uploaded["id"]]
+    assert server.store["fail_images"] == 0
+
+def test_repeated_idempotency_key_returns_first_image(tmp_path, standin):
+    server, url = standin
+    story_dir = make_story(tmp_path / "processed", "fox")
+    session = uploader(url, tmp_path / "ledger.json").session
+    key = str(uuid.uuid4())
+
+    responses = []
+    for _ in range(2):
+        with open(story_dir / "cover.webp", 'rb') as f:
+            responses.append(session.post(url + api.STANDIN_IMAGES_ENDPOINT, files={"file": ("cover.webp", f)},
+                                          headers={"Idempotency-Key": key}).json())
+    assert responses[0] == responses[1]
+    assert len(server.store["images"]) == 1
+
+def test_edited_story_is_uploaded_again(tmp_path, standin):
+    server, url = standin
+    processed, ledger_path = tmp_path / "processed", tmp_path / "ledger.json"
+    story_dir = make_story(processed, "fox")
+    assert uploader(url, ledger_path).upload_all_stories(processed) == 0
+
+    (story_dir / "story.json").write_text(json.dumps(dict(STORY, title="Fox at Dawn")))
+    assert uploader(url, ledger_path).upload_all_stories(processed) == 0
+    assert sorted(story["title"] for story in server.store["stories"].values()) == ["Fox", "Fox at Dawn"]
+    # The images did not change, so none were sent again
+    assert len(server.store["images"]) == 3
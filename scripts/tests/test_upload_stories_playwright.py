@@ -0,0 +1,18 @@
+import pytest
+
+pytest.importorskip("playwright")
+
+from conftest import load_script
+
+uploader = load_script("upload-stories-playwright.py")
+
+@pytest.mark.parametrize("url, story_id", [
+    ("https://dev.icraftstories.com/stories/8f14e45f", "8f14e45f"),
+    ("https://dev.icraftstories.com/stories/8f14e45f/edit?tab=pages", "8f14e45f"),
+    ("https://dev.icraftstories.com/stories/new", None),
+    ("https://dev.icraftstories.com/stories/new#saved", None),
+    ("https://dev.icraftstories.com/stories/", None),
+    ("https://dev.icraftstories.com/library?from=/stories/abc", None),
+])
+def test_story_id_from_url(url, story_id):
+    assert uploader.story_id_from_url(url) == story_id
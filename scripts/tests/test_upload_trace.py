@@ -0,0 +1,88 @@
+import json
+from types import SimpleNamespace
+
+import pytest
+
+import upload_trace as ut
+
+class Clock:
+    def __init__(self, start=1_000_000.0):
+        self.ms = start
+
+    def __call__(self):
+        return self.ms
+
+def request(url, start_ms, duration_ms, failed=False):
+    return SimpleNamespace(url=url, method="POST", resource_type="fetch", failure="net::ERR" if failed else None,
+                           timing={"startTime": start_ms, "responseStart": 5.0, "responseEnd": duration_ms})
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(ut, "now_ms", clock)
+    return clock
+
+def trace_story(tracer, clock, slug, steps, status="success"):
+    """Run spans of the given durations, each with one request starting inside it"""
+    tracer.start_story(slug, slug.title())
+    for name, duration in steps:
+        with tracer.span(name):
+            tracer.on_request(request(f"https://example.com/{name}", clock.ms + 1, duration / 2))
+            clock.ms += duration
+    tracer.finish_story(status)
+
+def test_correlate_assigns_requests_to_the_open_span(tmp_path, clock):
+    tracer = ut.StoryTracer(tmp_path)
+    tracer.start_story("fox", "Fox")
+    with tracer.span("navigate"):
+        clock.ms += 100
+    with tracer.span("file_set", section="cover"):
+        clock.ms += 300
+    tracer.on_request(request("https://example.com/page", 1_000_000 + 50, 40))
+    tracer.on_request(request("https://example.com/upload", 1_000_000 + 150, 200))
+    tracer.on_request(request("https://example.com/upload", 1_000_000 + 160, 20, failed=True))
+    tracer.on_request(request("https://analytics.example.com/", 1_000_000 + 900, 10))
+    tracer.correlate()
+
+    navigate, file_set = tracer.story["spans"]
+    assert (navigate["requests"], navigate["request_ms"]) == (1, 40.0)
+    assert (file_set["requests"], file_set["request_ms"], file_set["section"]) == (2, 220.0, "cover")
+    assert [r["span"] for r in tracer.story["requests"]] == ["navigate", "file_set", "file_set", None]
+    assert tracer.story["requests"][2]["failed"]
+
+def test_report_histograms_one_run(tmp_path, clock, capsys):
+    old_run = ut.new_run_dir(tmp_path)
+    trace_story(ut.StoryTracer(old_run), clock, "old", [("save", 99999)])
+    run_dir = ut.new_run_dir(tmp_path)
+    assert run_dir != old_run and run_dir.parent == tmp_path
+
+    tracer = ut.StoryTracer(run_dir)
+    trace_story(tracer, clock, "fox", [("navigate", 40), ("save", 700)])
+    trace_story(tracer, clock, "owl", [("navigate", 200), ("save", 3000)])
+    trace_story(tracer, clock, "bear", [("navigate", 60)], status="failed")
+    assert json.loads((run_dir / "fox.json").read_text())["total_ms"] == 740
+
+    summary = ut.write_trace_report(run_dir)
+    assert summary["navigate"]["count"] == 3
+    assert summary["navigate"]["histogram"]["<=50ms"] == 1
+    assert summary["navigate"]["histogram"]["<=100ms"] == 1
+    assert summary["navigate"]["histogram"]["<=250ms"] == 1
+    assert summary["save"]["p50_ms"] == 700 and summary["save"]["max_ms"] == 3000
+    assert summary["save"]["histogram"][">30000ms"] == 0       # the earlier run is not included
+    assert summary["save"]["network_p50_ms"] == 350
+    # Only successful stories count towards the story total
+    assert summary["story_total"]["count"] == 2
+    assert json.loads((run_dir / "summary.json").read_text()) == summary
+
+    # A second report over the same run ignores its own summary.json
+    assert ut.write_trace_report(run_dir) == summary
+    table = capsys.readouterr().out
+    assert "Upload Latency (ms)" in table
+    assert [line.split()[:2] for line in table.splitlines() if line.startswith(("navigate", "save"))][:2] == [
+        ["navigate", "3"], ["save", "2"]]
+
+def test_percentile_is_nearest_rank():
+    values = list(range(1, 101))
+    assert ut.percentile(values, 50) == 50
+    assert ut.percentile(values, 99) == 99
+    assert ut.percentile([7], 90) == 7
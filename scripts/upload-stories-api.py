@@ -0,0 +1,365 @@
+#!/usr/bin/env python3
+"""
+Headless story upload via the story API - no browser
+
+Posts the same story.json and images that upload-stories-playwright.py
+drives through the editor, but straight to the API:
+
+1. Upload cover + page images in parallel (multipart, pooled connections)
+2. Create the story with the returned image URLs in one JSON request
+
+The endpoint paths are not published anywhere in this repo, so they must
+be given for a real run (--images-endpoint/--stories-endpoint or the
+environment). A local stand-in server implements the two endpoints at
+STANDIN_IMAGES_ENDPOINT/STANDIN_STORIES_ENDPOINT, for tests and benchmarks
+without touching dev/prod.
+
+Only image uploads are retried on 502/503/504: each carries an
+Idempotency-Key, and the ledger dedupes images by content anyway. The
+create-story POST is never retried automatically, so a timeout cannot
+create the story twice.
+
+Usage:
+    export ICRAFT_API_URL=https://api.dev.icraftstories.com
+    export ICRAFT_API_IMAGES_ENDPOINT=/path/to/images
+    export ICRAFT_API_STORIES_ENDPOINT=/path/to/stories
+    export ICRAFT_API_TOKEN=<session token>
+    python3 upload-stories-api.py                      # upload all stories
+    python3 upload-stories-api.py --limit 1            # first story only
+    python3 upload-stories-api.py --standin            # upload against a local stand-in
+    python3 upload-stories-api.py --serve-standin      # run the stand-in server only
+
+Progress is checkpointed in the upload ledger (see upload_ledger.py):
+re-runs skip completed stories, and images whose bytes the server already
+has are never sent again.
+"""
+
+import os
+import sys
+import json
+import time
+import uuid
+import argparse
+import threading
+from pathlib import Path
+from email.parser import BytesParser
+from email.policy import HTTP
+from concurrent.futures import ThreadPoolExecutor
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+from story_catalog import Catalog
+from upload_ledger import UploadLedger, LEDGER_FILE, duplicate_of
+
+STORIES_DIR = Path("stories-tmp/processed")
+
+# Endpoint paths served by the local stand-in. Unverified against the real
+# API - real runs take the paths from the command line or environment.
+STANDIN_IMAGES_ENDPOINT = "/v1/images"
+STANDIN_STORIES_ENDPOINT = "/v1/stories"
+
+RETRY_STATUSES = [502, 503, 504]
+
+IMAGE_WORKERS = 8      # Parallel image uploads per story
+REQUEST_TIMEOUT = 60   # Seconds per request
+
+class ApiStoryUploader:
+    def __init__(self, api_url, images_endpoint, stories_endpoint, token=None,
+                 image_workers=IMAGE_WORKERS, ledger=None):
+        try:
+            import requests
+            from requests.adapters import HTTPAdapter, Retry
+        except ImportError:
+            print("Error: requests not installed")
+            print("Install with: ../venv/bin/pip install requests")
+            sys.exit(1)
+
+        self.api_url = api_url.rstrip('/')
+        self.images_url = f"{self.api_url}{images_endpoint}"
+        self.stories_url = f"{self.api_url}{stories_endpoint}"
+        self.image_workers = image_workers
+        self.ledger = ledger or UploadLedger(self.api_url, catalog=Catalog())
+
+        # One pooled session; keep-alive connections are shared by all image threads.
+        # The default Retry methods exclude POST, so creating a story is never resent.
+        self.session = requests.Session()
+        adapter = HTTPAdapter(
+            pool_connections=1,
+            pool_maxsize=image_workers,
+            max_retries=Retry(total=3, backoff_factor=0.5, status_forcelist=RETRY_STATUSES)
+        )
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        # Image uploads carry an Idempotency-Key, so their POSTs may be retried
+        image_adapter = HTTPAdapter(
+            pool_connections=1,
+            pool_maxsize=image_workers,
+            max_retries=Retry(total=3, backoff_factor=0.5, status_forcelist=RETRY_STATUSES,
+                              allowed_methods=Retry.DEFAULT_ALLOWED_METHODS | {"POST"})
+        )
+        self.session.mount(self.images_url, image_adapter)
+        if token:
+            self.session.headers["Authorization"] = f"Bearer {token}"
+
+    def upload_image(self, file_path: Path, section: str):
+        """Upload one image (multipart) and return the server's {"id", "url"}"""
+        with open(file_path, 'rb') as f:
+            response = self.session.post(
+                self.images_url,
+                files={"file": (file_path.name, f, "image/webp")},
+                data={"section": section},
+                headers={"Idempotency-Key": str(uuid.uuid4())},
+                timeout=REQUEST_TIMEOUT
+            )
+        response.raise_for_status()
+        return response.json()
+
+    def checkpointed_upload(self, slug, section, path):
+        """Upload an image unless the ledger shows the server already has these bytes"""
+        sha256, record = self.ledger.uploaded_image(slug, section, path)
+        if record:
+            self.ledger.record_image(slug, section, sha256, record["remote_id"], record["url"])
+            return {"id": record["remote_id"], "url": record["url"], "skipped": True}
+        uploaded = self.upload_image(path, section)
+        self.ledger.record_image(slug, section, sha256, uploaded.get("id"), uploaded.get("url"))
+        return uploaded
+
+    def upload_images(self, slug, images):
+        """Upload [(section, path)] in parallel; returns {section: {"id", "url"}}"""
+        with ThreadPoolExecutor(max_workers=self.image_workers) as pool:
+            futures = {section: pool.submit(self.checkpointed_upload, slug, section, path)
+                       for section, path in images}
+            return {section: future.result() for section, future in futures.items()}
+
+    def create_story(self, payload):
+        response = self.session.post(
+            self.stories_url,
+            json=payload,
+            timeout=REQUEST_TIMEOUT
+        )
+        response.raise_for_status()
+        return response.json()
+
+    def upload_story(self, story_dir: Path):
+        """Upload a complete story: images in parallel, then one create call"""
+        slug = story_dir.name
+        with open(story_dir / "story.json") as f:
+            story_data = json.load(f)
+
+        print(f"\n📖 Uploading: {story_data['title']}")
+        self.ledger.start_story(slug, story_dir / "story.json")
+
+        images = []
+        cover_path = story_dir / "cover.webp"
+        if cover_path.exists():
+            images.append(("cover", cover_path))
+        for i, _ in enumerate(story_data["pages"], 1):
+            page_path = story_dir / f"page-{i}.webp"
+            if page_path.exists():
+                images.append((f"page-{i}", page_path))
+
+        uploaded = self.upload_images(slug, images)
+        skipped = sum(1 for image in uploaded.values() if image.get("skipped"))
+        print(f"  ✓ {len(uploaded) - skipped} images uploaded, {skipped} already on server")
+
+        payload = {
+            "title": story_data["title"],
+            "tags": story_data["tags"],
+            "coverImageUrl": uploaded.get("cover", {}).get("url"),
+            "pages": [
+                {
+                    "pageNumber": i,
+                    "content": page["content"],
+                    "coachingContent": page["coaching"],
+                    "imageUrl": uploaded.get(f"page-{i}", {}).get("url"),
+                }
+                for i, page in enumerate(story_data["pages"], 1)
+            ],
+        }
+        created = self.create_story(payload)
+        self.ledger.complete_story(slug, created.get("id"))
+        print(f"  ✓ Story saved ({created.get('id')})")
+        return created
+
+    def upload_all_stories(self, stories_dir: Path, limit=None):
+        """Upload all stories in directory"""
+        success_count = 0
+        fail_count = 0
+
+        story_dirs = sorted([d for d in stories_dir.iterdir() if d.is_dir()])
+        if limit:
+            story_dirs = story_dirs[:limit]
+        total = len(story_dirs)
+
+        print(f"\n🚀 Starting API upload of {total} stories to {self.api_url}")
+        started = time.monotonic()
+
+        for i, story_dir in enumerate(story_dirs, 1):
+            if self.ledger.is_complete(story_dir.name, story_dir / "story.json"):
+                print(f"\n[{i}/{total}] {story_dir.name}: ✓ Already uploaded, skipping")
+                success_count += 1
+                continue
+            original = duplicate_of(story_dir)
+            if original:
+                print(f"\n[{i}/{total}] {story_dir.name}: ⚠ Duplicate of {original}, skipping")
+                continue
+            try:
+                print(f"\n[{i}/{total}] {story_dir.name}")
+                self.upload_story(story_dir)
+                success_count += 1
+                print(f"✅ Success ({success_count}/{i})")
+            except Exception as e:
+                fail_count += 1
+                print(f"❌ Failed: {e}")
+
+        elapsed = time.monotonic() - started
+        print(f"\n{'='*60}")
+        print(f"Upload Complete ({elapsed:.1f}s, {total / elapsed if elapsed else 0:.2f} stories/s)")
+        print(f"Success: {success_count}/{total}")
+        print(f"Failed: {fail_count}/{total}")
+        ledger = self.ledger.summary()
+        print(f"Ledger: {ledger['complete']} complete, {ledger['partial']} partial, "
+              f"{ledger['blobs']} unique images on server")
+        print(f"{'='*60}")
+        return 0 if fail_count == 0 else 1
+
+
+# --- Local stand-in server --------------------------------------------------
+
+class StandinHandler(BaseHTTPRequestHandler):
+    """
+    Implements STANDIN_IMAGES_ENDPOINT and STANDIN_STORIES_ENDPOINT in memory.
+    An image POST repeating an Idempotency-Key gets the first response back
+    instead of storing the image again.
+    """
+    protocol_version = "HTTP/1.1"   # keep-alive, like the real API
+
+    def log_message(self, format, *args):
+        pass
+
+    def send_json(self, status, body):
+        data = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        body = self.rfile.read(length)
+        store = self.server.store
+
+        if self.path == STANDIN_IMAGES_ENDPOINT:
+            message = BytesParser(policy=HTTP).parsebytes(
+                f"Content-Type: {self.headers['Content-Type']}\r\n\r\n".encode() + body
+            )
+            parts = {part.get_param("name", header="content-disposition"): part
+                     for part in message.iter_parts()}
+            if "file" not in parts:
+                return self.send_json(400, {"error": "missing file"})
+            key = self.headers.get("Idempotency-Key")
+            with store["lock"]:
+                response = store["idempotency"].get(key)
+                if response is None:
+                    image_id = str(uuid.uuid4())
+                    store["images"][image_id] = len(parts["file"].get_payload(decode=True))
+                    response = {"id": image_id, "url": f"standin://images/{image_id}"}
+                    if key:
+                        store["idempotency"][key] = response
+                fail = store["fail_images"] > 0
+                if fail:
+                    store["fail_images"] -= 1
+            if fail:
+                # The image was stored, but the client sees a gateway error and retries
+                return self.send_json(503, {"error": "injected failure"})
+            return self.send_json(201, response)
+
+        if self.path == STANDIN_STORIES_ENDPOINT:
+            story = json.loads(body)
+            if not story.get("title"):
+                return self.send_json(400, {"error": "missing title"})
+            story_id = str(uuid.uuid4())
+            with store["lock"]:
+                store["stories"][story_id] = story
+            return self.send_json(201, {"id": story_id})
+
+        self.send_json(404, {"error": "not found"})
+
+def start_standin(port=0, fail_images=0):
+    """
+    Start the stand-in server in a background thread; returns (server, url).
+    The first `fail_images` image uploads are stored but answered with 503.
+    """
+    server = ThreadingHTTPServer(("127.0.0.1", port), StandinHandler)
+    server.daemon_threads = True
+    server.store = {"images": {}, "stories": {}, "idempotency": {}, "fail_images": fail_images,
+                    "lock": threading.Lock()}
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Upload processed stories via the story API")
+    parser.add_argument("--api-url", default=os.environ.get("ICRAFT_API_URL"),
+                        help="API base URL (default: $ICRAFT_API_URL)")
+    parser.add_argument("--images-endpoint", default=os.environ.get("ICRAFT_API_IMAGES_ENDPOINT"),
+                        help="Image upload path, e.g. /v1/images (default: $ICRAFT_API_IMAGES_ENDPOINT)")
+    parser.add_argument("--stories-endpoint", default=os.environ.get("ICRAFT_API_STORIES_ENDPOINT"),
+                        help="Create-story path, e.g. /v1/stories (default: $ICRAFT_API_STORIES_ENDPOINT)")
+    parser.add_argument("--limit", type=int, help="Only upload the first N stories")
+    parser.add_argument("--image-workers", type=int, default=IMAGE_WORKERS,
+                        help=f"Parallel image uploads per story (default: {IMAGE_WORKERS})")
+    parser.add_argument("--ledger", type=Path, default=LEDGER_FILE,
+                        help=f"Upload ledger file (default: {LEDGER_FILE})")
+    parser.add_argument("--standin", action="store_true",
+                        help="Upload against a local stand-in server instead of the API")
+    parser.add_argument("--serve-standin", action="store_true",
+                        help="Only run the stand-in server (Ctrl+C to stop)")
+    parser.add_argument("--port", type=int, default=8787,
+                        help="Port for --serve-standin (default: 8787)")
+    args = parser.parse_args()
+
+    if args.serve_standin:
+        server, url = start_standin(args.port)
+        print(f"Stand-in story API listening on {url}")
+        try:
+            threading.Event().wait()
+        except KeyboardInterrupt:
+            server.shutdown()
+        return 0
+
+    api_url = args.api_url
+    images_endpoint, stories_endpoint = args.images_endpoint, args.stories_endpoint
+    ledger_path = args.ledger
+    server = None
+    if args.standin:
+        server, api_url = start_standin()
+        images_endpoint, stories_endpoint = STANDIN_IMAGES_ENDPOINT, STANDIN_STORIES_ENDPOINT
+        print(f"Using local stand-in at {api_url}")
+        # Stand-in state is discarded on exit, so never share the real ledger
+        if ledger_path == LEDGER_FILE:
+            ledger_path = LEDGER_FILE.with_name(".upload-ledger-standin.json")
+            ledger_path.unlink(missing_ok=True)
+    elif not api_url:
+        print("Error: No API URL")
+        print("Set ICRAFT_API_URL or pass --api-url (or use --standin)")
+        return 1
+    elif not (images_endpoint and stories_endpoint):
+        print("Error: API endpoint paths not set")
+        print("Pass --images-endpoint and --stories-endpoint "
+              "(or set ICRAFT_API_IMAGES_ENDPOINT / ICRAFT_API_STORIES_ENDPOINT)")
+        return 1
+
+    uploader = ApiStoryUploader(api_url, images_endpoint, stories_endpoint,
+                                os.environ.get("ICRAFT_API_TOKEN"), args.image_workers,
+                                UploadLedger(api_url, ledger_path, catalog=None if args.standin else Catalog()))
+    try:
+        return uploader.upload_all_stories(STORIES_DIR, args.limit)
+    finally:
+        if server:
+            print(f"Stand-in received {len(server.store['stories'])} stories, "
+                  f"{len(server.store['images'])} images")
+            server.shutdown()
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -2,35 +2,136 @@
 """
 Event-based story upload using Playwright MCP
 Waits for actual UI events, not arbitrary timeouts
+
+Usage:
+    python3 upload-stories-playwright.py               # one story at a time
+    python3 upload-stories-playwright.py --workers 4   # pool of 4 browser contexts
+    python3 upload-stories-playwright.py --headless    # needs a cached login
+    python3 upload-stories-playwright.py --trace stories-tmp/traces  # latency report in traces/<run id>/
+
+The first headed run saves the logged-in session to stories-tmp/.auth-state.json;
+later runs (headed or headless) start from it and skip the login wait. Fonts,
+media and third-party analytics/asset requests are blocked, since the upload
+never needs them.
+
+Stories that finished are recorded in the upload ledger (upload_ledger.py)
+and skipped on re-runs. The editor only persists a story on save, so a story
+that failed part-way is re-entered from the start; the per-image checkpoints
+show where it stopped.
 """
 
+import re
 import json
+import time
 import asyncio
+import argparse
 from pathlib import Path
+from urllib.parse import urlparse
+from contextlib import nullcontext
 from playwright.async_api import async_playwright, TimeoutError as PlaywrightTimeout
 
+from story_catalog import Catalog
+from story_config import file_sha256
+from upload_ledger import UploadLedger, duplicate_of
+from upload_trace import StoryTracer, new_run_dir, write_trace_report
+
+# Cached login (cookies + localStorage) reused across runs
+AUTH_STATE_FILE = Path("stories-tmp/.auth-state.json")
+
+# Resource types the upload flow never needs
+BLOCKED_RESOURCE_TYPES = {"font", "media"}
+
+# Third-party hosts (analytics, tag managers, web fonts, support widgets)
+BLOCKED_DOMAINS = (
+    "google-analytics.com", "googletagmanager.com", "doubleclick.net",
+    "fonts.googleapis.com", "fonts.gstatic.com", "hotjar.com", "segment.io",
+    "intercom.io", "facebook.net", "clarity.ms",
+)
+
+# Editor paths under /stories/ that are not a saved story
+NON_STORY_SEGMENTS = {"new", "edit"}
+
+def story_id_from_url(url):
+    """Id of a saved story from its editor URL (/stories/<id>[/...]), or None"""
+    match = re.match(r"/stories/([^/]+)", urlparse(url).path)
+    if match and match.group(1) not in NON_STORY_SEGMENTS:
+        return match.group(1)
+    return None
+
+async def close_context(page):
+    """Close a page's browser context, ignoring one that is already gone"""
+    try:
+        await page.context.close()
+    except Exception:
+        pass
+
 class EventBasedStoryUploader:
-    def __init__(self, base_url="https://dev.icraftstories.com"):
+    def __init__(self, base_url="https://dev.icraftstories.com", ledger=None,
+                 headless=False, auth_state=AUTH_STATE_FILE, trace_dir=None):
         self.base_url = base_url
+        self.ledger = ledger or UploadLedger(base_url, catalog=Catalog())
+        self.headless = headless
+        self.auth_state = Path(auth_state)
         self.playwright = None
         self.browser = None
         self.page = None
+        self.label = ""
+        self.blocked_requests = 0
+        self.trace_dir = trace_dir
+        self.tracer = StoryTracer(trace_dir) if trace_dir else None
+
+    def span(self, name, **attrs):
+        """Tracing span for one upload step (no-op unless --trace is set)"""
+        return self.tracer.span(name, **attrs) if self.tracer else nullcontext()
+
+    async def block_nonessential(self, route):
+        """Abort fonts, media and third-party requests; let everything else through"""
+        request = route.request
+        host = request.url.split('/')[2] if '://' in request.url else ''
+        if (request.resource_type in BLOCKED_RESOURCE_TYPES
+                or any(host == d or host.endswith('.' + d) for d in BLOCKED_DOMAINS)):
+            self.blocked_requests += 1
+            await route.abort()
+        else:
+            await route.continue_()
+
+    async def new_context(self, storage_state=None):
+        """Browser context with request blocking, optionally pre-authenticated"""
+        context = await self.browser.new_context(storage_state=storage_state)
+        await context.route("**/*", self.block_nonessential)
+        return context
 
     async def setup(self):
         """Initialize browser and navigate to app"""
+        started = time.monotonic()
         self.playwright = await async_playwright().start()
-        self.browser = await self.playwright.chromium.launch(headless=False)
-        self.page = await self.browser.new_page()
+        self.browser = await self.playwright.chromium.launch(headless=self.headless)
+
+        cached = self.auth_state.exists()
+        context = await self.new_context(str(self.auth_state) if cached else None)
+        self.page = await context.new_page()
+        if self.tracer:
+            self.tracer.attach(self.page)
         await self.page.goto(self.base_url)
 
         # Wait for app to be ready (check for user profile or dashboard)
         try:
             await self.page.wait_for_selector('[data-testid="dashboard"]', timeout=10000)
-            print("✓ App loaded and user authenticated")
+            print("✓ App loaded and user authenticated" + (" (cached session)" if cached else ""))
         except PlaywrightTimeout:
+            if self.headless:
+                raise Exception(
+                    f"Not logged in and running headless - run once without --headless "
+                    f"to log in and refresh {self.auth_state}"
+                )
             print("⚠ Please log in manually...")
             await self.page.wait_for_selector('[data-testid="dashboard"]', timeout=60000)
 
+        # Refresh the cache so the next run starts logged in
+        self.auth_state.parent.mkdir(parents=True, exist_ok=True)
+        await context.storage_state(path=str(self.auth_state))
+        print(f"✓ Ready in {time.monotonic() - started:.1f}s")
+
     async def wait_for_upload_complete(self, identifier="upload"):
         """Wait for upload to complete by checking for success indicators"""
         # Option 1: Wait for success notification
@@ -71,32 +172,35 @@ class EventBasedStoryUploader:
 
     async def upload_image_and_wait(self, file_path: Path, identifier: str):
         """Upload image and wait for UI to confirm completion"""
-        # Click upload button
-        await self.page.click(f'[data-testid="{identifier}-upload-btn"]')
+        with self.span("file_set", section=identifier, bytes=file_path.stat().st_size):
+            # Click upload button
+            await self.page.click(f'[data-testid="{identifier}-upload-btn"]')
 
-        # Handle file chooser
-        async with self.page.expect_file_chooser() as fc_info:
-            file_chooser = await fc_info.value
-            await file_chooser.set_files(str(file_path))
+            # Handle file chooser
+            async with self.page.expect_file_chooser() as fc_info:
+                file_chooser = await fc_info.value
+                await file_chooser.set_files(str(file_path))
 
         # Wait for upload to complete (event-based, not timeout)
-        await self.wait_for_upload_complete(identifier)
-        print(f"  ✓ {identifier} uploaded")
+        with self.span("upload_confirm", section=identifier):
+            await self.wait_for_upload_complete(identifier)
+        print(f"{self.label}  ✓ {identifier} uploaded")
 
     async def set_as_background_and_wait(self, identifier: str):
         """Set image as background and wait for canvas to update"""
-        # Click "Set as Background" button
-        await self.page.click(f'[data-testid="{identifier}-set-background"]')
-
-        # Wait for canvas to update (check for background-image style)
-        await self.page.wait_for_function(
-            f"""() => {{
-                const canvas = document.querySelector('[data-testid="{identifier}-canvas"]');
-                return canvas && canvas.style.backgroundImage;
-            }}""",
-            timeout=5000
-        )
-        print(f"  ✓ {identifier} set as background")
+        with self.span("set_background", section=identifier):
+            # Click "Set as Background" button
+            await self.page.click(f'[data-testid="{identifier}-set-background"]')
+
+            # Wait for canvas to update (check for background-image style)
+            await self.page.wait_for_function(
+                f"""() => {{
+                    const canvas = document.querySelector('[data-testid="{identifier}-canvas"]');
+                    return canvas && canvas.style.backgroundImage;
+                }}""",
+                timeout=5000
+            )
+        print(f"{self.label}  ✓ {identifier} set as background")
 
     async def fill_form_and_wait(self, title: str, tags: list, coaching: str = ""):
         """Fill form fields and wait for validation"""
@@ -112,7 +216,7 @@ class EventBasedStoryUploader:
             await self.page.press('[data-testid="tag-input"]', 'Enter')
             await self.page.wait_for_selector(f'text="{tag}"')
 
-        print(f"  ✓ Form filled")
+        print(f"{self.label}  ✓ Form filled")
 
     async def save_story_and_wait(self):
         """Save story and wait for success confirmation"""
@@ -131,64 +235,92 @@ class EventBasedStoryUploader:
                 ','.join(selectors),  # Wait for any of these
                 timeout=15000
             )
-            print("  ✓ Story saved successfully")
+            print(f"{self.label}  ✓ Story saved successfully")
             return True
         except PlaywrightTimeout:
-            # Check if we navigated away (also indicates success)
-            if '/stories/' in self.page.url:
-                print("  ✓ Story saved (navigated to story page)")
+            # Navigating to the saved story's page also indicates success
+            if story_id_from_url(self.page.url):
+                print(f"{self.label}  ✓ Story saved (navigated to story page)")
                 return True
             raise Exception("Save did not complete - no success indicator found")
 
     async def upload_story(self, story_dir: Path):
         """Upload a complete story using event-based waiting"""
         # Load story data
+        slug = story_dir.name
         with open(story_dir / "story.json") as f:
             story_data = json.load(f)
+        self.ledger.start_story(slug, story_dir / "story.json")
+
+        print(f"\n{self.label}📖 Uploading: {story_data['title']}")
 
-        print(f"\n📖 Uploading: {story_data['title']}")
+        if self.tracer:
+            self.tracer.start_story(slug, story_data["title"])
+        try:
+            await self.upload_story_steps(slug, story_dir, story_data)
+        except Exception as e:
+            if self.tracer:
+                self.tracer.finish_story("failed", str(e))
+            raise
+        if self.tracer:
+            self.tracer.finish_story("success")
+
+        return True
 
+    async def upload_story_steps(self, slug, story_dir: Path, story_data):
+        """Drive the editor through every step of one story"""
         # Navigate to new story page
-        await self.page.goto(f"{self.base_url}/stories/new")
-        await self.page.wait_for_selector('[data-testid="story-editor"]')
+        with self.span("navigate"):
+            await self.page.goto(f"{self.base_url}/stories/new")
+            await self.page.wait_for_selector('[data-testid="story-editor"]')
 
         # Upload cover
         cover_path = story_dir / "cover.webp"
         if cover_path.exists():
             await self.upload_image_and_wait(cover_path, "cover")
             await self.set_as_background_and_wait("cover")
+            self.ledger.record_image(slug, "cover", file_sha256(cover_path))
 
         # Upload pages
         for i, page_data in enumerate(story_data["pages"], 1):
             page_path = story_dir / f"page-{i}.webp"
             if page_path.exists():
                 # Navigate to page
-                await self.page.click(f'[data-testid="page-{i}-tab"]')
+                with self.span("navigate", section=f"page-{i}"):
+                    await self.page.click(f'[data-testid="page-{i}-tab"]')
 
                 # Upload image
                 await self.upload_image_and_wait(page_path, f"page-{i}")
                 await self.set_as_background_and_wait(f"page-{i}")
+                self.ledger.record_image(slug, f"page-{i}", file_sha256(page_path))
 
                 # Fill page content
-                await self.page.fill(
-                    f'[data-testid="page-{i}-content"]',
-                    page_data["content"]
-                )
-                await self.page.fill(
-                    f'[data-testid="page-{i}-coaching"]',
-                    page_data["coaching"]
-                )
+                with self.span("fill_form", section=f"page-{i}"):
+                    await self.page.fill(
+                        f'[data-testid="page-{i}-content"]',
+                        page_data["content"]
+                    )
+                    await self.page.fill(
+                        f'[data-testid="page-{i}-coaching"]',
+                        page_data["coaching"]
+                    )
 
         # Fill story metadata
-        await self.fill_form_and_wait(
-            story_data["title"],
-            story_data["tags"]
-        )
+        with self.span("fill_form", section="story"):
+            await self.fill_form_and_wait(
+                story_data["title"],
+                story_data["tags"]
+            )
 
         # Save story
-        await self.save_story_and_wait()
-
-        return True
+        with self.span("save"):
+            await self.save_story_and_wait()
+            # The editor moves from /stories/new to the saved story's URL
+            try:
+                await self.page.wait_for_url(lambda url: story_id_from_url(url) is not None, timeout=15000)
+            except PlaywrightTimeout:
+                raise Exception(f"Saved story has no id in its URL: {self.page.url}")
+        self.ledger.complete_story(slug, story_id_from_url(self.page.url))
 
     async def upload_all_stories(self, stories_dir: Path):
         """Upload all stories in directory"""
@@ -202,6 +334,14 @@ class EventBasedStoryUploader:
         print(f"Using event-based waiting (no arbitrary timeouts)")
 
         for i, story_dir in enumerate(story_dirs, 1):
+            if self.ledger.is_complete(story_dir.name, story_dir / "story.json"):
+                print(f"\n[{i}/{total}] {story_dir.name}: ✓ Already uploaded, skipping")
+                success_count += 1
+                continue
+            original = duplicate_of(story_dir)
+            if original:
+                print(f"\n[{i}/{total}] {story_dir.name}: ⚠ Duplicate of {original}, skipping")
+                continue
             try:
                 print(f"\n[{i}/{total}] {story_dir.name}")
                 await self.upload_story(story_dir)
@@ -218,6 +358,99 @@ class EventBasedStoryUploader:
         print(f"Failed: {fail_count}/{total}")
         print(f"{'='*60}")
 
+    async def upload_all_stories_pool(self, stories_dir: Path, workers: int = 4):
+        """
+        Upload all stories with a pool of workers.
+
+        One browser, N isolated contexts that all reuse the authenticated
+        storage state from setup(). Workers pull story folders from a shared
+        queue; a failure only affects the story (and, if the page died, the
+        context) it happened in.
+        """
+        story_dirs = sorted([d for d in stories_dir.iterdir() if d.is_dir()])
+        total = len(story_dirs)
+        storage_state = await self.page.context.storage_state()
+
+        queue = asyncio.Queue()
+        for i, story_dir in enumerate(story_dirs, 1):
+            if self.ledger.is_complete(story_dir.name, story_dir / "story.json"):
+                print(f"[{i}/{total}] {story_dir.name}: ✓ Already uploaded, skipping")
+                continue
+            original = duplicate_of(story_dir)
+            if original:
+                print(f"[{i}/{total}] {story_dir.name}: ⚠ Duplicate of {original}, skipping")
+                continue
+            queue.put_nowait((i, story_dir))
+
+        stats = {}
+        started = time.monotonic()
+
+        print(f"\n🚀 Starting upload of {total} stories with {workers} workers")
+
+        async def new_worker_page():
+            context = await self.new_context(storage_state=storage_state)
+            return await context.new_page()
+
+        async def run_worker(worker_id):
+            worker = EventBasedStoryUploader(self.base_url, self.ledger, self.headless,
+                                             trace_dir=self.trace_dir)
+            worker.label = f"[w{worker_id}] "
+            worker.page = await new_worker_page()
+            if worker.tracer:
+                worker.tracer.attach(worker.page)
+            stats[worker_id] = {"success": 0, "failed": 0}
+
+            while True:
+                try:
+                    i, story_dir = queue.get_nowait()
+                except asyncio.QueueEmpty:
+                    break
+                try:
+                    print(f"\n{worker.label}[{i}/{total}] {story_dir.name}")
+                    await worker.upload_story(story_dir)
+                    stats[worker_id]["success"] += 1
+                    print(f"{worker.label}✅ Success ({stats[worker_id]['success']} done by this worker)")
+                except Exception as e:
+                    stats[worker_id]["failed"] += 1
+                    print(f"{worker.label}❌ Failed: {story_dir.name}: {e}")
+                    # Start the next story from a clean context if this one is broken
+                    if worker.page.is_closed():
+                        await close_context(worker.page)
+                        try:
+                            worker.page = await new_worker_page()
+                        except Exception as e:
+                            # Leave the remaining stories to the other workers
+                            print(f"{worker.label}❌ Could not open a new browser context, "
+                                  f"retiring this worker: {e}")
+                            return
+                        if worker.tracer:
+                            worker.tracer.attach(worker.page)
+
+                done = sum(s["success"] + s["failed"] for s in stats.values())
+                rate = done / (time.monotonic() - started) * 60
+                print(f"{worker.label}Progress: {done}/{total} ({rate:.1f} stories/min)")
+
+            await close_context(worker.page)
+
+        results = await asyncio.gather(*(run_worker(n) for n in range(1, workers + 1)), return_exceptions=True)
+        for worker_id, result in enumerate(results, 1):
+            if isinstance(result, Exception):
+                print(f"[w{worker_id}] ❌ Worker stopped: {result}")
+
+        success_count = sum(s["success"] for s in stats.values())
+        fail_count = sum(s["failed"] for s in stats.values())
+        elapsed = time.monotonic() - started
+
+        print(f"\n{'='*60}")
+        print(f"Upload Complete ({elapsed:.0f}s)")
+        for worker_id, s in sorted(stats.items()):
+            print(f"  Worker {worker_id}: {s['success']} succeeded, {s['failed']} failed")
+        print(f"Success: {success_count}/{total}")
+        print(f"Failed: {fail_count}/{total}")
+        if not queue.empty():
+            print(f"Not attempted (no workers left): {queue.qsize()}/{total}")
+        print(f"{'='*60}")
+
     async def cleanup(self):
         """Close browser"""
         if self.browser:
@@ -227,14 +460,34 @@ class EventBasedStoryUploader:
 
 
 async def main():
+    parser = argparse.ArgumentParser(description="Upload processed stories through the story editor")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="Concurrent browser contexts (default: 1, sequential)")
+    parser.add_argument("--headless", action="store_true",
+                        help="Run without a visible browser (requires a cached login)")
+    parser.add_argument("--auth-state", type=Path, default=AUTH_STATE_FILE,
+                        help=f"Cached login file (default: {AUTH_STATE_FILE})")
+    parser.add_argument("--trace", type=Path, metavar="DIR",
+                        help="Write per-story latency traces and a summary histogram to DIR/<run id>")
+    args = parser.parse_args()
+
     stories_dir = Path("stories-tmp/processed")
+    trace_dir = new_run_dir(args.trace) if args.trace else None
 
-    uploader = EventBasedStoryUploader()
+    uploader = EventBasedStoryUploader(headless=args.headless, auth_state=args.auth_state,
+                                       trace_dir=trace_dir)
     try:
         await uploader.setup()
-        await uploader.upload_all_stories(stories_dir)
+        if args.workers > 1:
+            await uploader.upload_all_stories_pool(stories_dir, args.workers)
+        else:
+            await uploader.upload_all_stories(stories_dir)
     finally:
+        if uploader.blocked_requests:
+            print(f"Blocked {uploader.blocked_requests} non-essential requests")
         await uploader.cleanup()
+        if trace_dir:
+            write_trace_report(trace_dir)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,163 @@
+"""
+Upload Ledger - resumable story uploads with per-image checkpoints
+
+Persistent JSON record (stories-tmp/.upload-ledger.json) of what has
+already reached each server:
+
+    {
+      "version": 2,
+      "targets": {
+        "<target url>": {
+          "stories": {
+            "<slug>": {
+              "status": "partial" | "complete",
+              "story_sha256": "...",
+              "remote_id": "...",
+              "images": {"cover": {"sha256": "...", "remote_id": "...", "url": "..."}}
+            }
+          },
+          "blobs": {"<sha256>": {"remote_id": "...", "url": "..."}}
+        }
+      }
+    }
+
+The target is the server an uploader talks to (the app URL for
+upload-stories-playwright.py, the API URL for upload-stories-api.py).
+Remote ids and URLs only mean something on the server that issued them,
+so each target has its own stories and blobs. A version 1 ledger had no
+target; it is kept under LEGACY_TARGET and never reused.
+
+A complete story whose story.json no longer matches story_sha256 was
+edited after its upload and counts as pending again.
+
+"blobs" maps image content hashes to their remote copy, so identical bytes
+are never sent twice to a target - even from a different story or after a
+rename.
+Every checkpoint is written atomically, so a crash loses at most the
+request that was in flight.
+"""
+
+import os
+import json
+import threading
+from pathlib import Path
+
+from story_config import file_sha256
+
+LEDGER_FILE = Path("stories-tmp/.upload-ledger.json")
+LEDGER_VERSION = 2
+LEGACY_TARGET = "(version 1, target unknown)"
+
+def duplicate_of(story_dir):
+    """Slug of the story this one duplicates (story_dedup.py flag), or None"""
+    manifest_path = Path(story_dir) / "manifest.json"
+    if not manifest_path.exists():
+        return None
+    with open(manifest_path) as f:
+        flag = json.load(f).get("duplicate_of")
+    return flag["slug"] if flag else None
+
+def target_key(url):
+    """Ledger key for a server URL"""
+    return url.rstrip('/').lower()
+
+def load_ledger(path=LEDGER_FILE):
+    """Ledger file contents in the current layout (version 1 files are upgraded)"""
+    path = Path(path)
+    if not path.exists():
+        return {"version": LEDGER_VERSION, "targets": {}}
+    with open(path, 'r') as f:
+        data = json.load(f)
+    if data.get("version", 1) == 1:
+        legacy = {"stories": data.get("stories", {}), "blobs": data.get("blobs", {})}
+        data = {"version": LEDGER_VERSION, "targets": {LEGACY_TARGET: legacy}}
+    return data
+
+class UploadLedger:
+    def __init__(self, target, path=LEDGER_FILE, catalog=None):
+        self.path = Path(path)
+        self.target = target_key(target)
+        self.catalog = catalog      # story_catalog.Catalog mirrored on story status changes
+        self.lock = threading.Lock()
+        self.data = load_ledger(self.path)
+        # This target's {"stories", "blobs"}; other targets are kept as they are
+        self.section = self.data["targets"].setdefault(self.target, {"stories": {}, "blobs": {}})
+
+    def save(self):
+        """Write the ledger atomically (temp file + rename)"""
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.path.with_suffix(".tmp")
+        with open(tmp_path, 'w') as f:
+            json.dump(self.data, f, indent=2)
+        os.replace(tmp_path, self.path)
+
+    def story(self, slug):
+        """Ledger entry for a story (created on first use)"""
+        with self.lock:
+            return self.section["stories"].setdefault(slug, {"status": "partial", "images": {}})
+
+    def is_complete(self, slug, story_json_path=None):
+        """
+        True if the story was uploaded - and, given its story.json, uploaded
+        from these exact bytes. An edited story is pending again.
+        """
+        entry = self.section["stories"].get(slug)
+        if not entry or entry["status"] != "complete":
+            return False
+        if story_json_path and entry.get("story_sha256"):
+            return entry["story_sha256"] == file_sha256(story_json_path)
+        return True
+
+    def start_story(self, slug, story_json_path):
+        """Begin or resume a story, recording the story.json hash it was uploaded from"""
+        entry = self.story(slug)
+        with self.lock:
+            entry["story_sha256"] = file_sha256(story_json_path)
+            self.save()
+        if self.catalog:
+            self.catalog.record_upload(slug, entry["status"], story_sha256=entry["story_sha256"])
+        return entry
+
+    def uploaded_image(self, slug, section, path):
+        """
+        Remote copy of an image if these exact bytes were already uploaded:
+        first for this story/section, then anywhere (by content hash).
+        Returns (sha256, record or None).
+        """
+        sha256 = file_sha256(path)
+        with self.lock:
+            image = self.section["stories"].get(slug, {}).get("images", {}).get(section)
+            if image and image["sha256"] == sha256 and (image["remote_id"] or image["url"]):
+                return sha256, image
+            blob = self.section["blobs"].get(sha256)
+            if blob:
+                return sha256, {"sha256": sha256, **blob}
+        return sha256, None
+
+    def record_image(self, slug, section, sha256, remote_id=None, url=None):
+        """Checkpoint one uploaded image"""
+        record = {"sha256": sha256, "remote_id": remote_id, "url": url}
+        with self.lock:
+            entry = self.section["stories"].setdefault(slug, {"status": "partial", "images": {}})
+            entry["images"][section] = record
+            if remote_id or url:
+                self.section["blobs"][sha256] = {"remote_id": remote_id, "url": url}
+            self.save()
+
+    def complete_story(self, slug, remote_id=None):
+        with self.lock:
+            entry = self.section["stories"].setdefault(slug, {"images": {}})
+            entry["status"] = "complete"
+            entry["remote_id"] = remote_id
+            self.save()
+        if self.catalog:
+            self.catalog.record_upload(slug, "complete", remote_id)
+
+    def summary(self):
+        stories = self.section["stories"].values()
+        return {
+            "complete": sum(1 for s in stories if s["status"] == "complete"),
+            "partial": sum(1 for s in stories if s["status"] == "partial"),
+            "images": sum(len(s["images"]) for s in stories),
+            "blobs": len(self.section["blobs"]),
+        }
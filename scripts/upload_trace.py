@@ -0,0 +1,171 @@
+"""
+Upload Trace - per-step latency spans for the story editor upload path
+
+A StoryTracer records one span per upload step (navigate, file_set,
+upload_confirm, set_background, fill_form, save) and attaches every
+network request Playwright reports as finished (or failed) to the span
+that was open when the request started.
+
+Each upload run gets its own directory, <trace_dir>/<run id>/ (see
+new_run_dir()), holding one <slug>.json per story. write_trace_report()
+aggregates the story traces of one run into per-step latency histograms
+(summary.json + console table), so earlier runs never mix into a report.
+
+Spans are timed in epoch milliseconds, the same clock as Playwright's
+request.timing["startTime"], so spans and requests line up.
+"""
+
+import json
+import time
+from pathlib import Path
+from datetime import datetime
+from contextlib import contextmanager
+
+# Histogram bucket upper bounds in milliseconds (last bucket is open-ended)
+BUCKETS_MS = [50, 100, 250, 500, 1000, 2500, 5000, 10000, 30000]
+
+def now_ms():
+    return time.time() * 1000
+
+def percentile(values, pct):
+    """Nearest-rank percentile of a non-empty list"""
+    ordered = sorted(values)
+    rank = max(0, min(len(ordered) - 1, round(pct / 100 * len(ordered)) - 1))
+    return ordered[rank]
+
+def new_run_dir(trace_dir):
+    """Create and return a fresh <trace_dir>/<run id> directory for one upload run"""
+    run_id = datetime.now().strftime("%Y%m%d-%H%M%S")
+    run_dir = Path(trace_dir) / run_id
+    suffix = 1
+    while run_dir.exists():
+        suffix += 1
+        run_dir = Path(trace_dir) / f"{run_id}-{suffix}"
+    run_dir.mkdir(parents=True)
+    return run_dir
+
+class StoryTracer:
+    def __init__(self, trace_dir):
+        self.trace_dir = Path(trace_dir)
+        self.trace_dir.mkdir(parents=True, exist_ok=True)
+        self.story = None
+
+    def attach(self, page):
+        """Listen for finished/failed requests on a page"""
+        page.on("requestfinished", self.on_request)
+        page.on("requestfailed", self.on_request)
+
+    def start_story(self, slug, title):
+        self.story = {
+            "slug": slug,
+            "title": title,
+            "started_ms": now_ms(),
+            "spans": [],
+            "requests": [],
+        }
+
+    @contextmanager
+    def span(self, name, **attrs):
+        """Time one step of the upload"""
+        if self.story is None:
+            yield
+            return
+        record = {"name": name, **attrs, "start_ms": now_ms()}
+        try:
+            yield
+        finally:
+            record["duration_ms"] = round(now_ms() - record["start_ms"], 1)
+            self.story["spans"].append(record)
+
+    def on_request(self, request):
+        if self.story is None:
+            return
+        timing = request.timing
+        start_ms = timing.get("startTime", -1)
+        duration_ms = timing.get("responseEnd", -1)
+        entry = {
+            "url": request.url,
+            "method": request.method,
+            "resource_type": request.resource_type,
+            "failed": request.failure is not None,
+            "start_ms": round(start_ms, 1),
+            "duration_ms": round(duration_ms, 1),
+            "ttfb_ms": round(timing.get("responseStart", -1), 1),
+        }
+        self.story["requests"].append(entry)
+
+    def correlate(self):
+        """Attach each request to the span whose time window contains its start"""
+        for span in self.story["spans"]:
+            span["requests"] = 0
+            span["request_ms"] = 0.0
+        for request in self.story["requests"]:
+            request["span"] = None
+            for span in self.story["spans"]:
+                if span["start_ms"] <= request["start_ms"] <= span["start_ms"] + span["duration_ms"]:
+                    request["span"] = span["name"]
+                    span["requests"] += 1
+                    span["request_ms"] = round(span["request_ms"] + max(request["duration_ms"], 0), 1)
+                    break
+
+    def finish_story(self, status, error=None):
+        """Write <slug>.json and reset"""
+        if self.story is None:
+            return
+        self.correlate()
+        self.story["status"] = status
+        self.story["error"] = error
+        self.story["total_ms"] = round(now_ms() - self.story["started_ms"], 1)
+        with open(self.trace_dir / f"{self.story['slug']}.json", 'w') as f:
+            json.dump(self.story, f, indent=2)
+        self.story = None
+
+def write_trace_report(trace_dir):
+    """Aggregate one run's story traces (a new_run_dir() directory) into per-step latency stats and histograms"""
+    trace_dir = Path(trace_dir)
+    steps = {}
+    network = {}
+    totals = []
+
+    for path in sorted(trace_dir.glob("*.json")):
+        if path.name == "summary.json":
+            continue
+        with open(path) as f:
+            story = json.load(f)
+        if story.get("status") == "success":
+            totals.append(story["total_ms"])
+        for span in story["spans"]:
+            steps.setdefault(span["name"], []).append(span["duration_ms"])
+            network.setdefault(span["name"], []).append(span.get("request_ms", 0))
+    steps["story_total"] = totals
+
+    summary = {}
+    for name, durations in steps.items():
+        if not durations:
+            continue
+        histogram = [0] * (len(BUCKETS_MS) + 1)
+        for d in durations:
+            histogram[next((i for i, b in enumerate(BUCKETS_MS) if d <= b), len(BUCKETS_MS))] += 1
+        summary[name] = {
+            "count": len(durations),
+            "p50_ms": percentile(durations, 50),
+            "p90_ms": percentile(durations, 90),
+            "p99_ms": percentile(durations, 99),
+            "max_ms": max(durations),
+            "network_p50_ms": percentile(network[name], 50) if name in network else None,
+            "histogram": dict(zip([f"<={b}ms" for b in BUCKETS_MS] + [f">{BUCKETS_MS[-1]}ms"], histogram)),
+        }
+
+    with open(trace_dir / "summary.json", 'w') as f:
+        json.dump(summary, f, indent=2)
+
+    print(f"\n{'='*60}")
+    print("Upload Latency (ms)")
+    print(f"{'step':<16}{'count':>7}{'p50':>9}{'p90':>9}{'p99':>9}{'max':>9}{'net p50':>9}")
+    for name, s in summary.items():
+        net = f"{s['network_p50_ms']:>9.0f}" if s['network_p50_ms'] is not None else f"{'-':>9}"
+        print(f"{name:<16}{s['count']:>7}{s['p50_ms']:>9.0f}{s['p90_ms']:>9.0f}"
+              f"{s['p99_ms']:>9.0f}{s['max_ms']:>9.0f}{net}")
+    print(f"\nTraces: {trace_dir}/  Summary: {trace_dir / 'summary.json'}")
+    print(f"{'='*60}")
+    return summary
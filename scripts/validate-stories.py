@@ -11,7 +11,8 @@ This script validates the story folders to ensure they have:
 import os
 import sys
 from pathlib import Path
-from subprocess import run, PIPE
+
+from story_images import image_size
 
 # ANSI colors
 RED = '\033[0;31m'
@@ -29,13 +30,12 @@ def slugify(name):
     return slug
 
 def get_image_dimensions(image_path):
-    """Get image dimensions using ImageMagick identify"""
+    """Get image dimensions from the PNG header (no decode)"""
     try:
-        result = run(['identify', '-format', '%wx%h', str(image_path)],
-                    capture_output=True, text=True, check=True)
-        return result.stdout.strip()
-    except:
-        return "unknown"
+        size = image_size(image_path)
+    except OSError:
+        size = None
+    return f"{size[0]}x{size[1]}" if size else "unknown"
 
 def validate_story(story_dir):
     """Validate a single story directory"""